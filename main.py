@@ -1,14 +1,40 @@
+"""
+Excel条件拆分器 - 桌面程序
+
+The window is built from split_options alone; pandas and the modules
+built on it (split_engine, split_cache, ...) are imported in a
+background thread once the window has been painted (Warmup), and by
+the methods that use them.
+
+    python main.py --startup-timing [trace.json]
+
+prints how long each startup phase took (and saves a Chrome trace);
+`python -X importtime main.py` lists the imports themselves.
+"""
+import time
+_START = time.perf_counter()
+
 import sys
 import os
-import pandas as pd
 import re
+import argparse
+import functools
+import importlib
+import multiprocessing
+import split_options
+import split_trace
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QLineEdit, QPushButton, QFileDialog, QComboBox, 
                              QTableWidget, QTableWidgetItem, QMessageBox, QGroupBox, 
                              QRadioButton, QButtonGroup, QStackedWidget, QFormLayout,
-                             QHeaderView, QAbstractItemView, QFrame, QCheckBox)
-from PyQt5.QtCore import Qt, QMimeData
+                             QHeaderView, QAbstractItemView, QFrame, QCheckBox,
+                             QProgressBar, QSpinBox, QListWidget, QListWidgetItem)
+from PyQt5.QtCore import Qt, QMimeData, QThread, QTimer, QFileSystemWatcher, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon, QColor, QPalette
+_IMPORTED = time.perf_counter()
+
+# Imported by Warmup once the window is up
+DATA_MODULES = ('split_engine', 'split_cache', 'split_incremental', 'split_service')
 
 # Modern Dark/Light Theme Stylesheet
 STYLESHEET = """
@@ -165,8 +191,10 @@ class DropArea(QWidget):
     def dropEvent(self, event):
         self.label.setStyleSheet("color: #333333; font-size: 15px; font-weight: bold; border: 2px dashed #909399; border-radius: 6px; padding: 20px;")
         files = [u.toLocalFile() for u in event.mimeData().urls()]
-        if files:
-            # Take the first file
+        if len(files) > 1 or (files and os.path.isdir(files[0])):
+            # Several files or a folder: run them as a batch
+            self.main_window.start_batch(files)
+        elif files:
             fpath = files[0]
             if fpath.endswith(('.xlsx', '.xls')):
                 self.main_window.process_file(fpath)
@@ -177,8 +205,287 @@ class DropArea(QWidget):
         if event.button() == Qt.LeftButton:
             self.main_window.open_file_dialog()
 
+PHASE_LABELS = {
+    'read': "正在读取数据",
+    'filter': "正在筛选条件",
+    'write': "正在写入结果",
+    'batch': "正在批量处理",
+}
+
+class SplitWorker(QThread):
+    """Runs the read/filter/write pipeline off the GUI thread."""
+    progress = pyqtSignal(str, int, int)  # phase, done, total
+    succeeded = pyqtSignal(list)          # written file paths
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, file_path, sheet, conditions, mode, output, cache=None,
+                 streaming=False, backend=None, workers=1, routing=split_options.ROUTING_ALL,
+                 fmt=split_options.FORMAT_XLSX, compression=None, incremental=False, quiet=False,
+                 dtypes=split_options.DTYPES_COMPACT, sheets=None, combine=split_options.SHEETS_COMBINE,
+                 parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.sheet = sheet
+        self.conditions = [dict(c) for c in conditions]
+        self.mode = mode
+        self.output = output
+        self.cache = cache
+        self.streaming = streaming
+        self.backend = backend
+        self.workers = workers
+        self.routing = routing
+        self.fmt = fmt
+        self.compression = compression
+        self.incremental = incremental
+        self.dtypes = dtypes
+        self.sheets = sheets  # Several sheets with the same conditions (split_sheets)
+        self.combine = combine
+        self.quiet = quiet  # Started by the file watcher: report in the status bar only
+        self.status = None  # split_incremental status of an incremental run
+        self.tracer = split_trace.Tracer()
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def is_cancel_requested(self):
+        return self._cancel_requested
+
+    def run(self):
+        import split_engine
+        import split_incremental
+        try:
+            if self.sheets:
+                written = split_engine.split_sheets(self.file_path, self.sheets, self.conditions,
+                                                    self.mode, self.output, self.combine,
+                                                    workers=self.workers,
+                                                    progress=self.progress.emit,
+                                                    cancelled=self.is_cancel_requested,
+                                                    cache=self.cache,
+                                                    backend=self.backend,
+                                                    routing=self.routing,
+                                                    tracer=self.tracer,
+                                                    fmt=self.fmt,
+                                                    compression=self.compression,
+                                                    dtypes=self.dtypes)
+            elif self.incremental:
+                self.status, written = split_incremental.incremental_split(
+                    self.file_path, self.sheet, self.conditions, self.mode, self.output,
+                    progress=self.progress.emit,
+                    cancelled=self.is_cancel_requested,
+                    cache=self.cache,
+                    backend=self.backend,
+                    workers=self.workers,
+                    routing=self.routing,
+                    tracer=self.tracer,
+                    fmt=self.fmt,
+                    compression=self.compression,
+                    dtypes=self.dtypes)
+            elif self.streaming:
+                written = split_engine.stream_split(self.file_path, self.sheet, self.conditions,
+                                                    self.mode, self.output,
+                                                    progress=self.progress.emit,
+                                                    cancelled=self.is_cancel_requested,
+                                                    backend=self.backend,
+                                                    routing=self.routing,
+                                                    tracer=self.tracer,
+                                                    fmt=self.fmt,
+                                                    compression=self.compression)
+            else:
+                written = split_engine.run_split(self.file_path, self.sheet, self.conditions,
+                                                 self.mode, self.output,
+                                                 progress=self.progress.emit,
+                                                 cancelled=self.is_cancel_requested,
+                                                 cache=self.cache,
+                                                 backend=self.backend,
+                                                 workers=self.workers,
+                                                 routing=self.routing,
+                                                 tracer=self.tracer,
+                                                 fmt=self.fmt,
+                                                 compression=self.compression,
+                                                 dtypes=self.dtypes)
+            self.succeeded.emit(written)
+        except split_engine.SplitCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            print("\n".join(self.tracer.summary(limit=20)), file=sys.stderr)
+            self.failed.emit(str(e))
+
+    def summary(self):
+        return self.tracer.summary()
+
+    def save_trace(self, path):
+        self.tracer.save(path, split_trace.FORMAT_CHROME)
+
+    def trace_path(self):
+        # Next to the results: <output>.trace.json, or inside the output folder
+        if self.mode == 0:
+            return os.path.splitext(self.output)[0] + ".trace.json"
+        return os.path.join(self.output, "split.trace.json")
+
+
+class ServiceSplitWorker(SplitWorker):
+    """Submits the split to a running split_service and follows the job
+    there; same signals and settings as SplitWorker."""
+    POLL_MS = 300
+
+    def __init__(self, url, *args, trace=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url
+        self.trace = trace
+        self.job_summary = []
+
+    def spec(self):
+        # The service resolves paths against its own working directory
+        spec = {
+            'source': os.path.abspath(self.file_path),
+            'sheet': self.sheet,
+            'conditions': self.conditions,
+            'format': self.fmt,
+            'compression': self.compression,
+            'writer': self.backend,
+            'exclusive': self.routing == split_options.ROUTING_FIRST,
+            'dtypes': self.dtypes,
+            'jobs': self.workers,
+            'stream': self.streaming,
+            'incremental': self.incremental,
+        }
+        if self.mode == 0:
+            spec['output'] = os.path.abspath(self.output)
+        else:
+            spec['output_dir'] = os.path.abspath(self.output)
+        if self.sheets:
+            spec['sheets'] = self.sheets
+            spec['per_sheet'] = self.combine == split_options.SHEETS_SEPARATE
+        if self.trace:
+            spec['trace'] = os.path.abspath(self.trace_path())
+        return spec
+
+    def run(self):
+        import split_service
+        client = split_service.ServiceClient(self.url)
+        try:
+            job_id = client.submit(self.spec())
+            cancel_sent = False
+            while True:
+                if self._cancel_requested and not cancel_sent:
+                    client.cancel(job_id)
+                    cancel_sent = True
+                job = client.job(job_id)
+                if job['progress']:
+                    p = job['progress']
+                    self.progress.emit(p['phase'], p['done'], p['total'])
+                if job['state'] in split_service.FINISHED_STATES:
+                    break
+                self.msleep(self.POLL_MS)
+        except RuntimeError as e:
+            self.failed.emit(str(e))
+            return
+        self.job_summary = job['summary']
+        self.status = job['status']
+        if job['state'] == split_service.STATE_SUCCEEDED:
+            self.succeeded.emit(job['written'])
+        elif job['state'] == split_service.STATE_CANCELLED:
+            self.cancelled.emit()
+        else:
+            self.failed.emit(job['error'] or "")
+
+    def summary(self):
+        return [f"由拆分服务 {self.url} 执行"] + self.job_summary
+
+    def save_trace(self, path):
+        # Saved by the service (spec['trace'])
+        pass
+
+class BatchWorker(QThread):
+    """Runs split_engine.run_batch off the GUI thread."""
+    progress = pyqtSignal(str, int, int)
+    file_done = pyqtSignal(str, int, str)  # path, files written, error
+    succeeded = pyqtSignal(dict)           # path -> (written, error)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, sources, sheet, conditions, mode, output, backend=None, workers=1,
+                 routing=split_options.ROUTING_ALL, fmt=split_options.FORMAT_XLSX, compression=None,
+                 dtypes=split_options.DTYPES_COMPACT, parent=None):
+        super().__init__(parent)
+        self.sources = list(sources)
+        self.sheet = sheet
+        self.conditions = [dict(c) for c in conditions]
+        self.mode = mode
+        self.output = output
+        self.backend = backend
+        self.workers = workers
+        self.routing = routing
+        self.fmt = fmt
+        self.compression = compression
+        self.dtypes = dtypes
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def is_cancel_requested(self):
+        return self._cancel_requested
+
+    def on_file(self, path, written, error):
+        self.file_done.emit(path, len(written), error or "")
+
+    def run(self):
+        import split_engine
+        try:
+            outcome = split_engine.run_batch(self.sources, self.sheet, self.conditions,
+                                             self.mode, self.output, workers=self.workers,
+                                             progress=self.progress.emit,
+                                             cancelled=self.is_cancel_requested,
+                                             on_file=self.on_file,
+                                             backend=self.backend, routing=self.routing,
+                                             fmt=self.fmt, compression=self.compression,
+                                             dtypes=self.dtypes)
+            self.succeeded.emit(outcome)
+        except split_engine.SplitCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.failed.emit(str(e))
+
+class PreviewLoader(QThread):
+    """Loads a sheet (through the workbook cache) for the match-count preview."""
+    loaded = pyqtSignal(str, str, object)  # path, sheet, MatchPreview
+
+    def __init__(self, file_path, sheet, cache, dtypes=split_options.DTYPES_COMPACT, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.sheet = sheet
+        self.cache = cache
+        self.dtypes = dtypes
+
+    def run(self):
+        import split_engine
+        try:
+            df = split_engine.load_source(self.file_path, self.sheet, self.cache, dtypes=self.dtypes)
+            self.loaded.emit(self.file_path, self.sheet, split_engine.MatchPreview(df))
+        except Exception as e:
+            print(f"Error loading preview: {e}")
+
+class Warmup(QThread):
+    """Imports DATA_MODULES (pandas and the engine) off the GUI thread."""
+
+    def __init__(self, tracer=None, parent=None):
+        super().__init__(parent)
+        self.tracer = tracer
+
+    def run(self):
+        for name in DATA_MODULES:
+            with split_trace.span(self.tracer, f"import {name}", 'startup'):
+                importlib.import_module(name)
+
 class ExcelSplitterApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, startup=None, startup_trace=None):
         super().__init__()
         self.setWindowTitle("Excel条件拆分器")
         self.resize(900, 1050)
@@ -187,11 +494,44 @@ class ExcelSplitterApp(QMainWindow):
         self.df = None
         self.file_path = ""
         self.conditions = [] 
+        self.worker = None
+        self.preview = None
+        self.preview_loaders = []
+        self.last_output = None  # (mode, output) of the last split, for watching
+        self.sidecar = None
+        self.cache = None  # see workbook_cache()
+        self.warmup = None
+        self.painted = False
+        self.startup = startup  # split_trace.Tracer of the start (--startup-timing)
+        self.startup_trace = startup_trace
 
         # Apply Styles
         self.setStyleSheet(STYLESHEET)
         self.init_ui()
 
+        # Count the condition being typed once the input settles
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(300)
+        self.preview_timer.timeout.connect(self.update_draft_count)
+        for edit in (self.num_val1, self.num_val2, self.text_input, self.regex_input, self.bands_input):
+            edit.textChanged.connect(self.preview_timer.start)
+        self.num_op.currentTextChanged.connect(self.preview_timer.start)
+        self.col_combo.currentTextChanged.connect(self.preview_timer.start)
+        self.type_group.buttonToggled.connect(self.preview_timer.start)
+        self.chk_negate.toggled.connect(self.preview_timer.start)
+        self.chk_ignore_case.toggled.connect(self.preview_timer.start)
+        self.chk_exclusive.toggled.connect(self.update_match_counts)
+
+        # Re-split incrementally once the source has been quiet for a while
+        # (Excel saves in several steps)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_source_changed)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(2000)
+        self.watch_timer.timeout.connect(self.run_watched_split)
+
     def init_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -209,6 +549,22 @@ class ExcelSplitterApp(QMainWindow):
         self.path_display = QLabel("未选择文件")
         self.path_display.setStyleSheet("color: #000000; padding-left: 5px; font-weight: 500;")
         file_layout.addWidget(self.path_display)
+
+        # Disk Cache
+        cache_layout = QHBoxLayout()
+        self.chk_disk_cache = QCheckBox("启用磁盘缓存 (加速重复拆分同一文件)")
+        self.chk_disk_cache.toggled.connect(self.on_disk_cache_toggled)
+        self.clear_cache_btn = QPushButton("清空缓存")
+        self.clear_cache_btn.setObjectName("clear_btn")
+        self.clear_cache_btn.clicked.connect(self.clear_disk_cache)
+        if not split_options.arrow_available():
+            self.chk_disk_cache.setEnabled(False)
+            self.chk_disk_cache.setToolTip("需要安装 pyarrow")
+            self.clear_cache_btn.setEnabled(False)
+        cache_layout.addWidget(self.chk_disk_cache)
+        cache_layout.addStretch()
+        cache_layout.addWidget(self.clear_cache_btn)
+        file_layout.addLayout(cache_layout)
         
         file_group.setLayout(file_layout)
         main_layout.addWidget(file_group)
@@ -243,16 +599,22 @@ class ExcelSplitterApp(QMainWindow):
         self.rb_numeric = QRadioButton("数值范围")
         self.rb_text = QRadioButton("文本包含")
         self.rb_regex = QRadioButton("正则表达式")
+        self.rb_distinct = QRadioButton("按值拆分")
+        self.rb_bands = QRadioButton("数值分段")
         self.rb_numeric.setChecked(True)
         self.type_group.addButton(self.rb_numeric, 0)
         self.type_group.addButton(self.rb_text, 1)
         self.type_group.addButton(self.rb_regex, 2)
+        self.type_group.addButton(self.rb_distinct, 3)
+        self.type_group.addButton(self.rb_bands, 4)
         self.type_group.buttonToggled.connect(self.on_type_changed)
         
         type_layout.addWidget(QLabel("条件类型:"))
         type_layout.addWidget(self.rb_numeric)
         type_layout.addWidget(self.rb_text)
         type_layout.addWidget(self.rb_regex)
+        type_layout.addWidget(self.rb_distinct)
+        type_layout.addWidget(self.rb_bands)
         
         # Negate Checkbox
         self.chk_negate = QCheckBox("取反 (Not)")
@@ -295,6 +657,8 @@ class ExcelSplitterApp(QMainWindow):
         self.text_input.setPlaceholderText("包含的文本")
         text_layout.addWidget(QLabel("文本内容:"))
         text_layout.addWidget(self.text_input)
+        self.chk_ignore_case = QCheckBox("忽略大小写")
+        text_layout.addWidget(self.chk_ignore_case)
         page_text.setLayout(text_layout)
         self.stack.addWidget(page_text)
 
@@ -309,6 +673,25 @@ class ExcelSplitterApp(QMainWindow):
         page_regex.setLayout(regex_layout)
         self.stack.addWidget(page_regex)
 
+        # Page 3: Distinct Values
+        page_distinct = QWidget()
+        distinct_layout = QHBoxLayout()
+        distinct_layout.setContentsMargins(0,0,0,0)
+        distinct_layout.addWidget(QLabel("按目标列的每个不同值各输出一份 (输出名称作为前缀，可留空)"))
+        page_distinct.setLayout(distinct_layout)
+        self.stack.addWidget(page_distinct)
+
+        # Page 4: Numeric Bands
+        page_bands = QWidget()
+        bands_layout = QHBoxLayout()
+        bands_layout.setContentsMargins(0,0,0,0)
+        self.bands_input = QLineEdit()
+        self.bands_input.setPlaceholderText("分段点，逗号分隔 (如: 60,70,80,90 → 60以下, 60-70, ..., 90及以上)")
+        bands_layout.addWidget(QLabel("分段点:"))
+        bands_layout.addWidget(self.bands_input)
+        page_bands.setLayout(bands_layout)
+        self.stack.addWidget(page_bands)
+
         cond_layout.addWidget(self.stack)
 
         # Output Name and Add Button
@@ -319,8 +702,12 @@ class ExcelSplitterApp(QMainWindow):
         self.add_btn.setIcon(QIcon.fromTheme("list-add")) # Try system icon
         self.add_btn.clicked.connect(self.add_condition)
         
+        self.draft_count = QLabel("")
+        self.draft_count.setStyleSheet("color: #909399;")
+        
         add_layout.addWidget(QLabel("输出名称:"))
         add_layout.addWidget(self.output_name)
+        add_layout.addWidget(self.draft_count)
         add_layout.addWidget(self.add_btn)
         cond_layout.addLayout(add_layout)
 
@@ -331,8 +718,8 @@ class ExcelSplitterApp(QMainWindow):
         list_group = QGroupBox("4. 已添加条件列表")
         list_layout = QVBoxLayout()
         self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["列名", "类型", "详细条件", "输出名称"])
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["列名", "类型", "详细条件", "输出名称", "匹配行数"])
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setAlternatingRowColors(True)
@@ -345,11 +732,28 @@ class ExcelSplitterApp(QMainWindow):
         self.clear_btn = QPushButton("清空所有条件")
         self.clear_btn.setObjectName("clear_btn")
         self.clear_btn.clicked.connect(self.clear_conditions)
+        self.save_cond_btn = QPushButton("保存条件")
+        self.save_cond_btn.clicked.connect(self.save_conditions)
+        self.load_cond_btn = QPushButton("加载条件")
+        self.load_cond_btn.clicked.connect(self.load_conditions)
         btn_layout.addWidget(self.del_btn)
         btn_layout.addWidget(self.clear_btn)
+        btn_layout.addWidget(self.save_cond_btn)
+        btn_layout.addWidget(self.load_cond_btn)
         btn_layout.addStretch()
+        self.combine_op = QComboBox()
+        self.combine_op.addItems(["AND (同时满足)", "OR (满足任一)"])
+        self.combine_btn = QPushButton("组合所选条件")
+        self.combine_btn.setToolTip("将选中的多个条件合并为一个组合条件，输出名称取自“输出名称”输入框，可勾选“取反”")
+        self.combine_btn.clicked.connect(self.combine_conditions)
+        btn_layout.addWidget(self.combine_op)
+        btn_layout.addWidget(self.combine_btn)
+
+        self.match_summary = QLabel("")
+        self.match_summary.setStyleSheet("color: #606266;")
 
         list_layout.addWidget(self.table)
+        list_layout.addWidget(self.match_summary)
         list_layout.addLayout(btn_layout)
         list_group.setLayout(list_layout)
         main_layout.addWidget(list_group)
@@ -372,8 +776,98 @@ class ExcelSplitterApp(QMainWindow):
         mode_layout.addWidget(self.rb_single_file)
         mode_layout.addWidget(self.rb_multi_files)
         mode_layout.addStretch()
+        mode_layout.addWidget(QLabel("写入引擎:"))
+        self.writer_combo = QComboBox()
+        self.writer_combo.addItems(split_options.available_backends())
+        mode_layout.addWidget(self.writer_combo)
         action_wrapper_layout.addLayout(mode_layout)
 
+        # Output Format
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("输出格式:"))
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(split_options.available_formats())
+        self.format_combo.setToolTip("csv/parquet/feather 写入远快于xlsx，适合交给其他程序处理，仅支持“拆分为多个独立文件”")
+        self.format_combo.currentTextChanged.connect(self.on_format_changed)
+        format_layout.addWidget(self.format_combo)
+        format_layout.addWidget(QLabel("Parquet压缩:"))
+        self.compression_combo = QComboBox()
+        self.compression_combo.addItems(split_options.PARQUET_COMPRESSIONS)
+        self.compression_combo.setEnabled(False)
+        format_layout.addWidget(self.compression_combo)
+        format_layout.addWidget(QLabel("内存优化:"))
+        self.dtypes_combo = QComboBox()
+        for mode in split_options.available_modes():
+            self.dtypes_combo.addItem(split_options.DTYPES_LABELS[mode], mode)
+        self.dtypes_combo.setToolTip("读取后压缩列类型：重复值多的文本列转为分类编码、数值按需降位，大表内存占用更低、筛选更快；结果数据不变")
+        format_layout.addWidget(self.dtypes_combo)
+        format_layout.addStretch()
+        action_wrapper_layout.addLayout(format_layout)
+
+        # Parallel Writing (Multi Files only)
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("并行进程数:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(min(4, os.cpu_count() or 1))
+        # Batch runs always use the pool, so the count stays editable in every mode
+        self.workers_spin.setToolTip("用于“拆分为多个独立Excel文件”、多工作表拆分及批量处理；单个工作表合并输出时不使用")
+        workers_layout.addWidget(self.workers_spin)
+        workers_layout.addStretch()
+        action_wrapper_layout.addLayout(workers_layout)
+
+        # Exclusive Routing
+        self.chk_exclusive = QCheckBox("互斥拆分 (每行只进入第一个匹配的条件，未匹配的行输出到“未匹配”)")
+        action_wrapper_layout.addWidget(self.chk_exclusive)
+
+        # Streaming
+        self.chk_streaming = QCheckBox("流式处理 (超大文件，分块读取，内存占用恒定，仅支持.xlsx)")
+        action_wrapper_layout.addWidget(self.chk_streaming)
+
+        # Incremental
+        incremental_layout = QHBoxLayout()
+        self.chk_incremental = QCheckBox("增量拆分 (仅处理新增行并追加到已有结果)")
+        self.chk_incremental.setToolTip("适用于只在末尾追加行的源文件；已处理的行被修改或条件变化时自动完整拆分")
+        incremental_layout.addWidget(self.chk_incremental)
+        self.chk_watch = QCheckBox("监视源文件 (保存后自动增量拆分到上次的输出位置)")
+        self.chk_watch.toggled.connect(self.on_watch_toggled)
+        incremental_layout.addWidget(self.chk_watch)
+        incremental_layout.addStretch()
+        action_wrapper_layout.addLayout(incremental_layout)
+
+        # Multiple Sheets
+        sheets_layout = QHBoxLayout()
+        self.chk_multi_sheets = QCheckBox("同时拆分多个工作表 (结构相同，条件按上方所选工作表设置)")
+        self.chk_multi_sheets.setToolTip("一次打开文件，按“并行进程数”并行解析勾选的工作表")
+        self.chk_multi_sheets.toggled.connect(self.on_multi_sheets_toggled)
+        sheets_layout.addWidget(self.chk_multi_sheets)
+        self.sheets_combine_combo = QComboBox()
+        self.sheets_combine_combo.addItem("合并各工作表的同名输出", split_options.SHEETS_COMBINE)
+        self.sheets_combine_combo.addItem("按工作表分开输出", split_options.SHEETS_SEPARATE)
+        self.sheets_combine_combo.setEnabled(False)
+        sheets_layout.addWidget(self.sheets_combine_combo)
+        sheets_layout.addStretch()
+        action_wrapper_layout.addLayout(sheets_layout)
+        self.sheet_list = QListWidget()
+        self.sheet_list.setMaximumHeight(90)
+        self.sheet_list.setVisible(False)
+        action_wrapper_layout.addWidget(self.sheet_list)
+
+        # Performance Trace
+        self.chk_trace = QCheckBox("保存性能跟踪文件 (各阶段耗时/行数/内存，可在 chrome://tracing 中查看)")
+        action_wrapper_layout.addWidget(self.chk_trace)
+
+        # Split Service
+        service_layout = QHBoxLayout()
+        self.chk_service = QCheckBox("提交到本地拆分服务执行:")
+        self.chk_service.setToolTip("先运行 python split_service.py；服务保留最近解析过的工作簿，重复拆分同一文件更快")
+        service_layout.addWidget(self.chk_service)
+        self.service_url = QLineEdit(split_options.SERVICE_URL)
+        self.service_url.setEnabled(False)
+        self.chk_service.toggled.connect(self.service_url.setEnabled)
+        service_layout.addWidget(self.service_url, 1)
+        action_wrapper_layout.addLayout(service_layout)
+
         # Action Button
         self.split_btn = QPushButton("🚀 开始拆分")
         self.split_btn.setFixedHeight(50)
@@ -394,6 +888,27 @@ class ExcelSplitterApp(QMainWindow):
         """)
         self.split_btn.clicked.connect(self.start_split)
         action_wrapper_layout.addWidget(self.split_btn)
+
+        # Batch
+        self.batch_btn = QPushButton("📂 批量处理文件夹...")
+        self.batch_btn.setToolTip("对文件夹中的所有Excel文件应用当前条件 (并行进程数同上)，也可将多个文件或文件夹拖入上方区域")
+        self.batch_btn.clicked.connect(lambda: self.start_batch())
+        action_wrapper_layout.addWidget(self.batch_btn)
+
+        # Progress & Cancel
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setValue(0)
+        self.status_label = QLabel("")
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setObjectName("delete_btn")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_split)
+        progress_layout.addWidget(self.status_label)
+        progress_layout.addWidget(self.progress_bar, 1)
+        progress_layout.addWidget(self.cancel_btn)
+        action_wrapper_layout.addLayout(progress_layout)
         
         action_group.setLayout(action_wrapper_layout)
         main_layout.addWidget(action_group)
@@ -407,42 +922,121 @@ class ExcelSplitterApp(QMainWindow):
         try:
             self.path_display.setText(fname)
             self.file_path = fname
+            self.chk_watch.setChecked(False)
+            self.last_output = None
+            self.preview = None
+            self.update_match_counts()
             # Load Excel to get sheet names
-            xl = pd.ExcelFile(fname,engine='calamine')
+            sheet_names = self.workbook_cache().sheet_names(fname)
             self.sheet_combo.clear()
-            self.sheet_combo.addItems(xl.sheet_names)
+            self.sheet_combo.addItems(sheet_names)
+            self.sheet_list.clear()
+            for name in sheet_names:
+                item = QListWidgetItem(name)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked)
+                self.sheet_list.addItem(item)
             self.drop_area.label.setText(f"已选择: {os.path.basename(fname)}\n(点击或拖拽更换)")
             self.drop_area.label.setStyleSheet("color: #67c23a; font-size: 15px; font-weight: bold; border: 2px solid #67c23a; border-radius: 6px; padding: 20px; background-color: #f0f9eb;")
         except Exception as e:
             QMessageBox.critical(self, "错误", f"无法读取文件: {str(e)}")
             self.path_display.setText("读取失败")
 
+    def workbook_cache(self):
+        # Created on first use: split_cache imports pandas
+        if self.cache is None:
+            self.wait_for_warmup()
+            from split_cache import WorkbookCache, SidecarCache
+            self.sidecar = SidecarCache()
+            self.cache = WorkbookCache(sidecar=self.sidecar if self.chk_disk_cache.isChecked() else None)
+        return self.cache
+
+    def on_disk_cache_toggled(self, checked):
+        self.workbook_cache().sidecar = self.sidecar if checked else None
+
+    def clear_disk_cache(self):
+        self.workbook_cache()
+        size_mb = self.sidecar.total_bytes() / 1024 / 1024
+        reply = QMessageBox.question(self, "清空缓存", f"磁盘缓存共 {size_mb:.1f} MB，确定清空？\n({self.sidecar.cache_dir})")
+        if reply == QMessageBox.Yes:
+            self.sidecar.clear()
+
     def on_sheet_changed(self, text):
         if not self.file_path or not text:
             return
         try:
-            # Read only headers
-            df = pd.read_excel(self.file_path, sheet_name=text, nrows=0,engine='calamine')
+            columns = self.workbook_cache().columns(self.file_path, text)
             self.col_combo.clear()
-            self.col_combo.addItems(df.columns.astype(str))
+            self.col_combo.addItems(columns)
         except Exception as e:
             print(f"Error loading columns: {e}")
-
-    def on_type_changed(self, btn):
-        id = self.type_group.id(btn)
-        self.stack.setCurrentIndex(id)
-
-    def add_condition(self):
+            return
+        self.preview = None
+        self.update_match_counts()
+        loader = PreviewLoader(self.file_path, text, self.workbook_cache(), self.dtypes_combo.currentData(), self)
+        loader.loaded.connect(self.on_preview_loaded)
+        loader.finished.connect(lambda: self.preview_loaders.remove(loader))
+        self.preview_loaders.append(loader)
+        loader.start()
+
+    def on_preview_loaded(self, path, sheet, preview):
+        # Ignore sheets the user has already moved away from
+        if path != self.file_path or sheet != self.sheet_combo.currentText():
+            return
+        self.preview = preview
+        self.update_match_counts()
+        self.update_draft_count()
+
+    def format_count(self, count):
+        if count is None:
+            return "-"
+        prefix = "" if self.preview.exact else "≈"
+        pct = count / self.preview.total * 100 if self.preview.total else 0
+        return f"{prefix}{count} ({pct:.1f}%)"
+
+    def update_match_counts(self):
+        if self.preview is None:
+            for row in range(self.table.rowCount()):
+                self.table.setItem(row, 4, QTableWidgetItem(""))
+            self.match_summary.setText("正在加载数据以统计匹配行数..." if self.file_path and self.conditions else "")
+            return
+        routing = split_options.ROUTING_FIRST if self.chk_exclusive.isChecked() else split_options.ROUTING_ALL
+        counts, unmatched = self.preview.counts(self.conditions, routing)
+        for row, count in enumerate(counts):
+            item = QTableWidgetItem(self.format_count(count))
+            if count == 0:
+                item.setForeground(QColor("#f56c6c"))
+            self.table.setItem(row, 4, item)
+        note = "" if self.preview.exact else f" (按 {len(self.preview.df)} 行抽样估算)"
+        self.match_summary.setText(
+            f"共 {self.preview.total} 行，未匹配任何条件: {self.format_count(unmatched)}{note}")
+
+    def update_draft_count(self):
         col = self.col_combo.currentText()
-        if not col:
-            QMessageBox.warning(self, "警告", "请先选择一列")
+        if self.preview is None or not col:
+            self.draft_count.setText("")
             return
-        
-        out_name = self.output_name.text().strip()
-        if not out_name:
-            QMessageBox.warning(self, "警告", "请输入输出表名称")
+        try:
+            cond = self.build_condition(col, "")
+        except ValueError:
+            self.draft_count.setText("")
             return
+        count = self.preview.counts([cond])[0][0]
+        self.draft_count.setText(f"匹配 {self.format_count(count)}")
 
+    def on_type_changed(self, btn):
+        id = self.type_group.checkedId()
+        if id < 0:
+            return
+        self.stack.setCurrentIndex(id)
+        # Negating a multi-output split has no meaning
+        self.chk_negate.setEnabled(id not in (3, 4))
+        if id in (3, 4):
+            self.chk_negate.setChecked(False)
+
+    def build_condition(self, col, out_name):
+        """Condition dict from the current inputs. Raises ValueError with a
+        message for the user when the inputs are incomplete or invalid."""
         cond_type_id = self.type_group.checkedId()
         cond_desc = ""
         params = {}
@@ -453,58 +1047,68 @@ class ExcelSplitterApp(QMainWindow):
             v2 = self.num_val2.text().strip()
             
             if not v1:
-                QMessageBox.warning(self, "警告", "请输入数值")
-                return
+                raise ValueError("请输入数值")
+            if op == "介于(Range)" and not v2:
+                raise ValueError("请输入第二个数值")
             
             try:
-                float(v1)
                 if op == "介于(Range)":
-                    if not v2:
-                        QMessageBox.warning(self, "警告", "请输入第二个数值")
-                        return
-                    float(v2)
-                    cond_desc = f"{v1} <= x <= {v2}"
                     params = {'op': 'range', 'v1': float(v1), 'v2': float(v2)}
+                    cond_desc = f"{v1} <= x <= {v2}"
                 else:
-                    cond_desc = f"x {op} {v1}"
                     params = {'op': op, 'v1': float(v1)}
+                    cond_desc = f"x {op} {v1}"
             except ValueError:
-                QMessageBox.warning(self, "警告", "输入必须是数值")
-                return
+                raise ValueError("输入必须是数值")
             
             c_type = "数值范围"
 
         elif cond_type_id == 1: # Text
             txt = self.text_input.text()
             if not txt:
-                QMessageBox.warning(self, "警告", "请输入文本")
-                return
+                raise ValueError("请输入文本")
             cond_desc = f"包含 '{txt}'"
             params = {'text': txt}
+            if self.chk_ignore_case.isChecked():
+                cond_desc = f"{cond_desc} (忽略大小写)"
+                params['ignore_case'] = True
             c_type = "文本包含"
 
         elif cond_type_id == 2: # Regex
             pat = self.regex_input.text()
             if not pat:
-                QMessageBox.warning(self, "警告", "请输入正则表达式")
-                return
+                raise ValueError("请输入正则表达式")
             try:
                 re.compile(pat)
             except re.error:
-                QMessageBox.warning(self, "警告", "无效的正则表达式")
-                return
+                raise ValueError("无效的正则表达式")
             cond_desc = f"Regex: {pat}"
             params = {'pattern': pat}
             c_type = "正则表达式"
 
+        elif cond_type_id == 3: # Distinct Values
+            cond_desc = "每个不同值一份输出"
+            c_type = "按值拆分"
+
+        elif cond_type_id == 4: # Numeric Bands
+            parts = [p for p in re.split(r"[,，\s]+", self.bands_input.text().strip()) if p]
+            if not parts:
+                raise ValueError("请输入分段点")
+            try:
+                cuts = sorted(set(float(p) for p in parts))
+            except ValueError:
+                raise ValueError("分段点必须是数值")
+            cond_desc = "分段点: " + ", ".join(f"{c:g}" for c in cuts)
+            params = {'cuts': cuts}
+            c_type = "数值分段"
+
         # Handle Negate
         is_negate = self.chk_negate.isChecked()
         if is_negate:
             cond_desc = f"[NOT] {cond_desc}"
             c_type = f"{c_type} (取反)"
 
-        # Add to list
-        self.conditions.append({
+        return {
             'col': col,
             'type': c_type,
             'desc': cond_desc,
@@ -512,7 +1116,27 @@ class ExcelSplitterApp(QMainWindow):
             'output_name': out_name,
             'type_id': cond_type_id,
             'is_negate': is_negate
-        })
+        }
+
+    def add_condition(self):
+        col = self.col_combo.currentText()
+        if not col:
+            QMessageBox.warning(self, "警告", "请先选择一列")
+            return
+        
+        out_name = self.output_name.text().strip()
+        if not out_name and self.type_group.checkedId() not in (3, 4):
+            QMessageBox.warning(self, "警告", "请输入输出表名称")
+            return
+
+        try:
+            cond = self.build_condition(col, out_name)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+
+        # Add to list
+        self.conditions.append(cond)
         
         self.refresh_table()
         self.output_name.clear()
@@ -524,9 +1148,14 @@ class ExcelSplitterApp(QMainWindow):
             row = self.table.rowCount()
             self.table.insertRow(row)
             self.table.setItem(row, 0, QTableWidgetItem(c['col']))
-            self.table.setItem(row, 1, QTableWidgetItem(c['type']))
-            self.table.setItem(row, 2, QTableWidgetItem(c['desc']))
-            self.table.setItem(row, 3, QTableWidgetItem(c['output_name']))
+            self.table.setItem(row, 1, QTableWidgetItem(c.get('type', str(c['type_id']))))
+            self.table.setItem(row, 2, QTableWidgetItem(c.get('desc', str(c.get('params', '')))))
+            out_name = c['output_name']
+            if c['type_id'] in (3, 4): # Distinct Values / Numeric Bands
+                label = "<值>" if c['type_id'] == 3 else "<分段>"
+                out_name = f"{out_name}_{label}" if out_name else label
+            self.table.setItem(row, 3, QTableWidgetItem(out_name))
+        self.update_match_counts()
 
     def delete_condition(self):
         rows = sorted(set(index.row() for index in self.table.selectedIndexes()), reverse=True)
@@ -538,6 +1167,81 @@ class ExcelSplitterApp(QMainWindow):
         self.conditions = []
         self.refresh_table()
 
+    def save_conditions(self):
+        if not self.conditions:
+            QMessageBox.warning(self, "警告", "没有可保存的条件")
+            return
+        fname, _ = QFileDialog.getSaveFileName(self, "保存条件", "conditions.json", "JSON Files (*.json)")
+        if not fname:
+            return
+        self.wait_for_warmup()
+        import split_engine
+        try:
+            split_engine.save_conditions(self.conditions, fname)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"保存条件失败: {e}")
+
+    def load_conditions(self):
+        fname, _ = QFileDialog.getOpenFileName(self, "加载条件", "", "JSON Files (*.json)")
+        if not fname:
+            return
+        self.wait_for_warmup()
+        import split_engine
+        try:
+            conditions = split_engine.load_conditions(fname)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "错误", f"加载条件失败: {e}")
+            return
+        self.conditions = conditions
+        self.refresh_table()
+
+    def combine_conditions(self):
+        rows = sorted(set(index.row() for index in self.table.selectedIndexes()))
+        if len(rows) < 2:
+            QMessageBox.warning(self, "警告", "请至少选择两个条件进行组合")
+            return
+        picked = [self.conditions[row] for row in rows]
+        if any(c['type_id'] in (3, 4) for c in picked):
+            QMessageBox.warning(self, "警告", "“按值拆分”和“数值分段”条件不能参与组合")
+            return
+        out_name = self.output_name.text().strip()
+        if not out_name:
+            QMessageBox.warning(self, "警告", "请在“输出名称”中输入组合条件的输出名称")
+            return
+
+        op = 'and' if self.combine_op.currentIndex() == 0 else 'or'
+        joiner = " AND " if op == 'and' else " OR "
+        self.wait_for_warmup()
+        import split_engine
+        cols = []
+        for c in picked:
+            cols.extend(col for col in split_engine.condition_columns(c) if col not in cols)
+        cond_desc = joiner.join(
+            f"({c['desc']})" if c['type_id'] == 5 else f"({c['col']}: {c['desc']})" for c in picked)
+        c_type = "组合条件"
+
+        is_negate = self.chk_negate.isChecked()
+        if is_negate:
+            cond_desc = f"[NOT] {cond_desc}"
+            c_type = f"{c_type} (取反)"
+
+        combined = {
+            'col': ", ".join(cols),
+            'type': c_type,
+            'desc': cond_desc,
+            'params': {'op': op, 'children': picked},
+            'output_name': out_name,
+            'type_id': 5,
+            'is_negate': is_negate
+        }
+        for row in reversed(rows):
+            del self.conditions[row]
+        self.conditions.insert(rows[0], combined)
+
+        self.refresh_table()
+        self.output_name.clear()
+        self.chk_negate.setChecked(False)
+
     def start_split(self):
         if not self.file_path:
             QMessageBox.warning(self, "警告", "请先选择文件")
@@ -546,113 +1250,292 @@ class ExcelSplitterApp(QMainWindow):
             QMessageBox.warning(self, "警告", "请至少添加一个条件")
             return
 
-        try:
-            sheet = self.sheet_combo.currentText()
-            df = pd.read_excel(self.file_path, sheet_name=sheet,engine='calamine')
-            
-            mode = self.out_mode_group.checkedId()
-            output_dir = ""
-            output_file = ""
-            
-            if mode == 0: # Single File
-                output_file, _ = QFileDialog.getSaveFileName(self, "保存结果", "split_result.xlsx", "Excel Files (*.xlsx)")
-                if not output_file:
-                    return
-            else: # Multi Files
-                output_dir = QFileDialog.getExistingDirectory(self, "选择保存目录")
-                if not output_dir:
-                    return
-
-            success_msg = ""
-
-            # Logic for filtering first, then saving
-            results = []
-
-            for cond in self.conditions:
-                col = cond['col']
-                params = cond['params']
-                t_id = cond['type_id']
-                
-                if col not in df.columns:
-                    continue 
-                
-                filtered_df = pd.DataFrame()
-                mask = None
-
-                if t_id == 0: # Numeric
-                    series = pd.to_numeric(df[col], errors='coerce')
-                    if params['op'] == 'range':
-                        mn = min(params['v1'], params['v2'])
-                        mx = max(params['v1'], params['v2'])
-                        mask = (series >= mn) & (series <= mx)
-                    elif params['op'] == '>=':
-                        mask = series >= params['v1']
-                    elif params['op'] == '>':
-                        mask = series > params['v1']
-                    elif params['op'] == '<=':
-                        mask = series <= params['v1']
-                    elif params['op'] == '<':
-                        mask = series < params['v1']
-                    elif params['op'] == '==':
-                        mask = series == params['v1']
-                    
-                elif t_id == 1: # Text
-                    series = df[col].astype(str)
-                    mask = series.str.contains(params['text'], na=False)
-
-                elif t_id == 2: # Regex
-                    series = df[col].astype(str)
-                    mask = series.str.match(params['pattern'], na=False) | series.str.contains(params['pattern'], regex=True, na=False)
-                
-                # Apply negation if needed
-                if mask is not None:
-                    if cond.get('is_negate', False):
-                        mask = ~mask
-                    filtered_df = df[mask]
-
-                if not filtered_df.empty:
-                    results.append((filtered_df, cond['output_name']))
-
-            if not results:
-                QMessageBox.information(self, "提示", "没有数据符合任何条件")
+        sheet = self.sheet_combo.currentText()
+        mode = self.out_mode_group.checkedId()
+        sheets = None
+        if self.chk_multi_sheets.isChecked():
+            sheets = self.checked_sheets()
+            if not sheets:
+                QMessageBox.warning(self, "警告", "请至少勾选一个工作表")
+                return
+            if self.chk_incremental.isChecked() or self.chk_streaming.isChecked():
+                QMessageBox.warning(self, "警告", "多工作表拆分不支持增量拆分和流式处理")
                 return
 
-            if mode == 0: # Single File
-                with pd.ExcelWriter(output_file) as writer:
-                    for res_df, name in results:
-                         # Check dedup
-                        if name in writer.sheets:
-                            name = f"{name}_{len(writer.sheets)}"
-                        res_df.to_excel(writer, sheet_name=name, index=False)
-                success_msg = f"拆分完成！已保存至 {output_file}"
-            else: # Multi Files
-                saved_count = 0
-                for res_df, name in results:
-                    # Sanitize filename
-                    safe_name = "".join([c for c in name if c.isalnum() or c in (' ', '-', '_')]).strip()
-                    if not safe_name:
-                        safe_name = "result"
-                    
-                    # Handle duplicates in file names?
-                    fname = os.path.join(output_dir, f"{safe_name}.xlsx")
-                    counter = 1
-                    while os.path.exists(fname):
-                        fname = os.path.join(output_dir, f"{safe_name}_{counter}.xlsx")
-                        counter += 1
-                    
-                    res_df.to_excel(fname, index=False)
-                    saved_count += 1
-                success_msg = f"拆分完成！共保存 {saved_count} 个文件至 {output_dir}"
-
-            QMessageBox.information(self, "成功", success_msg)
+        if mode == 0: # Single File
+            output, _ = QFileDialog.getSaveFileName(self, "保存结果", "split_result.xlsx", "Excel Files (*.xlsx)")
+        else: # Multi Files
+            output = QFileDialog.getExistingDirectory(self, "选择保存目录")
+        if not output:
+            return
+        self.launch_split(sheet, mode, output, incremental=self.chk_incremental.isChecked(), sheets=sheets)
 
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"拆分过程中发生错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
+    def checked_sheets(self):
+        return [self.sheet_list.item(i).text() for i in range(self.sheet_list.count())
+                if self.sheet_list.item(i).checkState() == Qt.Checked]
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = ExcelSplitterApp()
+    def on_multi_sheets_toggled(self, checked):
+        self.sheet_list.setVisible(checked)
+        self.sheets_combine_combo.setEnabled(checked)
+
+    def launch_split(self, sheet, mode, output, incremental=False, quiet=False, sheets=None):
+        if self.chk_service.isChecked():
+            worker_class = functools.partial(ServiceSplitWorker, self.service_url.text().strip(),
+                                             trace=self.chk_trace.isChecked())
+        else:
+            worker_class = SplitWorker
+        self.worker = worker_class(self.file_path, sheet, self.conditions, mode, output, self.workbook_cache(),
+                                  streaming=self.chk_streaming.isChecked() and not incremental,
+                                  backend=self.writer_combo.currentText(),
+                                  workers=self.workers_spin.value(),
+                                  routing=split_options.ROUTING_FIRST if self.chk_exclusive.isChecked() else split_options.ROUTING_ALL,
+                                  fmt=self.format_combo.currentText(),
+                                  compression=self.compression_combo.currentText(),
+                                  incremental=incremental,
+                                  quiet=quiet,
+                                  dtypes=self.dtypes_combo.currentData(),
+                                  sheets=sheets,
+                                  combine=self.sheets_combine_combo.currentData(),
+                                  parent=self)
+        self.worker.progress.connect(self.on_split_progress)
+        self.worker.succeeded.connect(self.on_split_succeeded)
+        self.worker.failed.connect(self.on_split_failed)
+        self.worker.cancelled.connect(self.on_split_cancelled)
+        self.worker.finished.connect(self.on_split_finished)
+        self.set_running(True)
+        self.worker.start()
+
+    def start_batch(self, paths=None):
+        if not self.conditions:
+            QMessageBox.warning(self, "警告", "请至少添加一个条件")
+            return
+        if paths is None:
+            folder = QFileDialog.getExistingDirectory(self, "选择包含Excel文件的文件夹")
+            if not folder:
+                return
+            paths = [folder]
+        self.wait_for_warmup()
+        import split_engine
+        sources = []
+        for p in paths:
+            sources.extend(s for s in split_engine.collect_sources(p) if s not in sources)
+        if not sources:
+            QMessageBox.warning(self, "警告", "没有找到Excel文件 (.xlsx, .xlsm, .xls)")
+            return
+
+        output = QFileDialog.getExistingDirectory(self, "选择结果保存目录")
+        if not output:
+            return
+
+        # Use the selected sheet name if a workbook is loaded, otherwise the first sheet
+        sheet = self.sheet_combo.currentText() or None
+        self.worker = BatchWorker(sources, sheet, self.conditions, self.out_mode_group.checkedId(), output,
+                                  backend=self.writer_combo.currentText(),
+                                  workers=self.workers_spin.value(),
+                                  routing=split_options.ROUTING_FIRST if self.chk_exclusive.isChecked() else split_options.ROUTING_ALL,
+                                  fmt=self.format_combo.currentText(),
+                                  compression=self.compression_combo.currentText(),
+                                  dtypes=self.dtypes_combo.currentData(),
+                                  parent=self)
+        self.worker.progress.connect(self.on_split_progress)
+        self.worker.file_done.connect(self.on_batch_file_done)
+        self.worker.succeeded.connect(self.on_batch_succeeded)
+        self.worker.failed.connect(self.on_split_failed)
+        self.worker.cancelled.connect(self.on_split_cancelled)
+        self.worker.finished.connect(self.on_split_finished)
+        self.set_running(True)
+        self.worker.start()
+
+    def on_format_changed(self, fmt):
+        is_xlsx = fmt == split_options.FORMAT_XLSX
+        # Other formats hold one table per file
+        if not is_xlsx:
+            self.rb_multi_files.setChecked(True)
+        self.rb_single_file.setEnabled(is_xlsx)
+        self.writer_combo.setEnabled(is_xlsx)
+        self.compression_combo.setEnabled(fmt == split_options.FORMAT_PARQUET)
+
+    def cancel_split(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.status_label.setText("正在取消...")
+
+    def set_running(self, running):
+        self.split_btn.setEnabled(not running)
+        self.batch_btn.setEnabled(not running)
+        self.cancel_btn.setEnabled(running)
+        self.drop_area.setEnabled(not running)
+        if running:
+            self.progress_bar.setRange(0, 0)
+        else:
+            self.progress_bar.setRange(0, 100)
+
+    def on_split_progress(self, phase, done, total):
+        label = PHASE_LABELS.get(phase, phase)
+        if total > 0:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
+            self.status_label.setText(f"{label} ({done}/{total})")
+        else:
+            self.progress_bar.setRange(0, 0)
+            self.status_label.setText(f"{label}...")
+
+    def on_split_succeeded(self, written):
+        import split_incremental
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(100)
+        if not self.worker.sheets:
+            self.last_output = (self.worker.mode, self.worker.output)
+        if self.worker.quiet:
+            label = split_incremental.STATUS_LABELS[self.worker.status]
+            self.status_label.setText(f"{label} ({len(written)} 个文件)")
+            return
+        if self.worker.status == split_incremental.STATUS_SKIPPED:
+            self.status_label.setText("无变化，已跳过")
+            QMessageBox.information(self, "提示", split_incremental.STATUS_LABELS[self.worker.status])
+            return
+        if not written:
+            self.status_label.setText("没有数据符合任何条件")
+            QMessageBox.information(self, "提示", "没有数据符合任何条件")
+            return
+        if self.worker.mode == 0: # Single File
+            success_msg = f"拆分完成！已保存至 {self.worker.output}"
+        else: # Multi Files
+            success_msg = f"拆分完成！共保存 {len(written)} 个文件至 {self.worker.output}"
+        if self.worker.status is not None:
+            success_msg += "\n" + split_incremental.STATUS_LABELS[self.worker.status]
+        success_msg += "\n\n" + "\n".join(self.worker.summary())
+        if self.chk_trace.isChecked():
+            trace_path = self.worker.trace_path()
+            try:
+                self.worker.save_trace(trace_path)
+                success_msg += f"\n\n性能跟踪已保存至 {trace_path}"
+            except OSError as e:
+                success_msg += f"\n\n性能跟踪保存失败: {e}"
+        self.status_label.setText("拆分完成")
+        QMessageBox.information(self, "成功", success_msg)
+
+    def on_batch_file_done(self, path, count, error):
+        name = os.path.basename(path)
+        self.status_label.setText(f"{name}: 失败" if error else f"{name}: {count} 个文件")
+
+    def on_batch_succeeded(self, outcome):
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(100)
+        failures = [(path, error) for path, (_, error) in outcome.items() if error]
+        written = sum(len(w) for w, _ in outcome.values())
+        msg = f"批量处理完成！共 {len(outcome)} 个工作簿，生成 {written} 个文件，保存至 {self.worker.output}"
+        self.status_label.setText("批量处理完成")
+        if failures:
+            details = "\n".join(f"{os.path.basename(p)}: {e}" for p, e in failures[:20])
+            QMessageBox.warning(self, "部分失败", f"{msg}\n\n{len(failures)} 个文件失败:\n{details}")
+        else:
+            QMessageBox.information(self, "成功", msg)
+
+    def on_split_failed(self, message):
+        if isinstance(self.worker, SplitWorker) and self.worker.quiet:
+            self.status_label.setText(f"自动拆分失败: {message}")
+            return
+        self.status_label.setText("拆分失败")
+        QMessageBox.critical(self, "错误", f"拆分过程中发生错误: {message}")
+
+    def on_split_cancelled(self):
+        self.progress_bar.setValue(0)
+        self.status_label.setText("已取消，已清理未完成的文件")
+
+    def on_split_finished(self):
+        self.set_running(False)
+        self.worker = None
+
+    def on_watch_toggled(self, checked):
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+        self.watch_timer.stop()
+        if not checked:
+            return
+        if not self.file_path or self.last_output is None:
+            QMessageBox.warning(self, "警告", "请先完成一次拆分，监视时将增量拆分到同一输出位置")
+            self.chk_watch.setChecked(False)
+            return
+        self.watcher.addPath(self.file_path)
+        self.status_label.setText(f"正在监视 {os.path.basename(self.file_path)}")
+
+    def on_source_changed(self, path):
+        # Saving via a temp file + rename drops the path from the watcher
+        if os.path.exists(path) and path not in self.watcher.files():
+            self.watcher.addPath(path)
+        self.watch_timer.start()
+
+    def run_watched_split(self):
+        if not self.chk_watch.isChecked():
+            return
+        if self.worker is not None or not os.path.exists(self.file_path):
+            self.watch_timer.start()  # Try again once the current run is done
+            return
+        if self.file_path not in self.watcher.files():
+            self.watcher.addPath(self.file_path)
+        mode, output = self.last_output
+        self.launch_split(self.sheet_combo.currentText(), mode, output, incremental=True, quiet=True)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            if self.startup is not None:
+                self.startup.add("time to first paint", 'startup', _START, time.perf_counter())
+            QTimer.singleShot(0, self.start_warmup)
+
+    def start_warmup(self):
+        self.warmup = Warmup(self.startup, self)
+        self.warmup.finished.connect(self.on_warmed_up)
+        self.warmup.start()
+
+    def wait_for_warmup(self):
+        # Importing the data modules on two threads at once can deadlock
+        # on the import locks; let the background import finish first
+        if self.warmup is not None:
+            self.warmup.wait()
+
+    def on_warmed_up(self):
+        self.workbook_cache()
+        if self.startup is None:
+            return
+        self.startup.add("time to ready", 'startup', _START, time.perf_counter())
+        print("启动耗时:\n" + "\n".join(self.startup.summary(limit=20)), file=sys.stderr)
+        if self.startup_trace:
+            try:
+                self.startup.save(self.startup_trace, split_trace.FORMAT_CHROME)
+                print(f"启动跟踪已保存至 {self.startup_trace}", file=sys.stderr)
+            except OSError as e:
+                print(f"启动跟踪保存失败: {e}", file=sys.stderr)
+
+    def closeEvent(self, event):
+        self.watch_timer.stop()
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        for loader in list(self.preview_loaders):
+            loader.wait()
+        self.wait_for_warmup()
+        super().closeEvent(event)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Excel条件拆分器")
+    parser.add_argument('--startup-timing', nargs='?', const='', metavar='TRACE',
+                        help="输出启动各阶段耗时 (可选保存 Chrome trace 文件)")
+    args, qt_args = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    startup = None
+    if args.startup_timing is not None:
+        startup = split_trace.Tracer(origin=_START)
+        startup.add("import main", 'startup', _START, _IMPORTED)
+    with split_trace.span(startup, "QApplication", 'startup'):
+        app = QApplication(sys.argv[:1] + qt_args)
+    with split_trace.span(startup, "build window", 'startup'):
+        window = ExcelSplitterApp(startup, args.startup_timing or None)
     window.show()
-    sys.exit(app.exec_())
+    return app.exec_()
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Excel条件拆分器 - 性能基准
+
+Times and memory-profiles each phase of a split for every condition type
+and output mode, and saves the results as JSON so runs can be compared
+across versions:
+
+    python split_bench.py --rows 500000 --cols 12 -o before.json
+    python split_bench.py big.xlsx -o after.json --compare before.json
+
+Phases:
+    read     parse the sheet and compact its columns (load_source, no
+             cache); `frame_bytes` is the size of the loaded frame
+    coerce   build the numeric/text column views the rules need
+    mask     evaluate the rules (plan_outputs)
+    select   turn the masks into row selections (RowSelection per output)
+    write    copy the rows out in slices and write them (write_results),
+             once per output mode
+
+Without a source file a workbook is generated with 测试数据生成.py's
+options first. The built-in cases use that generator's columns.
+
+Peak memory comes from tracemalloc (Python and numpy allocations made
+during the phase); tracing slows the phases down a little, --no-trace
+turns it off for pure timings. RSS is recorded too when psutil is
+installed.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import split_dtypes
+import split_engine
+import split_writers
+
+CASES = {
+    'numeric': [
+        {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 90}, 'output_name': '优秀'},
+        {'col': '分数', 'type_id': 0, 'params': {'op': 'range', 'v1': 60, 'v2': 89}, 'output_name': '及格'},
+    ],
+    'text': [
+        {'col': '评语', 'type_id': 1, 'params': {'text': '缺勤'}, 'output_name': '缺勤'},
+        {'col': '评语', 'type_id': 1, 'params': {'text': '进步'}, 'output_name': '进步'},
+        {'col': '评语', 'type_id': 1, 'params': {'text': '练习'}, 'output_name': '练习'},
+    ],
+    'regex': [
+        {'col': '学号', 'type_id': 2, 'params': {'pattern': r'^2023\d+$'}, 'output_name': '学号'},
+    ],
+    'distinct': [
+        {'col': '班级', 'type_id': 3, 'params': {}, 'output_name': ''},
+    ],
+    'bands': [
+        {'col': '分数', 'type_id': 4, 'params': {'cuts': [60, 70, 80, 90]}, 'output_name': '分数'},
+    ],
+    'compound': [
+        {'col': '分数, 评语', 'type_id': 5, 'output_name': '优秀且进步', 'params': {'op': 'and', 'children': [
+            {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 60}, 'output_name': ''},
+            {'col': '评语', 'type_id': 1, 'params': {'text': '进步'}, 'output_name': ''},
+        ]}},
+    ],
+}
+MODES = {'single': split_engine.MODE_SINGLE_FILE, 'multi': split_engine.MODE_MULTI_FILES}
+
+
+def _rss():
+    return psutil.Process().memory_info().rss if psutil is not None else None
+
+
+def measure(fn, trace=True):
+    """Run fn() and return (result, {'seconds', 'peak_bytes', 'rss_bytes'})."""
+    if trace:
+        tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return value, {'seconds': seconds, 'peak_bytes': peak, 'rss_bytes': _rss()}
+
+
+def coerce_views(df, plan):
+    """Build the column views the plan reads, the way rule evaluation would."""
+    views = split_engine.ColumnViews(df, plan)
+    for rule in plan:
+        rules = [rule]
+        if rule.compound is not None:
+            for col in rule.compound.columns:
+                views.numeric(col)
+            rules = rule.compound.rules()
+        for r in rules:
+            if r.type_id in (split_engine.TYPE_NUMERIC, split_engine.TYPE_BANDS):
+                views.numeric(r.col)
+            elif r.type_id in (split_engine.TYPE_TEXT, split_engine.TYPE_REGEX):
+                views.text(r.col)
+                views.arrow(r.col)
+    return views
+
+
+def bench_case(df, case, conditions, modes, backend, out_dir, trace):
+    records = []
+
+    def record(phase, stats, mode=None, **extra):
+        records.append(dict(case=case, mode=mode, phase=phase, **stats, **extra))
+
+    plan = split_engine.compile_plan(conditions, df.columns)
+    if not plan:
+        raise ValueError(f"数据中缺少 {case} 用例需要的列")
+    views, stats = measure(lambda: coerce_views(df, plan), trace)
+    record('coerce', stats)
+
+    selections, stats = measure(lambda: list(split_engine.plan_outputs(df, plan, views)), trace)
+    record('mask', stats, outputs=len(selections))
+
+    def select():
+        rows = [(split_engine.RowSelection(df, sel), name) for _, name, sel in selections]
+        return [(r, name) for r, name in rows if len(r)]
+    results, stats = measure(select, trace)
+    record('select', stats, rows=sum(len(r) for r, _ in results),
+           index_bytes=sum(r.nbytes for r, _ in results))
+    views.clear()
+
+    for mode_name in modes:
+        mode = MODES[mode_name]
+        target = os.path.join(out_dir, f"{case}_{mode_name}")
+        if mode == split_engine.MODE_SINGLE_FILE:
+            target += ".xlsx"
+        else:
+            os.makedirs(target, exist_ok=True)
+        # write_results releases each selection once written
+        results = select()
+        written, stats = measure(
+            lambda: split_engine.write_results(results, mode, target, backend=backend), trace)
+        record('write', stats, mode=mode_name, files=len(written))
+    return records
+
+
+def _best(runs):
+    # Fastest time and largest peak over the repeats of one measurement
+    merged = dict(runs[0])
+    merged['seconds'] = min(r['seconds'] for r in runs)
+    peaks = [r['peak_bytes'] for r in runs if r['peak_bytes'] is not None]
+    merged['peak_bytes'] = max(peaks) if peaks else None
+    return merged
+
+
+def run(source, sheet, cases, modes, backend, repeat=1, trace=True, dtypes=split_dtypes.DTYPES_COMPACT):
+    if sheet is None:
+        sheet = split_engine.list_sheets(source)[0]
+    runs = {}
+    with tempfile.TemporaryDirectory(prefix="split_bench_") as out_dir:
+        for _ in range(repeat):
+            df, stats = measure(lambda: split_engine.load_source(source, sheet, dtypes=dtypes), trace)
+            runs.setdefault((None, None, 'read'), []).append(
+                dict(case=None, mode=None, phase='read', frame_bytes=int(df.memory_usage(deep=True).sum()), **stats))
+            for case in cases:
+                for r in bench_case(df, case, CASES[case], modes, backend, out_dir, trace):
+                    runs.setdefault((r['case'], r['mode'], r['phase']), []).append(r)
+            del df
+    return [_best(r) for r in runs.values()], sheet
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment():
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'eval_engine': split_engine.EVAL_ENGINE,
+    }
+
+
+def _key(r):
+    return (r['case'] or '', r['mode'] or '', r['phase'])
+
+
+def print_results(results, baseline=None):
+    base = {_key(r): r for r in baseline or []}
+    for r in results:
+        label = "/".join(p for p in _key(r) if p)
+        peak = "" if r['peak_bytes'] is None else f"{r['peak_bytes'] / 1024 / 1024:9.1f} MB"
+        line = f"{label:<24}{r['seconds']:9.3f}s {peak}"
+        old = base.get(_key(r))
+        if old is not None and old['seconds'] > 0:
+            line += f"   {old['seconds']:9.3f}s -> x{r['seconds'] / old['seconds']:.2f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Excel条件拆分器 性能基准")
+    parser.add_argument('source', nargs='?', help="源Excel文件 (省略时按 --rows 等参数生成)")
+    parser.add_argument('-s', '--sheet', help="工作表名称 (默认第一个工作表)")
+    parser.add_argument('-o', '--output', default="bench_result.json", help="结果JSON文件")
+    parser.add_argument('--compare', help="与之前保存的结果JSON对比")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES), help="条件类型")
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES), help="输出方式")
+    parser.add_argument('--writer', choices=split_writers.available_backends(),
+                        default=split_writers.default_backend(), help="xlsx写入引擎")
+    parser.add_argument('--dtypes', choices=split_dtypes.available_modes(), default=split_dtypes.DTYPES_COMPACT,
+                        help="读取后的列类型")
+    parser.add_argument('--repeat', type=int, default=1, help="重复次数 (取最快一次)")
+    parser.add_argument('--no-trace', action='store_true', help="不统计内存峰值 (tracemalloc 会拖慢计时)")
+    gen = parser.add_argument_group("生成数据 (未指定源文件时)")
+    gen.add_argument('--rows', type=int, default=100000)
+    gen.add_argument('--cols', type=int, default=5)
+    gen.add_argument('--cardinality', type=int, default=10)
+    gen.add_argument('--null-rate', type=float, default=0.0)
+    gen.add_argument('--mixed-rate', type=float, default=0.0)
+    gen.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    with tempfile.TemporaryDirectory(prefix="split_bench_src_") as src_dir:
+        source = args.source
+        generated = None
+        if source is None:
+            generator = importlib.import_module("测试数据生成")
+            source = os.path.join(src_dir, "bench.xlsx")
+            generated = {k: getattr(args, k) for k in ('rows', 'cols', 'cardinality', 'null_rate', 'mixed_rate', 'seed')}
+            generator.generate_data(source, args.rows, args.cols, args.cardinality, 1,
+                                    args.null_rate, args.mixed_rate, args.seed)
+        results, sheet = run(source, args.sheet, args.cases, args.modes, args.writer,
+                             args.repeat, not args.no_trace, args.dtypes)
+        report = {
+            'environment': environment(),
+            'source': {
+                'file': None if generated else os.path.abspath(source),
+                'generated': generated,
+                'sheet': sheet,
+                'bytes': os.path.getsize(source),
+            },
+            'settings': {'writer': args.writer, 'dtypes': args.dtypes, 'repeat': args.repeat,
+                         'trace': not args.no_trace},
+            'results': results,
+        }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_results(results, baseline)
+    print(f"结果已保存: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+"""
+Excel条件拆分器 - 工作簿缓存
+
+Keeps open calamine workbook handles and parsed sheet DataFrames in memory
+so that listing sheets, reading headers and re-running a split against the
+same workbook only parse it once.
+
+Entries are keyed by (path, sheet, mtime, size) and the split_dtypes
+mode the frame was compacted with: editing the file on disk invalidates
+them automatically. Parsed frames are evicted least recently
+used first once their combined size exceeds `max_bytes`.
+
+Cached DataFrames are shared between callers and must not be modified
+in place.
+
+SidecarCache is an optional on-disk layer (needs pyarrow): each parsed
+sheet is saved as an uncompressed Arrow IPC (Feather) file keyed by a
+content hash of the source workbook, and later sessions memory-map that
+file instead of parsing the XLSX again. Columns mixing numbers and text
+(a score column with the odd "缺考"), which Arrow can't type, are stored
+as text plus a type tag per cell, or as codes plus tagged categories when
+compacted to a categorical, and restored on load.
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import split_dtypes
+from split_engine import READ_ENGINE
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+DEFAULT_MAX_BYTES = 1024 ** 3  # 1 GB
+MAX_OPEN_WORKBOOKS = 4
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.excel_splitter_cache')
+DEFAULT_MAX_DISK_BYTES = 5 * 1024 ** 3  # 5 GB
+SIDECAR_EXT = '.arrow'
+META_KEY = b'excel_splitter'
+MIXED_TAGS = "\0tags{}"  # column holding the type tags of mixed column {position}
+
+# Type tag -> decoder for the cells of mixed columns
+_DECODERS = {
+    'none': lambda s: None,
+    'str': str,
+    'bool': lambda s: s == 'True',
+    'int': int,
+    'float': float,
+    'nat': lambda s: pd.NaT,
+    'timestamp': pd.Timestamp,
+    'datetime': datetime.datetime.fromisoformat,
+    'time': datetime.time.fromisoformat,
+}
+
+
+def file_key(path):
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _tag(value):
+    if value is None:
+        return 'none'
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(value, (int, np.integer)):
+        return 'int'
+    if isinstance(value, (float, np.floating)):
+        return 'float'
+    if value is pd.NaT:
+        return 'nat'
+    if isinstance(value, pd.Timestamp):
+        return 'timestamp'
+    if isinstance(value, datetime.datetime):
+        return 'datetime'
+    if isinstance(value, datetime.time):
+        return 'time'
+    raise TypeError(f"无法缓存的单元格类型: {type(value).__name__}")
+
+
+def _encode(value, tag):
+    if tag == 'none':
+        return None
+    if tag in ('timestamp', 'datetime', 'time'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_mixed(df):
+    """(frame, positions, categories): `df` with every column Arrow can't
+    type (numbers mixed with text) replaced by its cells as text, and a
+    MIXED_TAGS column per replaced column appended with each cell's type.
+    A categorical column is replaced by its codes instead and `categories`
+    maps its position to the categories as [tag, text] pairs. Raises
+    TypeError for cell types that can't be restored."""
+    out = None
+    positions = []
+    categories = {}
+    for i in range(df.shape[1]):
+        series = df.iloc[:, i]
+        is_categorical = isinstance(series.dtype, pd.CategoricalDtype)
+        if not split_dtypes.is_text(series.dtype) and not is_categorical:
+            continue
+        try:
+            pa.array(series, from_pandas=True)
+            continue
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        if out is None:
+            out = df.copy(deep=False)
+        if is_categorical:
+            out.isetitem(i, pd.Series(series.cat.codes.to_numpy(), index=df.index))
+            categories[i] = [[t, _encode(v, t)] for v, t in ((v, _tag(v)) for v in series.cat.categories)]
+            continue
+        values = series.to_numpy(dtype=object)
+        tags = [_tag(v) for v in values]
+        out.isetitem(i, pd.Series([_encode(v, t) for v, t in zip(values, tags)], dtype=object))
+        out[MIXED_TAGS.format(i)] = pd.Categorical(tags)
+        positions.append(i)
+    return (df if out is None else out), positions, categories
+
+
+def decode_mixed(df, positions, categories=None):
+    """Undo encode_mixed (mixed columns come back as object columns, mixed
+    categoricals with their categories in the same order)."""
+    if not positions and not categories:
+        return df
+    tag_columns = [MIXED_TAGS.format(i) for i in positions]
+    out = df.iloc[:, :df.shape[1] - len(positions)].copy(deep=False)
+    for i, name in zip(positions, tag_columns):
+        texts = df.iloc[:, i].to_numpy(dtype=object)
+        tags = df[name].to_numpy(dtype=object)
+        out.isetitem(i, pd.Series([_DECODERS[t](v) for v, t in zip(texts, tags)], dtype=object))
+    for i, pairs in (categories or {}).items():
+        values = pd.Index([_DECODERS[t](v) for t, v in pairs], dtype=object)
+        out.isetitem(int(i), pd.Series(pd.Categorical.from_codes(out.iloc[:, int(i)].to_numpy(), values),
+                                       index=out.index))
+    return out
+
+
+class _Workbook:
+    def __init__(self, path):
+        self.xl = pd.ExcelFile(path, engine=READ_ENGINE)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.xl.close()
+
+
+class WorkbookCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, sidecar=None):
+        self.max_bytes = max_bytes
+        self.sidecar = sidecar
+        self._lock = threading.Lock()
+        self._books = OrderedDict()   # file key -> _Workbook
+        self._frames = OrderedDict()  # file key + (sheet, dtypes) -> (df, nbytes)
+        self._frame_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _workbook(self, key):
+        with self._lock:
+            book = self._books.get(key)
+            if book is not None:
+                self._books.move_to_end(key)
+                return book
+        book = _Workbook(key[0])
+        # Handles are closed outside self._lock: closing waits for any parse
+        # still running on that handle, and that parse needs self._lock to
+        # store its result.
+        with self._lock:
+            existing = self._books.get(key)
+            if existing is not None:
+                to_close = [book]
+                book = existing
+            else:
+                to_close = self._drop_stale(key[0], key)
+                self._books[key] = book
+                while len(self._books) > MAX_OPEN_WORKBOOKS:
+                    to_close.append(self._books.popitem(last=False)[1])
+        for old in to_close:
+            old.close()
+        return book
+
+    def _drop_stale(self, path, key):
+        # The file changed on disk: forget handles and frames of older versions
+        stale = [self._books.pop(k) for k in list(self._books) if k[0] == path and k != key]
+        for k in [k for k in self._frames if k[0] == path and k[:3] != key]:
+            _, nbytes = self._frames.pop(k)
+            self._frame_bytes -= nbytes
+        return stale
+
+    def sheet_names(self, path):
+        return list(self._workbook(file_key(path)).xl.sheet_names)
+
+    def columns(self, path, sheet):
+        key = file_key(path)
+        with self._lock:
+            entry = next((v for k, v in self._frames.items() if k[:4] == key + (sheet,)), None)
+        if entry is not None:
+            return [str(c) for c in entry[0].columns]
+
+        book = self._workbook(key)
+        # Don't wait behind a full parse running on another thread
+        if book.lock.acquire(blocking=False):
+            try:
+                df = book.xl.parse(sheet, nrows=0)
+            finally:
+                book.lock.release()
+        else:
+            df = pd.read_excel(path, sheet_name=sheet, nrows=0, engine=READ_ENGINE)
+        return [str(c) for c in df.columns]
+
+    def frame(self, path, sheet, dtypes=split_dtypes.DTYPES_COMPACT):
+        key = file_key(path)
+        fkey = key + (sheet, dtypes)
+        with self._lock:
+            entry = self._frames.get(fkey)
+            if entry is not None:
+                self._frames.move_to_end(fkey)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        df = None
+        if self.sidecar is not None:
+            df = self.sidecar.load(path, sheet, dtypes)
+        if df is not None:
+            # Arrow may hand some columns back in their plain form
+            df = split_dtypes.compact_frame(df, dtypes)
+        else:
+            book = self._workbook(key)
+            with book.lock:
+                df = book.xl.parse(sheet)
+            df = split_dtypes.compact_frame(df, dtypes)
+            if self.sidecar is not None and not self.sidecar.store(path, sheet, df, dtypes):
+                warnings.warn(f"工作表 {sheet} 未写入磁盘缓存: {self.sidecar.last_error}", stacklevel=2)
+        self.put(path, sheet, df, key=key, dtypes=dtypes)
+        return df
+
+    def put(self, path, sheet, df, key=None, dtypes=split_dtypes.DTYPES_COMPACT):
+        if key is None:
+            key = file_key(path)
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        fkey = key + (sheet, dtypes)
+        with self._lock:
+            old = self._frames.pop(fkey, None)
+            if old is not None:
+                self._frame_bytes -= old[1]
+            self._frames[fkey] = (df, nbytes)
+            self._frame_bytes += nbytes
+            while self._frame_bytes > self.max_bytes and self._frames:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self._frame_bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            books = list(self._books.values())
+            self._books.clear()
+            self._frames.clear()
+            self._frame_bytes = 0
+        for book in books:
+            book.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workbooks': len(self._books),
+                'frames': len(self._frames),
+                'bytes': self._frame_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class SidecarCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hashes = {}  # file key -> content hash
+        self.last_error = None  # why the last store() failed
+
+    @property
+    def available(self):
+        return pa is not None
+
+    def content_hash(self, path):
+        key = file_key(path)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+            with self._lock:
+                self._hashes[key] = digest
+        return digest
+
+    def _entry_path(self, path, sheet, dtypes):
+        name = str(sheet) if dtypes == split_dtypes.DTYPES_OBJECT else f"{sheet}\0{dtypes}"
+        sheet_hash = hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{self.content_hash(path)}_{sheet_hash}{SIDECAR_EXT}")
+
+    def load(self, path, sheet, dtypes=split_dtypes.DTYPES_OBJECT):
+        if not self.available:
+            return None
+        entry = self._entry_path(path, sheet, dtypes)
+        if not os.path.exists(entry):
+            return None
+        try:
+            table = feather.read_table(entry, memory_map=True)
+            meta = json.loads((table.schema.metadata or {}).get(META_KEY, b'{}'))
+            df = decode_mixed(table.to_pandas(), meta.get('mixed', []), meta.get('mixed_categories'))
+        except (OSError, pa.ArrowException, ValueError, KeyError):
+            self._remove(entry)
+            return None
+        # Touch so eviction sees it as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return df
+
+    def store(self, path, sheet, df, dtypes=split_dtypes.DTYPES_OBJECT):
+        """Save a parsed sheet (compacted with `dtypes`). Returns False, with
+        the reason in `last_error`, when the frame can't be stored."""
+        if not self.available:
+            self.last_error = "需要安装 pyarrow"
+            return False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self._entry_path(path, sheet, dtypes)
+        try:
+            encoded, mixed, mixed_categories = encode_mixed(df)
+            table = pa.Table.from_pandas(encoded, preserve_index=False)
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            self.last_error = str(e)
+            return False
+        meta = dict(table.schema.metadata or {})
+        meta[META_KEY] = json.dumps({
+            'source': os.path.abspath(path),
+            'sheet': sheet,
+            'dtypes': dtypes,
+            'rows': len(df),
+            'mixed': mixed,
+            'mixed_categories': mixed_categories,
+            'created': time.time(),
+        }, ensure_ascii=False).encode('utf-8')
+        table = table.replace_schema_metadata(meta)
+
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            feather.write_feather(table, tmp, compression='uncompressed')
+            os.replace(tmp, entry)
+        except OSError as e:
+            self._remove(tmp)
+            self.last_error = str(e)
+            return False
+        self.evict()
+        return True
+
+    def entries(self):
+        """List cached sheets, most recently used first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        result = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(SIDECAR_EXT):
+                continue
+            entry = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(entry)
+            except OSError:
+                continue
+            info = {'file': entry, 'bytes': st.st_size, 'last_used': st.st_mtime}
+            if self.available:
+                try:
+                    with pa.memory_map(entry) as source:
+                        meta = pa.ipc.open_file(source).schema.metadata or {}
+                    info.update(json.loads(meta.get(META_KEY, b'{}')))
+                except (OSError, pa.ArrowException, ValueError):
+                    pass
+            result.append(info)
+        result.sort(key=lambda e: e['last_used'], reverse=True)
+        return result
+
+    def total_bytes(self):
+        return sum(e['bytes'] for e in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(e['bytes'] for e in entries)
+        while total > self.max_bytes and entries:
+            oldest = entries.pop()
+            self._remove(oldest['file'])
+            total -= oldest['bytes']
+
+    def clear(self):
+        for e in self.entries():
+            self._remove(e['file'])
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
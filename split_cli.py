@@ -0,0 +1,277 @@
+"""
+Excel条件拆分器 - 命令行入口
+
+Runs a split without the GUI. Conditions are the same dicts the GUI
+builds, stored as a JSON list, e.g.:
+
+    [
+        {"col": "分数", "type_id": 0, "params": {"op": ">=", "v1": 90},
+         "output_name": "优秀名单"},
+        {"col": "评语", "type_id": 1, "params": {"text": "缺勤"},
+         "output_name": "缺勤名单", "is_negate": false}
+    ]
+
+Usage:
+    python split_cli.py 测试数据.xlsx -c rules.json -o split_result.xlsx
+    python split_cli.py 测试数据.xlsx -s Sheet1 -c rules.json -d out_dir --timings -j 4
+    python split_cli.py 测试数据.xlsx -c rules.json -o out.xlsx --trace run.trace.json --trace-format chrome
+    python split_cli.py 测试数据.xlsx -c rules.json -o out.xlsx --disk-cache
+    python split_cli.py big.xlsx -c rules.json -d out_dir --dtypes arrow
+    python split_cli.py huge.xlsx -c rules.json -d out_dir --stream --chunk-rows 20000
+    python split_cli.py 测试数据.xlsx -c rules.json -d out_dir --format parquet --compression zstd
+    python split_cli.py "regions/*.xlsx" --batch -c rules.json -d out_dir -j 8
+    python split_cli.py months.xlsx --all-sheets -c rules.json -o by_rule.xlsx -j 4
+    python split_cli.py months.xlsx --sheets 一月 二月 --per-sheet -c rules.json -d out_dir
+    python split_cli.py daily.xlsx -c rules.json -d out_dir --incremental --watch
+    python split_cli.py --cache-info
+    python split_cli.py --cache-clear
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import split_dtypes
+import split_engine
+import split_incremental
+import split_trace
+import split_writers
+from split_cache import WorkbookCache, SidecarCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_DISK_BYTES
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Excel条件拆分器 (命令行)")
+    parser.add_argument('source', nargs='?', help="源Excel文件")
+    parser.add_argument('-s', '--sheet', help="工作表名称 (默认第一个工作表)")
+    parser.add_argument('-c', '--conditions', help="条件JSON文件")
+    out = parser.add_mutually_exclusive_group()
+    out.add_argument('-o', '--output', help="合并为一个Excel文件 (不同Sheet)")
+    out.add_argument('-d', '--output-dir', help="拆分为多个独立Excel文件的保存目录")
+    parser.add_argument('--timings', action='store_true', help="输出各阶段耗时及内存峰值")
+    parser.add_argument('--trace', help="将各阶段耗时/行数/内存峰值保存到文件")
+    parser.add_argument('--trace-format', choices=[split_trace.FORMAT_JSON, split_trace.FORMAT_CHROME],
+                        default=split_trace.FORMAT_JSON, help="跟踪文件格式 (chrome 可在 chrome://tracing 或 Perfetto 中查看)")
+    parser.add_argument('--writer', choices=split_writers.available_backends(),
+                        default=split_writers.default_backend(), help="xlsx写入引擎")
+    parser.add_argument('--format', choices=split_writers.available_formats(), default=split_writers.FORMAT_XLSX,
+                        help="输出格式 (csv/parquet/feather 仅用于 -d 多文件输出)")
+    parser.add_argument('--compression', choices=split_writers.PARQUET_COMPRESSIONS, default='snappy',
+                        help="Parquet压缩方式")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="多文件模式下并行写入的进程数 (批量模式下为并行处理的工作簿数, 多工作表模式下也用于并行解析工作表)")
+    parser.add_argument('--exclusive', action='store_true',
+                        help="互斥路由: 每行只进入第一个匹配的条件, 未匹配的行输出到“未匹配”")
+    parser.add_argument('--dtypes', choices=split_dtypes.available_modes(), default=split_dtypes.DTYPES_COMPACT,
+                        help="读取后的列类型: compact 低基数文本转分类编码、数值降位; arrow 另将其余文本存为Arrow字符串; object 保持原样")
+    parser.add_argument('--stream', action='store_true', help="流式处理: 分块读取并直接写出 (仅.xlsx)")
+    parser.add_argument('--chunk-rows', type=int, default=split_engine.DEFAULT_CHUNK_ROWS,
+                        help="流式处理时每块的行数")
+
+    multi = parser.add_argument_group("多工作表 (结构相同的多个工作表)")
+    multi.add_argument('--all-sheets', action='store_true', help="拆分工作簿中的所有工作表 (-j 为并行解析的进程数)")
+    multi.add_argument('--sheets', nargs='+', metavar='SHEET', help="拆分指定的多个工作表")
+    multi.add_argument('--per-sheet', action='store_true',
+                       help="每个工作表单独输出 (“工作表_输出名”); 默认将各工作表的同名输出合并")
+
+    inc = parser.add_argument_group("增量模式 (源文件只在末尾追加行时)")
+    inc.add_argument('--incremental', action='store_true',
+                     help="只处理上次运行后新增的行并追加到已有结果; 源文件和条件都未变化时跳过")
+    inc.add_argument('--manifest', help="清单文件 (默认在输出文件旁/输出目录内)")
+    inc.add_argument('--watch', action='store_true', help="监视源文件, 每次变化后自动增量拆分 (Ctrl+C 退出)")
+    inc.add_argument('--watch-interval', type=float, default=2.0, help="监视时的检查间隔 (秒)")
+
+    batch = parser.add_argument_group("批量模式")
+    batch.add_argument('--batch', action='store_true',
+                       help="源为目录或通配符, 对每个工作簿应用同一组条件 (需要 -d, -j 为并行进程数)")
+    batch.add_argument('--multi-files', action='store_true',
+                       help="批量模式下每个工作簿拆分为多个独立文件 (默认每个工作簿输出一个合并文件)")
+
+    cache = parser.add_argument_group("磁盘缓存 (需要 pyarrow)")
+    cache.add_argument('--disk-cache', action='store_true', help="读取时使用/写入磁盘缓存")
+    cache.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="缓存目录")
+    cache.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_DISK_BYTES // (1024 * 1024),
+                       help="缓存容量上限 (MB)")
+    cache.add_argument('--cache-info', action='store_true', help="列出缓存内容后退出")
+    cache.add_argument('--cache-clear', action='store_true', help="清空缓存后退出")
+    return parser
+
+
+def print_cache_info(sidecar):
+    entries = sidecar.entries()
+    total = 0
+    for e in entries:
+        total += e['bytes']
+        used = datetime.datetime.fromtimestamp(e['last_used']).strftime('%Y-%m-%d %H:%M')
+        print(f"{e['bytes'] / 1024 / 1024:9.1f} MB  {used}  {e.get('source', '?')} [{e.get('sheet', '?')}]")
+    print(f"共 {len(entries)} 项, {total / 1024 / 1024:.1f} MB / {sidecar.max_bytes / 1024 / 1024:.0f} MB ({sidecar.cache_dir})")
+
+
+def run_batch(args, conditions, routing):
+    if not args.output_dir:
+        print("批量模式需要 -d/--output-dir", file=sys.stderr)
+        return 2
+    sources = split_engine.collect_sources(args.source)
+    if not sources:
+        print(f"没有找到Excel文件: {args.source}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    mode = split_engine.MODE_MULTI_FILES if args.multi_files else split_engine.MODE_SINGLE_FILE
+
+    def on_file(path, written, error):
+        if error:
+            print(f"[失败] {path}: {error}", file=sys.stderr)
+        else:
+            print(f"[完成] {path} -> {len(written)} 个文件")
+
+    t0 = time.perf_counter()
+    outcome = split_engine.run_batch(sources, args.sheet, conditions, mode, args.output_dir,
+                                     workers=args.jobs, on_file=on_file, backend=args.writer,
+                                     routing=routing, fmt=args.format, compression=args.compression,
+                                     dtypes=args.dtypes)
+    failed = sum(1 for _, error in outcome.values() if error)
+    print(f"共 {len(outcome)} 个工作簿, 失败 {failed} 个")
+    if args.timings:
+        print(f"   batch: {time.perf_counter() - t0:.3f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    sidecar = SidecarCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    if args.cache_info or args.cache_clear:
+        if args.cache_clear:
+            sidecar.clear()
+        print_cache_info(sidecar)
+        return 0
+
+    if not args.source or not args.conditions or not (args.output or args.output_dir):
+        parser.error("需要指定源文件、-c/--conditions 以及 -o/--output 或 -d/--output-dir")
+    if args.format != split_writers.FORMAT_XLSX and (args.output or (args.batch and not args.multi_files)):
+        parser.error("csv/parquet/feather 格式只能拆分为多个独立文件 (-d，批量模式需加 --multi-files)")
+    if args.disk_cache and not sidecar.available:
+        parser.error("--disk-cache 需要安装 pyarrow")
+    cache = WorkbookCache(sidecar=sidecar) if args.disk_cache else None
+    conditions = split_engine.load_conditions(args.conditions)
+    routing = split_engine.ROUTING_FIRST if args.exclusive else split_engine.ROUTING_ALL
+
+    if args.batch:
+        return run_batch(args, conditions, routing)
+
+    if args.all_sheets or args.sheets:
+        if args.stream or args.incremental or args.watch:
+            parser.error("多工作表模式不能与 --stream 或增量模式同时使用")
+        return run_sheets(args, cache, conditions, routing)
+
+    sheet = args.sheet
+    if sheet is None:
+        sheet = split_engine.list_sheets(args.source)[0]
+
+    if args.output:
+        mode, output = split_engine.MODE_SINGLE_FILE, args.output
+    else:
+        mode, output = split_engine.MODE_MULTI_FILES, args.output_dir
+        os.makedirs(output, exist_ok=True)
+
+    if args.incremental or args.watch:
+        if args.stream or args.batch:
+            parser.error("增量模式不能与 --stream 或 --batch 同时使用")
+        return run_incremental(args, sheet, mode, output, cache, conditions, routing)
+
+    tracer = split_trace.Tracer() if (args.timings or args.trace) else None
+    try:
+        return split(args, sheet, mode, output, cache, conditions, routing, tracer)
+    finally:
+        report_trace(args, tracer)
+
+
+def run_sheets(args, cache, conditions, routing):
+    if args.output:
+        mode, output = split_engine.MODE_SINGLE_FILE, args.output
+    else:
+        mode, output = split_engine.MODE_MULTI_FILES, args.output_dir
+        os.makedirs(output, exist_ok=True)
+    combine = split_engine.SHEETS_SEPARATE if args.per_sheet else split_engine.SHEETS_COMBINE
+    tracer = split_trace.Tracer() if (args.timings or args.trace) else None
+    try:
+        written = split_engine.split_sheets(args.source, None if args.all_sheets else args.sheets, conditions,
+                                            mode, output, combine, workers=args.jobs, cache=cache,
+                                            backend=args.writer, routing=routing, tracer=tracer,
+                                            fmt=args.format, compression=args.compression,
+                                            dtypes=args.dtypes)
+    finally:
+        report_trace(args, tracer)
+    if not written:
+        print("没有数据符合任何条件")
+        return 1
+    for fname in written:
+        print(fname)
+    return 0
+
+
+def report_trace(args, tracer):
+    if tracer is not None:
+        if args.timings:
+            print("\n".join(tracer.summary(limit=20)), file=sys.stderr)
+        if args.trace:
+            tracer.save(args.trace, args.trace_format)
+
+
+def run_incremental(args, sheet, mode, output, cache, conditions, routing):
+    if mode == split_engine.MODE_MULTI_FILES:
+        os.makedirs(output, exist_ok=True)
+
+    def once():
+        tracer = split_trace.Tracer() if (args.timings or args.trace) else None
+        try:
+            status, written = split_incremental.incremental_split(
+                args.source, sheet, conditions, mode, output, args.manifest, cache=cache,
+                backend=args.writer, workers=args.jobs, routing=routing, tracer=tracer,
+                fmt=args.format, compression=args.compression, dtypes=args.dtypes)
+        finally:
+            report_trace(args, tracer)
+        print(f"[{time.strftime('%H:%M:%S')}] {split_incremental.STATUS_LABELS[status]}")
+        for fname in written:
+            print(fname)
+
+    once()
+    if not args.watch:
+        return 0
+
+    def on_change():
+        try:
+            once()
+        except Exception as e:
+            # Keep watching; the next save may fix it
+            print(f"[{time.strftime('%H:%M:%S')}] 拆分失败: {e}", file=sys.stderr)
+
+    print(f"正在监视 {args.source} (Ctrl+C 退出)")
+    try:
+        split_incremental.watch(args.source, on_change, args.watch_interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def split(args, sheet, mode, output, cache, conditions, routing, tracer):
+    if args.stream:
+        written = split_engine.stream_split(args.source, sheet, conditions, mode, output, args.chunk_rows,
+                                            backend=args.writer, routing=routing, tracer=tracer,
+                                            fmt=args.format, compression=args.compression)
+    else:
+        written = split_engine.run_split(args.source, sheet, conditions, mode, output, cache=cache,
+                                         backend=args.writer, workers=args.jobs, routing=routing,
+                                         tracer=tracer, fmt=args.format, compression=args.compression,
+                                         dtypes=args.dtypes)
+    if not written:
+        print("没有数据符合任何条件")
+        return 1
+    for fname in written:
+        print(fname)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Excel条件拆分器 - 列类型压缩
+
+A parsed sheet keeps text as one Python string per cell (object dtype; on
+pandas 3 plain text columns are Arrow strings already) and every number
+as 64 bits. compact_frame shrinks it right after parsing:
+
+- text and mixed columns with few distinct values (班级, 评语, a score
+  column with the odd "缺考") become categoricals: a small integer code
+  per row plus each distinct value once. Text rules then test every
+  distinct value once instead of every row (ColumnViews.expand), and
+  copying rows out only moves the codes.
+- integer columns are downcast to the smallest integer type that holds
+  them, and float columns to float32 when every value survives the
+  round trip exactly.
+- DTYPES_ARROW additionally stores the remaining text columns as Arrow
+  strings (needs pyarrow), which the Arrow text kernels read without a
+  conversion.
+
+Cell values are unchanged, only their storage. ColumnViews widens
+downcast numbers again before comparing them, so thresholds compare
+exactly as before.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from split_options import (DTYPES_OBJECT, DTYPES_COMPACT, DTYPES_ARROW, DTYPES_LABELS,  # noqa: F401
+                           available_modes)
+
+# A text column becomes categorical when it has at most this many
+# distinct values per row
+CATEGORY_MAX_RATIO = 0.5
+# Columns longer than this are first checked on a sample, so that unique
+# columns (names, IDs) aren't factorized in full for nothing
+CATEGORY_SAMPLE_ROWS = 20000
+
+
+def is_text(dtype):
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+
+def is_arrow_text(dtype):
+    return isinstance(dtype, pd.StringDtype) and dtype.storage in ('pyarrow', 'pyarrow_numpy')
+
+
+def arrow_text_dtype():
+    # Arrow storage with NaN for missing values, like the other columns
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)  # pandas 3
+    except TypeError:
+        return pd.StringDtype('pyarrow_numpy')
+
+
+def sorted_codes(values):
+    """pd.factorize with the distinct values sorted, or in first-seen order
+    when they can't be ordered (numbers mixed with text)."""
+    try:
+        return pd.factorize(values, sort=True)
+    except TypeError:
+        return pd.factorize(values)
+
+
+def to_categorical(series, max_ratio=CATEGORY_MAX_RATIO):
+    """Categorical version of a text column, or None when it has too many
+    distinct values for the codes to pay off."""
+    if len(series) > CATEGORY_SAMPLE_ROWS:
+        sample = series.iloc[:CATEGORY_SAMPLE_ROWS]
+        if sample.nunique() > max_ratio * len(sample):
+            return None
+    codes, uniques = sorted_codes(series)
+    if len(uniques) > max_ratio * len(series):
+        return None
+    return pd.Series(pd.Categorical.from_codes(codes, uniques), index=series.index, name=series.name)
+
+
+def downcast(series):
+    """Smallest numeric dtype that holds every value exactly, or None."""
+    kind = series.dtype.kind
+    if kind == 'i':
+        result = pd.to_numeric(series, downcast='integer')
+    elif kind == 'u':
+        result = pd.to_numeric(series, downcast='unsigned')
+    elif kind == 'f' and series.dtype.itemsize > 4:
+        values = series.to_numpy()
+        with np.errstate(over='ignore'):
+            narrow = values.astype(np.float32)
+        if not np.array_equal(narrow.astype(values.dtype), values, equal_nan=True):
+            return None
+        result = pd.Series(narrow, index=series.index, name=series.name)
+    else:
+        return None
+    return result if result.dtype != series.dtype else None
+
+
+def widen(series):
+    """Undo downcast() for comparisons: 64-bit numbers compare against the
+    (64-bit) thresholds of the rules without rounding them."""
+    kind = series.dtype.kind
+    if kind in 'iu' and series.dtype.itemsize < 8:
+        return series.astype(np.int64 if kind == 'i' else np.uint64)
+    if kind == 'f' and series.dtype.itemsize < 8:
+        return series.astype(np.float64)
+    return series
+
+
+def common_dtype(dtypes):
+    """One dtype for a column compacted separately in several frames (the
+    parts of one output taken from several sheets), or None when they
+    already agree. Numbers are widened, categoricals get the union of
+    their categories, anything else falls back to object."""
+    first = dtypes[0]
+    if all(d == first for d in dtypes[1:]):
+        return None
+    if all(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+        categories = pd.Index(first.categories).append([pd.Index(d.categories) for d in dtypes[1:]])
+        return pd.CategoricalDtype(categories.unique())
+    if all(isinstance(d, np.dtype) and d.kind in 'iuf' for d in dtypes):
+        return np.result_type(*[widen(pd.Series([], dtype=d)).dtype for d in dtypes])
+    return np.dtype(object)
+
+
+def compact_column(series, dtypes=DTYPES_COMPACT):
+    """Compacted column, or None when it is best left as it is."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return None
+    if is_text(dtype):
+        result = to_categorical(series)
+        if (result is None and dtypes == DTYPES_ARROW and pa is not None and not is_arrow_text(dtype)
+                # astype would turn numbers mixed into the text into strings
+                and pd.api.types.infer_dtype(series, skipna=True) == 'string'):
+            result = series.astype(arrow_text_dtype())
+        return result
+    if dtype.kind in 'iuf':
+        return downcast(series)
+    return None
+
+
+def compact_frame(df, dtypes=DTYPES_COMPACT):
+    """Copy of `df` with compacted columns (see the module docstring). The
+    input frame is not modified, so shared (cached) frames can be passed."""
+    if dtypes == DTYPES_OBJECT or df.empty:
+        return df
+    out = None
+    for i in range(df.shape[1]):
+        column = compact_column(df.iloc[:, i], dtypes)
+        if column is None:
+            continue
+        if out is None:
+            out = df.copy(deep=False)
+        out.isetitem(i, column)
+    return df if out is None else out
@@ -0,0 +1,1322 @@
+"""
+Excel条件拆分器 - 拆分引擎
+
+GUI-free split logic shared by the desktop app (main.py) and the
+command-line entry point (split_cli.py).
+
+Typical use:
+    df = load_source(path, sheet)
+    plan = compile_plan(conditions, df.columns)
+    results = execute_plan(df, plan)
+    write_results(results, MODE_SINGLE_FILE, "split_result.xlsx")
+
+Results hold row indices into `df`, not copies of the rows; the rows are
+pulled from `df` in slices while each output is written.
+
+load_source compacts the parsed sheet (split_dtypes): low-cardinality text
+columns become categoricals, which text rules evaluate once per distinct
+value, and numbers are stored in the smallest exact dtype.
+
+`conditions` is the list of condition dicts built by
+ExcelSplitterApp.add_condition (keys: col, type_id, params,
+output_name, is_negate).
+
+For sheets that don't fit in memory, stream_split reads the sheet in
+bounded chunks and appends matching rows straight to per-output writers.
+split_sheets applies one condition set to several sheets of a workbook,
+parsing them in parallel, and run_batch to many workbooks on a process
+pool.
+MatchPreview counts the rows each condition matches while the list is
+being edited.
+"""
+import glob
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr  # noqa: F401
+    EVAL_ENGINE = 'numexpr'
+except ImportError:
+    EVAL_ENGINE = 'python'
+# Inputs numexpr accepts in one expression (numpy's NPY_MAXARGS is 32 before numpy 2)
+MAX_EVAL_INPUTS = 31
+
+import split_dtypes
+import split_match
+import split_trace
+from split_dtypes import DTYPES_COMPACT
+from split_options import (ROUTING_ALL, ROUTING_FIRST, MODE_SINGLE_FILE, MODE_MULTI_FILES,  # noqa: F401
+                           SHEETS_COMBINE, SHEETS_SEPARATE)
+from split_writers import open_book, FORMAT_XLSX, FORMAT_EXTENSIONS
+
+# Condition type ids (same ids as the type radio buttons in main.py)
+TYPE_NUMERIC = 0
+TYPE_TEXT = 1
+TYPE_REGEX = 2
+TYPE_DISTINCT = 3  # one output per distinct value of the column
+TYPE_BANDS = 4     # one output per numeric band between cut points
+TYPE_COMPOUND = 5  # AND/OR tree over numeric/text/regex conditions
+
+COMPOUND_OPS = {'and': '&', 'or': '|'}
+NUMERIC_OPS = ('>=', '>', '<=', '<', '==')
+
+# Output name for rows whose value is empty in a TYPE_DISTINCT split
+MISSING_VALUE_NAME = "空值"
+
+# Output for rows no condition matched (ROUTING_FIRST only)
+UNMATCHED_NAME = "未匹配"
+
+READ_ENGINE = 'calamine'
+
+DEFAULT_CHUNK_ROWS = 50000
+# Rows pulled from the source per append when writing an output
+WRITE_SLICE_ROWS = 50000
+
+# Larger sheets are previewed on a random sample of this many rows
+PREVIEW_MAX_ROWS = 200000
+PREVIEW_MAX_MASKS = 256
+
+
+class SplitCancelled(Exception):
+    """Raised when a split is cancelled between outputs."""
+
+
+def _report(progress, phase, done, total):
+    if progress is not None:
+        progress(phase, done, total)
+
+
+def _check_cancelled(cancelled):
+    if cancelled is not None and cancelled():
+        raise SplitCancelled()
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_conditions(path):
+    with open(path, encoding='utf-8') as f:
+        conditions = json.load(f)
+    if not isinstance(conditions, list):
+        raise ValueError("条件文件必须是JSON列表")
+    return conditions
+
+
+def save_conditions(conditions, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(conditions, f, ensure_ascii=False, indent=2)
+
+
+def list_sheets(path):
+    xl = pd.ExcelFile(path, engine=READ_ENGINE)
+    return xl.sheet_names
+
+
+def read_columns(path, sheet):
+    # Read only headers
+    df = pd.read_excel(path, sheet_name=sheet, nrows=0, engine=READ_ENGINE)
+    return [str(c) for c in df.columns]
+
+
+def load_source(path, sheet, cache=None, tracer=None, dtypes=DTYPES_COMPACT):
+    """Parse a sheet, going through `cache` (a split_cache.WorkbookCache)
+    when one is given, and compact its columns as `dtypes` says
+    (split_dtypes.DTYPES_*). The returned frame may be shared; don't
+    modify it."""
+    if cache is not None:
+        with split_trace.span(tracer, 'parse', 'read', sheet=sheet, cached=True) as span:
+            df = cache.frame(path, sheet, dtypes)
+            span['rows'] = len(df)
+        return df
+    with split_trace.span(tracer, 'open', 'read', file=os.path.basename(path)):
+        xl = pd.ExcelFile(path, engine=READ_ENGINE)
+    try:
+        with split_trace.span(tracer, 'parse', 'read', sheet=sheet) as span:
+            df = xl.parse(sheet)
+            span['rows'] = len(df)
+    finally:
+        xl.close()
+    with split_trace.span(tracer, 'compact', 'read', dtypes=dtypes) as span:
+        df = split_dtypes.compact_frame(df, dtypes)
+        span['rows'] = len(df)
+    return df
+
+
+class ColumnViews:
+    """Derived column representations shared by all rules of one run.
+
+    Ten score bands on the same column coerce it to numbers once, and ten
+    keyword rules on the same column stringify it once. Create one per
+    run (or per chunk) and call clear() when done.
+
+    When `plan` is given, columns with many text rules are registered for
+    the single-pass keyword scan (split_match.keyword_hits).
+
+    For categorical columns the text views hold one entry per category
+    (plus a last one for missing values) rather than one per row; masks
+    computed on them are mapped back to rows with expand()."""
+
+    def __init__(self, df, plan=None):
+        self.df = df
+        self._numeric = {}
+        self._text = {}
+        self._lower = {}
+        self._arrow = {}
+        self._codes = {}         # categorical column -> row codes into its text view
+        self._keyword_sets = {}  # (col, ignore_case) -> keywords
+        self._keyword_hits = {}
+        self._range_sets = {}    # col -> sorted disjoint [(lo, hi)]
+        self._range_hits = {}
+        if plan is not None:
+            self._register_keywords(plan)
+            self._register_ranges(plan)
+
+    def _register_keywords(self, plan):
+        groups = {}
+        for rule in plan:
+            if rule.type_id == TYPE_TEXT:
+                ignore_case = bool(rule.params.get('ignore_case'))
+                text = rule.params['text']
+                groups.setdefault((rule.col, ignore_case), []).append(text.lower() if ignore_case else text)
+        for key, keywords in groups.items():
+            if len(keywords) >= split_match.MULTI_KEYWORD_MIN:
+                self._keyword_sets[key] = keywords
+
+    def _register_ranges(self, plan):
+        groups = {}
+        for rule in plan:
+            if rule.type_id == TYPE_NUMERIC and rule.params['op'] == 'range' and not rule.negate:
+                groups.setdefault(rule.col, set()).add(rule.range_bounds())
+        for col, bounds in groups.items():
+            bounds = sorted(bounds)
+            disjoint = all(hi < next_lo for (_, hi), (next_lo, _) in zip(bounds[:-1], bounds[1:]))
+            if len(bounds) >= 2 and disjoint:
+                self._range_sets[col] = bounds
+
+    def range_positions(self, col, lo, hi):
+        """Row positions in [lo, hi] from one binary search over all range
+        rules on `col`, or None if `col` isn't batched."""
+        if col not in self._range_sets:
+            return None
+        bounds = self._range_sets[col]
+        if col not in self._range_hits:
+            values = self.numeric(col).to_numpy(dtype=float, na_value=np.nan)
+            lows = np.array([b[0] for b in bounds], dtype=float)
+            highs = np.array([b[1] for b in bounds], dtype=float)
+            idx = np.searchsorted(lows, values, side='right') - 1
+            inside = (idx >= 0) & (values <= highs[idx.clip(0)])
+            codes = np.where(inside, idx, -1)
+            self._range_hits[col] = positions_by_code(codes, len(bounds))[0]
+        return self._range_hits[col][bounds.index((lo, hi))]
+
+    def keyword_mask(self, col, text, ignore_case):
+        """Mask from the batched keyword scan, or None if `col` isn't batched."""
+        key = (col, bool(ignore_case))
+        if key not in self._keyword_sets:
+            return None
+        if key not in self._keyword_hits:
+            series = self.lower(col) if ignore_case else self.text(col)
+            self._keyword_hits[key] = split_match.keyword_hits(series, self._keyword_sets[key])
+        return self._keyword_hits[key].mask(text.lower() if ignore_case else text)
+
+    def _categories(self, col):
+        """Categories of a categorical column followed by a missing value,
+        or None for other columns. Row codes go to self._codes."""
+        series = self.df[col]
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            return None
+        codes = series.cat.codes.to_numpy()
+        # Code -1 (missing) picks the trailing missing value
+        self._codes[col] = np.where(codes < 0, len(series.cat.categories), codes)
+        return pd.Series(list(series.cat.categories) + [np.nan], dtype=object)
+
+    def expand(self, col, mask):
+        """Row mask from a mask over the text view of `col`."""
+        codes = self._codes.get(col)
+        if codes is None:
+            return mask
+        return np.asarray(mask, dtype=bool)[codes]
+
+    def numeric(self, col):
+        if col not in self._numeric:
+            categories = self._categories(col)
+            if categories is None:
+                self._numeric[col] = split_dtypes.widen(pd.to_numeric(self.df[col], errors='coerce'))
+            else:
+                values = pd.to_numeric(categories, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                self._numeric[col] = pd.Series(values[self._codes[col]], index=self.df.index)
+        return self._numeric[col]
+
+    def text(self, col):
+        if col not in self._text:
+            series = self._categories(col)
+            if series is None:
+                series = self.df[col]
+            if not split_dtypes.is_arrow_text(series.dtype):
+                series = series.astype(str)
+            self._text[col] = series
+        return self._text[col]
+
+    def lower(self, col):
+        if col not in self._lower:
+            self._lower[col] = self.text(col).str.lower()
+        return self._lower[col]
+
+    def arrow(self, col):
+        """Arrow form of the string view, or None when Arrow isn't worth it."""
+        if col not in self._arrow:
+            series = self.text(col)
+            self._arrow[col] = split_match.to_arrow(series) if split_match.arrow_enabled(series) else None
+        return self._arrow[col]
+
+    def clear(self):
+        self._numeric.clear()
+        self._text.clear()
+        self._lower.clear()
+        self._arrow.clear()
+        self._codes.clear()
+        self._keyword_hits.clear()
+        self._range_hits.clear()
+        self.df = None
+
+
+def value_label(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def positions_by_code(codes, n):
+    """Row positions for each code 0..n-1 from one stable sort of `codes`.
+    Rows with code -1 are returned separately. Returns (per_code, missing)."""
+    order = np.argsort(codes, kind='stable')
+    # Shift by one so code -1 gets bucket 0
+    bounds = np.cumsum(np.bincount(codes + 1, minlength=n + 1))
+    per_code = [order[bounds[code]:bounds[code + 1]] for code in range(n)]
+    return per_code, order[:bounds[0]]
+
+
+def group_positions(series):
+    """Row positions of every distinct value in one factorize + stable sort
+    pass. Returns [(value, positions)] in value order, missing values last
+    with value None."""
+    codes, uniques = split_dtypes.sorted_codes(series)
+    per_code, missing = positions_by_code(codes, len(uniques))
+    groups = list(zip(uniques, per_code))
+    if len(missing):
+        groups.append((None, missing))
+    return groups
+
+
+def band_codes(values, cuts):
+    """Band index of every value for sorted `cuts` in one binary search:
+    0 is below cuts[0], i is [cuts[i-1], cuts[i]), len(cuts) is at or above
+    the last cut, and -1 is not a number."""
+    codes = np.searchsorted(cuts, values, side='right')
+    codes[np.isnan(values)] = -1
+    return codes
+
+
+def band_labels(cuts):
+    # Used as file names too, so no "<" or ">=" (sanitize_filename drops them)
+    labels = [f"{value_label(cuts[0])}以下"]
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        labels.append(f"{value_label(lo)}-{value_label(hi)}")
+    labels.append(f"{value_label(cuts[-1])}及以上")
+    return labels
+
+
+def condition_columns(cond):
+    """Every column a condition reads (compound conditions read several)."""
+    if cond['type_id'] == TYPE_COMPOUND:
+        cols = []
+        for child in cond['params']['children']:
+            cols.extend(c for c in condition_columns(child) if c not in cols)
+        return cols
+    return [cond['col']]
+
+
+class CompoundExpr:
+    """An AND/OR/NOT tree of conditions compiled into one expression.
+
+    Numeric leaves become comparisons on the coerced column inside the
+    expression, so numexpr evaluates them together in one multi-threaded
+    pass without a temporary mask per comparison. Text and regex leaves
+    can't be expressed there; they are evaluated by their own rule (through
+    the shared ColumnViews), and the text/regex children of each AND/OR
+    node are combined into one bool array before entering the expression,
+    since numexpr takes a limited number of inputs (keyword lists run to
+    hundreds of leaves)."""
+
+    def __init__(self, cond):
+        self.columns = {}  # column -> variable name
+        self.masks = {}    # variable name -> (op, [CompiledRule]) combined with 'and'/'or'
+        self.constants = {}  # variable name -> non-finite threshold
+        self.expr = self._compile(cond)
+
+    def rules(self):
+        """The text/regex leaf rules."""
+        return [rule for _, rules in self.masks.values() for rule in rules]
+
+    def _mask_var(self, op, rules):
+        var = f"b{len(self.masks)}"
+        self.masks[var] = (op, rules)
+        return var
+
+    def _column_var(self, col):
+        if col not in self.columns:
+            self.columns[col] = f"n{len(self.columns)}"
+        return self.columns[col]
+
+    def _constant(self, value):
+        value = float(value)
+        if np.isfinite(value):
+            return repr(value)
+        # pd.eval has no names for inf and nan: pass them in as variables
+        var = f"c{len(self.constants)}"
+        self.constants[var] = value
+        return var
+
+    def _compile(self, cond):
+        t_id = cond['type_id']
+        if t_id == TYPE_COMPOUND:
+            op_name = cond['params']['op']
+            op = COMPOUND_OPS[op_name]
+            children = cond['params']['children']
+            if not children:
+                raise ValueError("组合条件至少需要一个子条件")
+            leaves = [CompiledRule(c) for c in children if c['type_id'] in (TYPE_TEXT, TYPE_REGEX)]
+            parts = [self._compile(c) for c in children if c['type_id'] not in (TYPE_TEXT, TYPE_REGEX)]
+            if leaves:
+                parts.append(self._mask_var(op_name, leaves))
+            expr = f" {op} ".join(parts)
+        elif t_id == TYPE_NUMERIC:
+            params = cond['params']
+            var = self._column_var(cond['col'])
+            if params['op'] == 'range':
+                mn = self._constant(min(params['v1'], params['v2']))
+                mx = self._constant(max(params['v1'], params['v2']))
+                expr = f"({var} >= {mn}) & ({var} <= {mx})"
+            elif params['op'] in NUMERIC_OPS:
+                expr = f"{var} {params['op']} {self._constant(params['v1'])}"
+            else:
+                raise ValueError(f"未知的数值关系: {params['op']}")
+        elif t_id in (TYPE_TEXT, TYPE_REGEX):
+            # The leaf rule applies its own negation
+            return self._mask_var('and', [CompiledRule(cond)])
+        else:
+            raise ValueError("组合条件只能包含数值范围、文本包含、正则表达式条件")
+        if cond.get('is_negate', False):
+            return f"~({expr})"
+        return f"({expr})"
+
+    def evaluate(self, df, views):
+        env = {var: views.numeric(col).to_numpy(dtype=float, na_value=np.nan)
+               for col, var in self.columns.items()}
+        env.update(self.constants)
+        for var, (op, rules) in self.masks.items():
+            combine = np.logical_and if op == 'and' else np.logical_or
+            mask = np.array(rules[0].evaluate(df, views), dtype=bool)
+            for rule in rules[1:]:
+                combine(mask, rule.evaluate(df, views), out=mask)
+            env[var] = mask
+        # Deeply nested trees can still exceed numexpr's input limit
+        engine = EVAL_ENGINE if len(env) <= MAX_EVAL_INPUTS else 'python'
+        return np.asarray(pd.eval(self.expr, local_dict=env, engine=engine), dtype=bool)
+
+
+def _selected(df, sel):
+    # sel is a bool mask or an array of row positions
+    return df.iloc[sel]
+
+
+class RowSelection:
+    """The rows of one output, kept as positions into the source frame.
+
+    Sparse selections are stored as int32 positions (4 bytes per selected
+    row); dense ones as a bitmap (1 bit per source row), whichever is
+    smaller. Rows are copied out only in slices of `slice_rows` while the
+    output is written, and release() drops the selection once it has
+    been."""
+
+    def __init__(self, df, sel):
+        self.df = df
+        n = len(df)
+        if sel.dtype == bool:
+            count = int(np.count_nonzero(sel))
+        else:
+            count = len(sel)
+        self.count = count
+        self.columns = df.columns
+        if count * 32 > n:
+            self.bits = np.packbits(_as_mask(sel, n))
+            self.positions = None
+        else:
+            self.bits = None
+            positions = np.flatnonzero(sel) if sel.dtype == bool else sel
+            self.positions = positions.astype(np.int32 if n < 2 ** 31 else np.int64, copy=False)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def empty(self):
+        return self.count == 0
+
+    @property
+    def nbytes(self):
+        return (self.bits if self.bits is not None else self.positions).nbytes
+
+    def slices(self, slice_rows=WRITE_SLICE_ROWS):
+        """Yield the selected rows as DataFrames of at most `slice_rows` rows,
+        in source order."""
+        if self.positions is not None:
+            for start in range(0, len(self.positions), slice_rows):
+                yield self.df.iloc[self.positions[start:start + slice_rows]]
+            return
+        n = len(self.df)
+        # Bitmap windows are byte aligned; each covers slice_rows source rows
+        step = max(slice_rows // 8, 1) * 8
+        for start in range(0, n, step):
+            stop = min(start + step, n)
+            window = np.unpackbits(self.bits[start // 8:(stop + 7) // 8], count=stop - start)
+            positions = np.flatnonzero(window)
+            if len(positions):
+                yield self.df.iloc[positions + start]
+
+    def frame(self):
+        """All selected rows as one DataFrame."""
+        if self.positions is not None:
+            return self.df.iloc[self.positions]
+        return self.df.iloc[np.flatnonzero(np.unpackbits(self.bits, count=len(self.df)))]
+
+    def release(self):
+        self.df = None
+        self.bits = None
+        self.positions = None
+
+
+class ResultChain:
+    """One output made of several parts (RowSelections or DataFrames), e.g.
+    the matches of the same condition on several sheets, written one
+    after the other."""
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.columns = self.parts[0].columns
+        # Sheets whose columns differ are aligned by one concat instead
+        self.uniform = all(list(p.columns) == list(self.columns) for p in self.parts)
+        if not self.uniform:
+            columns = list(self.columns)
+            for part in self.parts:
+                columns.extend(c for c in part.columns if c not in columns)
+            self.columns = pd.Index(columns)
+        # Each sheet is compacted on its own, so a column can be int8 in one
+        # part and int16 in the next, or categorical with other categories;
+        # writers that fix the schema on the first slice (Arrow) need one
+        # dtype per column. Position -> common dtype, for columns that differ
+        self.casts = {}
+        if self.uniform:
+            dtypes = [list(_result_dtypes(p)) for p in self.parts]
+            for i in range(len(self.columns)):
+                dtype = split_dtypes.common_dtype([d[i] for d in dtypes])
+                if dtype is not None:
+                    self.casts[i] = dtype
+
+    def __len__(self):
+        return sum(len(p) for p in self.parts)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def slices(self):
+        if not self.uniform:
+            yield self.frame()
+            return
+        for part in self.parts:
+            for frame in _result_slices(part):
+                if self.casts:
+                    frame = frame.copy(deep=False)
+                    for i, dtype in self.casts.items():
+                        frame.isetitem(i, frame.iloc[:, i].astype(dtype))
+                yield frame
+
+    def frame(self):
+        return pd.concat([_result_frame(p) for p in self.parts], ignore_index=True)
+
+    def release(self):
+        for part in self.parts:
+            _release(part)
+        self.parts = []
+
+
+def _result_slices(result):
+    # Results are RowSelections or ResultChains; plain DataFrames are accepted too
+    if isinstance(result, (RowSelection, ResultChain)):
+        return result.slices()
+    return [result]
+
+
+def _result_dtypes(result):
+    return result.df.dtypes if isinstance(result, RowSelection) else result.dtypes
+
+
+def _result_frame(result):
+    return result.frame() if isinstance(result, (RowSelection, ResultChain)) else result
+
+
+def _release(result):
+    if isinstance(result, (RowSelection, ResultChain)):
+        result.release()
+
+
+class CompiledRule:
+    """One condition dict resolved into an evaluable rule."""
+
+    def __init__(self, cond):
+        self.col = cond['col']
+        self.type_id = cond['type_id']
+        self.params = cond['params']
+        self.negate = cond.get('is_negate', False)
+        self.output_name = cond.get('output_name', '')
+        self.regex = None
+        if self.type_id == TYPE_REGEX:
+            self.regex = split_match.compile_regex(self.params['pattern'])
+        self.compound = None
+        if self.type_id == TYPE_COMPOUND:
+            self.compound = CompoundExpr({'type_id': TYPE_COMPOUND, 'params': self.params})
+        self.cuts = None
+        if self.type_id == TYPE_BANDS:
+            self.cuts = np.array(sorted(set(float(c) for c in self.params['cuts'])), dtype=float)
+            if not len(self.cuts):
+                raise ValueError(f"'{self.col}' 的分段条件缺少分段点")
+
+    def range_bounds(self):
+        return (min(self.params['v1'], self.params['v2']), max(self.params['v1'], self.params['v2']))
+
+    def evaluate(self, df, views=None):
+        if views is None:
+            views = ColumnViews(df)
+        params = self.params
+        mask = None
+
+        if self.type_id == TYPE_NUMERIC:
+            series = views.numeric(self.col)
+            if params['op'] == 'range':
+                mn, mx = self.range_bounds()
+                mask = (series >= mn) & (series <= mx)
+            elif params['op'] == '>=':
+                mask = series >= params['v1']
+            elif params['op'] == '>':
+                mask = series > params['v1']
+            elif params['op'] == '<=':
+                mask = series <= params['v1']
+            elif params['op'] == '<':
+                mask = series < params['v1']
+            elif params['op'] == '==':
+                mask = series == params['v1']
+
+        elif self.type_id == TYPE_TEXT:
+            ignore_case = params.get('ignore_case')
+            mask = views.keyword_mask(self.col, params['text'], ignore_case)
+            if mask is None and ignore_case:
+                mask = split_match.contains_literal(views.lower(self.col), params['text'].lower())
+            elif mask is None:
+                mask = split_match.contains_literal(views.text(self.col), params['text'], views.arrow(self.col))
+            mask = views.expand(self.col, mask)
+
+        elif self.type_id == TYPE_REGEX:
+            mask = split_match.contains_regex(views.text(self.col), self.regex, views.arrow(self.col))
+            mask = views.expand(self.col, mask)
+
+        elif self.type_id == TYPE_COMPOUND:
+            mask = self.compound.evaluate(df, views)
+
+        if mask is None:
+            return None
+        mask = np.asarray(mask, dtype=bool)
+        if self.negate:
+            mask = ~mask
+        return mask
+
+    def _prefixed(self, label):
+        # Multi-output rules use their output name as an optional prefix
+        return f"{self.output_name}_{label}" if self.output_name else label
+
+    def outputs(self, df, views=None):
+        """[(output_name, selector)] produced by this rule, where selector is
+        a bool mask or an array of row positions."""
+        if self.type_id == TYPE_DISTINCT:
+            result = []
+            for value, positions in group_positions(df[self.col]):
+                label = MISSING_VALUE_NAME if value is None else value_label(value)
+                result.append((self._prefixed(label), positions))
+            return result
+
+        if views is None:
+            views = ColumnViews(df)
+
+        if self.type_id == TYPE_BANDS:
+            codes = band_codes(views.numeric(self.col).to_numpy(dtype=float, na_value=np.nan), self.cuts)
+            per_band, _ = positions_by_code(codes, len(self.cuts) + 1)
+            return [(self._prefixed(label), positions)
+                    for label, positions in zip(band_labels(self.cuts), per_band)]
+
+        if self.type_id == TYPE_NUMERIC and self.params['op'] == 'range' and not self.negate:
+            positions = views.range_positions(self.col, *self.range_bounds())
+            if positions is not None:
+                return [(self.output_name, positions)]
+
+        mask = self.evaluate(df, views)
+        if mask is None:
+            return []
+        return [(self.output_name, mask)]
+
+
+def compile_plan(conditions, columns):
+    """Compile condition dicts into rules, skipping conditions on missing columns."""
+    plan = []
+    for cond in conditions:
+        if any(col not in columns for col in condition_columns(cond)):
+            continue
+        plan.append(CompiledRule(cond))
+    return plan
+
+
+def _as_mask(sel, n):
+    if sel.dtype == bool:
+        return sel
+    mask = np.zeros(n, dtype=bool)
+    mask[sel] = True
+    return mask
+
+
+def _rule_outputs(rule, df, views, tracer):
+    with split_trace.span(tracer, f"mask {rule.output_name or rule.col}", 'mask',
+                          col=rule.col, type_id=rule.type_id) as span:
+        outputs = rule.outputs(df, views)
+        span['rows'] = len(df)
+    return outputs
+
+
+def plan_outputs(df, plan, views, routing=ROUTING_ALL, progress=None, cancelled=None, tracer=None):
+    """Yield (key, output_name, selector) for every output of the plan.
+
+    With ROUTING_ALL a row goes to every output it matches. With
+    ROUTING_FIRST each row goes only to the first matching output (in plan
+    order) and unmatched rows go to UNMATCHED_NAME: the outputs are reduced
+    to one route id per row and the rows are partitioned by a single stable
+    sort of the route ids."""
+    if routing == ROUTING_ALL:
+        for i, rule in enumerate(plan):
+            _check_cancelled(cancelled)
+            _report(progress, 'filter', i, len(plan))
+            for name, sel in _rule_outputs(rule, df, views, tracer):
+                yield (i, name), name, sel
+        _report(progress, 'filter', len(plan), len(plan))
+        return
+
+    n = len(df)
+    route = np.full(n, -1, dtype=np.int32)
+    keys = []
+    for i, rule in enumerate(plan):
+        _check_cancelled(cancelled)
+        _report(progress, 'filter', i, len(plan))
+        for name, sel in _rule_outputs(rule, df, views, tracer):
+            # Column k of the condition matrix, applied to still-unrouted rows
+            route[_as_mask(sel, n) & (route == -1)] = len(keys)
+            keys.append((i, name))
+    _report(progress, 'filter', len(plan), len(plan))
+
+    # The route id k is only local to this call (a distinct-value rule
+    # yields different outputs per chunk); the key is (rule, name)
+    per_route, unmatched = positions_by_code(route, len(keys))
+    for key, positions in zip(keys, per_route):
+        yield key, key[1], positions
+    yield UNMATCHED_NAME, UNMATCHED_NAME, unmatched
+
+
+def execute_plan(df, plan, progress=None, cancelled=None, routing=ROUTING_ALL, tracer=None):
+    """Evaluate every rule and return a list of (RowSelection, output_name)
+    for the outputs that matched any rows.
+
+    `progress(phase, done, total)` is reported and
+    `cancelled()` is polled before each rule (raises SplitCancelled)."""
+    return [(rows, name) for _, rows, name in _execute_keyed(df, plan, progress, cancelled, routing, tracer)]
+
+
+def _execute_keyed(df, plan, progress=None, cancelled=None, routing=ROUTING_ALL, tracer=None):
+    # execute_plan as (plan_outputs key, RowSelection, output_name)
+    results = []
+    views = ColumnViews(df, plan)
+    try:
+        for key, name, sel in plan_outputs(df, plan, views, routing, progress, cancelled, tracer):
+            rows = RowSelection(df, sel)
+            if len(rows):
+                results.append((key, rows, name))
+    finally:
+        views.clear()
+    return results
+
+
+class MatchPreview:
+    """Row counts per condition against one loaded sheet, for the GUI.
+
+    Sheets over `max_rows` are counted on a fixed random sample and the
+    counts scaled to the full sheet (`exact` is then False). Each
+    condition's mask is kept, so editing the list only evaluates the
+    conditions that are new or changed."""
+
+    def __init__(self, df, max_rows=PREVIEW_MAX_ROWS, seed=0):
+        self.total = len(df)
+        if len(df) > max_rows:
+            positions = np.sort(np.random.default_rng(seed).choice(len(df), max_rows, replace=False))
+            df = df.iloc[positions].reset_index(drop=True)
+        self.df = df
+        self.exact = len(df) == self.total
+        self.views = ColumnViews(df)
+        self._masks = OrderedDict()
+
+    @staticmethod
+    def _key(cond):
+        return json.dumps([cond.get('col'), cond['type_id'], cond.get('params'), cond.get('is_negate', False)],
+                          sort_keys=True, ensure_ascii=False, default=str)
+
+    def mask(self, cond):
+        """Rows the condition sends to any of its outputs, or None if it
+        can't be evaluated on this sheet."""
+        key = self._key(cond)
+        if key in self._masks:
+            self._masks.move_to_end(key)
+            return self._masks[key]
+        n = len(self.df)
+        mask = None
+        if all(col in self.df.columns for col in condition_columns(cond)):
+            try:
+                mask = np.zeros(n, dtype=bool)
+                for _, sel in CompiledRule(cond).outputs(self.df, self.views):
+                    mask |= _as_mask(sel, n)
+            except Exception:
+                # A half-typed or hand-edited condition: no count, no error
+                mask = None
+        self._masks[key] = mask
+        while len(self._masks) > PREVIEW_MAX_MASKS:
+            self._masks.popitem(last=False)
+        return mask
+
+    def _scale(self, count):
+        if self.exact:
+            return int(count)
+        return int(round(count * self.total / len(self.df)))
+
+    def counts(self, conditions, routing=ROUTING_ALL):
+        """Returns (rows per condition, rows matching none), scaled to the
+        full sheet. With ROUTING_FIRST a condition only counts the rows no
+        earlier condition took. Conditions that can't be evaluated count
+        as None."""
+        claimed = np.zeros(len(self.df), dtype=bool)
+        counts = []
+        for cond in conditions:
+            mask = self.mask(cond)
+            if mask is None:
+                counts.append(None)
+                continue
+            hits = mask & ~claimed if routing == ROUTING_FIRST else mask
+            counts.append(self._scale(np.count_nonzero(hits)))
+            claimed |= mask
+        return counts, self._scale(len(self.df) - np.count_nonzero(claimed))
+
+
+def sanitize_filename(name):
+    # Dots are kept inside the name ("2.5-3.5"), not at either end
+    safe_name = "".join([c for c in name if c.isalnum() or c in (' ', '-', '_', '.')]).strip(' .')
+    if not safe_name:
+        safe_name = "result"
+    return safe_name
+
+
+def unique_path(output_dir, safe_name, ext='.xlsx', taken=()):
+    """First free `safe_name[_N]ext` in output_dir. `taken` holds paths
+    already claimed by this run but not written to disk yet."""
+    fname = os.path.join(output_dir, f"{safe_name}{ext}")
+    counter = 1
+    while os.path.exists(fname) or fname in taken:
+        fname = os.path.join(output_dir, f"{safe_name}_{counter}{ext}")
+        counter += 1
+    return fname
+
+
+def _check_format(mode, fmt):
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"未知的输出格式: {fmt}")
+    if mode == MODE_SINGLE_FILE and fmt != FORMAT_XLSX:
+        raise ValueError("CSV/Parquet/Feather 格式只能拆分为多个独立文件")
+
+
+def write_results(results, mode, output, progress=None, cancelled=None, backend=None, workers=1,
+                  tracer=None, fmt=FORMAT_XLSX, compression=None):
+    """Write results to one workbook (MODE_SINGLE_FILE, `output` is a file)
+    or one file per result (MODE_MULTI_FILES, `output` is a directory)
+    using the split_writers `backend`. Returns the list of written paths.
+    In MODE_MULTI_FILES, `workers` > 1 writes the files on a process pool,
+    and `fmt` can be any split_writers format (`compression` for Parquet).
+
+    Results are RowSelections (or DataFrames); each is written in slices
+    and released as soon as its output is done.
+
+    Cancellation is checked between outputs; on cancel or error every file
+    written by this call is removed before the exception propagates."""
+    _check_format(mode, fmt)
+    total = len(results)
+    if mode == MODE_SINGLE_FILE:
+        book = open_book(output, backend)
+        try:
+            for i, (res, name) in enumerate(results):
+                _check_cancelled(cancelled)
+                _report(progress, 'write', i, total)
+                with split_trace.span(tracer, f"write {name}", 'write') as span:
+                    ws = book.add_sheet(name, res.columns)
+                    for part in _result_slices(res):
+                        book.append(ws, part)
+                    span['rows'] = len(res)
+                _release(res)
+            with split_trace.span(tracer, "save", 'write', file=os.path.basename(output)):
+                book.close()
+        except BaseException:
+            book.abort()
+            raise
+        _report(progress, 'write', total, total)
+        return [output]
+
+    # Names are resolved up front, in result order, so parallel writes
+    # produce exactly the same file names as serial ones
+    taken = set()
+    fnames = []
+    for _, name in results:
+        fname = unique_path(output, sanitize_filename(name), FORMAT_EXTENSIONS[fmt], taken)
+        taken.add(fname)
+        fnames.append(fname)
+
+    if workers > 1 and total > 1:
+        with split_trace.span(tracer, "write (parallel)", 'write', workers=workers) as span:
+            span['rows'] = sum(len(res) for res, _ in results)
+            return _write_files_parallel(results, fnames, workers, progress, cancelled, backend,
+                                         fmt, compression)
+
+    written = []
+    try:
+        for i, ((res, name), fname) in enumerate(zip(results, fnames)):
+            _check_cancelled(cancelled)
+            _report(progress, 'write', i, total)
+            written.append(fname)
+            with split_trace.span(tracer, f"write {name}", 'write') as span:
+                _write_file(fname, name, res, backend, fmt, compression)
+                span['rows'] = len(res)
+            _release(res)
+    except BaseException:
+        _remove_files(written)
+        raise
+    _report(progress, 'write', total, total)
+    return written
+
+
+def _write_file(fname, name, res, backend, fmt=FORMAT_XLSX, compression=None):
+    # Module level so it can run in a worker process
+    book = open_book(fname, backend, fmt, compression)
+    try:
+        ws = book.add_sheet(name, res.columns)
+        for part in _result_slices(res):
+            book.append(ws, part)
+        book.close()
+    except BaseException:
+        book.abort()
+        raise
+    return fname
+
+
+def _write_files_parallel(results, fnames, workers, progress, cancelled, backend, fmt, compression):
+    """Write one file per result on a process pool. Each worker gets its
+    rows as one DataFrame (the source frame can't be shared); at most
+    2 * workers of these are queued at once so the copies don't pile up."""
+    total = len(results)
+    pending = set()
+    done = 0
+    next_i = 0
+    pool = ProcessPoolExecutor(max_workers=min(workers, total))
+    try:
+        while next_i < total or pending:
+            _check_cancelled(cancelled)
+            while next_i < total and len(pending) < 2 * workers:
+                res, name = results[next_i]
+                pending.add(pool.submit(_write_file, fnames[next_i], name, _result_frame(res), backend,
+                                        fmt, compression))
+                _release(res)
+                next_i += 1
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+                done += 1
+                _report(progress, 'write', done, total)
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        _remove_files(fnames)
+        raise
+    pool.shutdown()
+    return fnames
+
+
+def _header_names(header):
+    # Same naming as pd.read_excel: blank headers become "Unnamed: i",
+    # repeated headers get ".1", ".2", ... suffixes
+    names = []
+    seen = {}
+    for i, h in enumerate(header):
+        name = f"Unnamed: {i}" if h is None else h
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell_value(v):
+    # Blank cells as NaN, like the calamine parse: a None would read as
+    # "None" rather than "nan" in text and regex rules
+    if v is None:
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def _chunk_frame(rows, columns, start):
+    width = len(columns)
+    rows = [tuple(_cell_value(v) for v in r[:width]) + (np.nan,) * (width - len(r)) for r in rows]
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def sheet_row_count(path, sheet):
+    """Approximate data row count from the sheet dimension (may be None)."""
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        max_row = wb[sheet].max_row
+    finally:
+        wb.close()
+    return max_row - 1 if max_row else None
+
+
+def iter_chunks(path, sheet, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield the sheet as DataFrames of at most `chunk_rows` rows. Uses
+    openpyxl read-only mode, so only one chunk is held in memory."""
+    if not path.lower().endswith(('.xlsx', '.xlsm')):
+        raise ValueError("流式模式仅支持 .xlsx 文件")
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        buf = []
+        start = 0
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= chunk_rows:
+                yield _chunk_frame(buf, columns, start)
+                start += len(buf)
+                buf = []
+        if buf:
+            yield _chunk_frame(buf, columns, start)
+    finally:
+        wb.close()
+
+
+def stream_split(path, sheet, conditions, mode, output, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 progress=None, cancelled=None, backend=None, routing=ROUTING_ALL, tracer=None,
+                 fmt=FORMAT_XLSX, compression=None):
+    """Chunked variant of run_split for sheets larger than RAM.
+
+    Each chunk is filtered with the compiled plan and matching rows are
+    appended directly to the output writers, so memory stays bounded by
+    `chunk_rows` regardless of sheet size. Outputs are created on their
+    first matching row; outputs without matches are not written."""
+    _check_format(mode, fmt)
+    total = sheet_row_count(path, sheet) or 0
+    plan = None
+    targets = {}  # output key -> (book, worksheet)
+    books = []
+    taken = set()
+    written = []
+    done = 0
+    try:
+        _report(progress, 'read', 0, total)
+        chunks = iter_chunks(path, sheet, chunk_rows)
+        while True:
+            with split_trace.span(tracer, 'parse chunk', 'read') as span:
+                chunk = next(chunks, None)
+                span['rows'] = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                break
+            _check_cancelled(cancelled)
+            if plan is None:
+                plan = compile_plan(conditions, chunk.columns)
+            views = ColumnViews(chunk, plan)
+            for key, name, sel in plan_outputs(chunk, plan, views, routing, tracer=tracer):
+                rows = _selected(chunk, sel)
+                if rows.empty:
+                    continue
+                if key not in targets:
+                    if mode == MODE_SINGLE_FILE:
+                        if not books:
+                            books.append(open_book(output, backend))
+                        book = books[0]
+                    else:
+                        fname = unique_path(output, sanitize_filename(name), FORMAT_EXTENSIONS[fmt], taken)
+                        taken.add(fname)
+                        book = open_book(fname, backend, fmt, compression)
+                        books.append(book)
+                    targets[key] = (book, book.add_sheet(name, chunk.columns))
+                book, ws = targets[key]
+                with split_trace.span(tracer, f"write {name}", 'write') as span:
+                    book.append(ws, rows)
+                    span['rows'] = len(rows)
+            views.clear()
+            done += len(chunk)
+            _report(progress, 'read', done, max(total, done))
+
+        for i, book in enumerate(books):
+            _check_cancelled(cancelled)
+            _report(progress, 'write', i, len(books))
+            written.append(book.path)
+            with split_trace.span(tracer, "save", 'write', file=os.path.basename(book.path)):
+                book.close()
+    except BaseException:
+        _remove_files(written)
+        for book in books[len(written):]:
+            book.abort()
+        raise
+    _report(progress, 'write', len(books), len(books))
+    return written
+
+
+def run_split(path, sheet, conditions, mode, output, progress=None, cancelled=None, cache=None,
+              backend=None, workers=1, routing=ROUTING_ALL, tracer=None, fmt=FORMAT_XLSX,
+              compression=None, dtypes=DTYPES_COMPACT):
+    """Load, filter and write in one call. Returns the written file paths
+    (empty when no rows matched any condition). Phases are recorded on
+    `tracer` (a split_trace.Tracer) when one is given."""
+    _report(progress, 'read', 0, 0)
+    df = load_source(path, sheet, cache, tracer, dtypes)
+    _check_cancelled(cancelled)
+    with split_trace.span(tracer, 'compile', 'mask'):
+        plan = compile_plan(conditions, df.columns)
+    results = execute_plan(df, plan, progress, cancelled, routing, tracer)
+    if not results:
+        return []
+    return write_results(results, mode, output, progress, cancelled, backend, workers, tracer,
+                         fmt, compression)
+
+
+# Worker-process state for split_sheets: each worker opens the workbook
+# once and parses the sheets it is given from that handle
+_sheet_book = None
+
+
+def _open_sheet_book(path):
+    global _sheet_book
+    _sheet_book = pd.ExcelFile(path, engine=READ_ENGINE)
+
+
+def _sheet_job(sheet, conditions, routing, dtypes):
+    # Module level so it can run in a worker process. Only the matching
+    # rows are sent back, not the whole sheet
+    df = split_dtypes.compact_frame(_sheet_book.parse(sheet), dtypes)
+    plan = compile_plan(conditions, df.columns)
+    results = _execute_keyed(df, plan, routing=routing)
+    return len(df), [(key, _result_frame(res), name) for key, res, name in results]
+
+
+def _merge_sheets(per_sheet, combine):
+    """[(result, name)] from {sheet: [(key, result, name)]}, in sheet order."""
+    if combine == SHEETS_SEPARATE:
+        return [(res, f"{sheet}_{name}") for sheet, results in per_sheet.items() for _, res, name in results]
+    merged = OrderedDict()
+    for results in per_sheet.values():
+        # Keyed by rule and name: two rules with the same output name stay
+        # two outputs even when only one of them matches on a sheet
+        for key, res, name in results:
+            merged.setdefault(key, (name, []))[1].append(res)
+    return [(parts[0] if len(parts) == 1 else ResultChain(parts), name)
+            for name, parts in merged.values()]
+
+
+def split_sheets(path, sheets, conditions, mode, output, combine=SHEETS_COMBINE, workers=1,
+                 progress=None, cancelled=None, cache=None, backend=None, routing=ROUTING_ALL,
+                 tracer=None, fmt=FORMAT_XLSX, compression=None, dtypes=DTYPES_COMPACT):
+    """run_split over several sheets of one workbook (`sheets` None means
+    all of them). With SHEETS_COMBINE the rows a condition matches on every
+    sheet go to one output, in sheet order; with SHEETS_SEPARATE each sheet
+    gets its own outputs.
+
+    With workers > 1 the sheets are parsed and filtered on a process pool,
+    each worker opening the workbook once; otherwise they are parsed one
+    after another from one handle (or `cache`). Returns the written files."""
+    _check_format(mode, fmt)
+    if sheets is None:
+        sheets = list_sheets(path)
+    total = len(sheets)
+    per_sheet = {}
+    _report(progress, 'read', 0, total)
+    if workers <= 1 or total <= 1:
+        for sheet in sheets:
+            _check_cancelled(cancelled)
+            df = load_source(path, sheet, cache, tracer, dtypes)
+            with split_trace.span(tracer, 'compile', 'mask'):
+                plan = compile_plan(conditions, df.columns)
+            per_sheet[sheet] = _execute_keyed(df, plan, cancelled=cancelled, routing=routing, tracer=tracer)
+            _report(progress, 'read', len(per_sheet), total)
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, total), initializer=_open_sheet_book,
+                                   initargs=(path,))
+        try:
+            with split_trace.span(tracer, 'parse sheets (parallel)', 'read', workers=workers) as span:
+                futures = {pool.submit(_sheet_job, sheet, conditions, routing, dtypes): sheet
+                           for sheet in sheets}
+                pending = set(futures)
+                rows = 0
+                while pending:
+                    _check_cancelled(cancelled)
+                    finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        n, results = future.result()
+                        rows += n
+                        per_sheet[futures[future]] = results
+                        _report(progress, 'read', len(per_sheet), total)
+                span['rows'] = rows
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown()
+    results = _merge_sheets({sheet: per_sheet[sheet] for sheet in sheets}, combine)
+    if not results:
+        return []
+    return write_results(results, mode, output, progress, cancelled, backend, workers, tracer,
+                         fmt, compression)
+
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+
+
+def collect_sources(pattern):
+    """Workbooks in a directory, or matching a glob pattern, or the given
+    file itself. Excel's "~$" lock files are skipped."""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    elif os.path.isfile(pattern):
+        # Not a glob: names like "数据[2024].xlsx" would not match themselves
+        paths = [pattern]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(p for p in paths
+                  if os.path.isfile(p) and p.lower().endswith(EXCEL_EXTENSIONS)
+                  and not os.path.basename(p).startswith('~$'))
+
+
+def batch_targets(sources, mode, output_dir):
+    """Output location for each source: `<name>_split.xlsx` in MODE_SINGLE_FILE,
+    a `<name>` sub-directory in MODE_MULTI_FILES."""
+    taken = set()
+    targets = {}
+    for path in sources:
+        stem = sanitize_filename(os.path.splitext(os.path.basename(path))[0])
+        if mode == MODE_SINGLE_FILE:
+            target = unique_path(output_dir, f"{stem}_split", taken=taken)
+        else:
+            target = unique_path(output_dir, stem, ext='', taken=taken)
+        taken.add(target)
+        targets[path] = target
+    return targets
+
+
+def _batch_job(path, sheet, conditions, mode, output, backend, routing, fmt, compression, dtypes):
+    # Module level so it can run in a worker process
+    if sheet is None:
+        sheet = list_sheets(path)[0]
+    if mode == MODE_MULTI_FILES:
+        os.makedirs(output, exist_ok=True)
+    return run_split(path, sheet, conditions, mode, output, backend=backend, routing=routing,
+                     fmt=fmt, compression=compression, dtypes=dtypes)
+
+
+def run_batch(sources, sheet, conditions, mode, output_dir, workers=1, progress=None,
+              cancelled=None, on_file=None, backend=None, routing=ROUTING_ALL, fmt=FORMAT_XLSX,
+              compression=None, dtypes=DTYPES_COMPACT):
+    """Split every workbook in `sources` with the same conditions.
+
+    Largest files are scheduled first so a big file doesn't start last and
+    hold up the end of the batch. `sheet` None means each workbook's first
+    sheet. `on_file(path, written, error)` is called as each file finishes;
+    a failing file doesn't stop the batch. Returns {path: (written, error)}."""
+    _check_format(mode, fmt)
+    sources = sorted(sources, key=os.path.getsize, reverse=True)
+    targets = batch_targets(sources, mode, output_dir)
+    total = len(sources)
+    outcome = {}
+
+    def finish(path, written, error):
+        outcome[path] = (written, error)
+        if on_file is not None:
+            on_file(path, written, error)
+        _report(progress, 'batch', len(outcome), total)
+
+    _report(progress, 'batch', 0, total)
+    if workers <= 1 or total <= 1:
+        for path in sources:
+            _check_cancelled(cancelled)
+            try:
+                written = _batch_job(path, sheet, conditions, mode, targets[path], backend, routing,
+                                     fmt, compression, dtypes)
+                finish(path, written, None)
+            except Exception as e:
+                finish(path, [], str(e))
+        return outcome
+
+    pool = ProcessPoolExecutor(max_workers=min(workers, total))
+    try:
+        futures = {pool.submit(_batch_job, path, sheet, conditions, mode, targets[path],
+                               backend, routing, fmt, compression, dtypes): path for path in sources}
+        pending = set(futures)
+        while pending:
+            _check_cancelled(cancelled)
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = futures[future]
+                try:
+                    finish(path, future.result(), None)
+                except Exception as e:
+                    finish(path, [], str(e))
+    except BaseException:
+        # Files that already finished are kept; queued ones never start
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return outcome
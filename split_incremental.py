@@ -0,0 +1,315 @@
+"""
+Excel条件拆分器 - 增量拆分
+
+For source workbooks that only grow by appended rows. Each run saves a
+manifest next to the outputs:
+
+    source     path, sheet, size/mtime, rows processed, column names and a
+               hash of the processed rows
+    rules      hash of the condition set plus routing, mode and format
+    outputs    output name -> file (and sheet, in single-file mode)
+
+The next run then
+- skips entirely when neither the file nor the rules changed;
+- when the processed rows are unchanged and only new rows were added,
+  evaluates just the new rows and appends them to the existing outputs
+  (a new output, e.g. a new distinct value, gets its own file or sheet);
+- otherwise (rows edited or deleted, rules or settings changed, outputs
+  missing) removes the previous outputs and splits from scratch.
+
+Appending works for xlsx (the output workbook is loaded with openpyxl and
+saved again) and csv (rows are appended to the file). Parquet and Feather
+files can't be appended to, so those formats always split from scratch.
+
+watch() polls the source and calls back once a change has settled, so
+the split never reads a file Excel is still saving.
+"""
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+import split_dtypes
+import split_engine
+import split_trace
+import split_writers
+from split_cache import file_key
+
+MANIFEST_VERSION = 2  # 2: outputs keyed by rule (output_key)
+MANIFEST_NAME = ".split_manifest.json"
+
+STATUS_SKIPPED = 'skipped'
+STATUS_APPENDED = 'appended'
+STATUS_FULL = 'full'
+STATUS_LABELS = {
+    STATUS_SKIPPED: "源文件和条件均未变化，已跳过",
+    STATUS_APPENDED: "已将新增行追加到已有结果",
+    STATUS_FULL: "已完整拆分",
+}
+
+APPENDABLE_FORMATS = (split_writers.FORMAT_XLSX, split_writers.FORMAT_CSV)
+
+
+def manifest_path(mode, output):
+    """Default manifest location: next to the output workbook, or inside
+    the output folder."""
+    if mode == split_engine.MODE_SINGLE_FILE:
+        return output + ".manifest.json"
+    return os.path.join(output, MANIFEST_NAME)
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def rules_hash(conditions, mode, routing, fmt):
+    keys = ('col', 'type_id', 'params', 'is_negate', 'output_name')
+    rules = [{k: c.get(k) for k in keys} for c in conditions]
+    payload = json.dumps([rules, mode, routing, fmt], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def rows_hash(df):
+    """Content hash of a frame's rows (values only, not the index). The
+    same rows hash the same however split_dtypes stored them, since new
+    rows can change the dtype a column compacts to."""
+    wide = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        wide.isetitem(i, split_dtypes.widen(df.iloc[:, i]))
+    hashes = pd.util.hash_pandas_object(wide, index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def output_key(key):
+    """Manifest key for a split_engine.plan_outputs key: the rule's index
+    and the output name, so two rules with the same name keep their own
+    outputs whichever of them matches in a run."""
+    if isinstance(key, tuple):
+        return f"{key[0]}:{key[1]}"
+    return str(key)  # UNMATCHED_NAME
+
+
+def _evaluate(df, plan, progress, cancelled, routing, tracer):
+    # split_engine.execute_plan, keeping each output's manifest key
+    results = []
+    keys = []
+    views = split_engine.ColumnViews(df, plan)
+    try:
+        for key, name, sel in split_engine.plan_outputs(df, plan, views, routing, progress, cancelled, tracer):
+            rows = split_engine.RowSelection(df, sel)
+            if len(rows):
+                results.append((rows, name))
+                keys.append(output_key(key))
+    finally:
+        views.clear()
+    return results, keys
+
+
+def _sheet_names(names):
+    # Same names the writers give the sheets (sanitised and de-duplicated)
+    sheets = []
+    for name in names:
+        sheets.append(split_writers._dedup_sheet_name(name, sheets))
+    return sheets
+
+
+def _full_split(df, plan, mode, output, progress, cancelled, backend, workers, routing, tracer,
+                fmt, compression):
+    results, keys = _evaluate(df, plan, progress, cancelled, routing, tracer)
+    names = [name for _, name in results]
+    if not results:
+        return [], {}
+    written = split_engine.write_results(results, mode, output, progress, cancelled, backend, workers,
+                                         tracer, fmt, compression)
+    if mode == split_engine.MODE_SINGLE_FILE:
+        outputs = {key: {'path': output, 'sheet': sheet} for key, sheet in zip(keys, _sheet_names(names))}
+    else:
+        outputs = {key: {'path': fname} for key, fname in zip(keys, written)}
+    return written, outputs
+
+
+def _append_split(df, plan, mode, output, outputs, progress, cancelled, backend, routing, tracer,
+                  fmt, compression, before_save):
+    """Evaluate `df` (the new rows only) and append the matches to the
+    outputs recorded in the manifest. `before_save()` is called once the
+    rows are staged, before the first output is saved. Returns the files
+    touched."""
+    results, keys = _evaluate(df, plan, progress, cancelled, routing, tracer)
+    if not results:
+        return []
+    books = {}  # path -> open book
+    taken = {o['path'] for o in outputs.values()}
+    total = len(results)
+    try:
+        if mode == split_engine.MODE_SINGLE_FILE:
+            books[output] = split_writers.append_book(output, fmt)
+        for i, ((res, name), key) in enumerate(zip(results, keys)):
+            split_engine._check_cancelled(cancelled)
+            split_engine._report(progress, 'write', i, total)
+            entry = outputs.get(key)
+            if mode == split_engine.MODE_SINGLE_FILE:
+                book = books[output]
+                if entry is None:
+                    sheet = book.add_sheet(name, res.columns)
+                    outputs[key] = {'path': output, 'sheet': sheet}
+                else:
+                    sheet = book.sheet(entry['sheet'])
+            else:
+                if entry is None:
+                    fname = split_engine.unique_path(output, split_engine.sanitize_filename(name),
+                                                     split_writers.FORMAT_EXTENSIONS[fmt], taken)
+                    taken.add(fname)
+                    book = split_writers.open_book(fname, backend, fmt, compression)
+                    sheet = book.add_sheet(name, res.columns)
+                    outputs[key] = {'path': fname}
+                else:
+                    fname = entry['path']
+                    book = split_writers.append_book(fname, fmt)
+                    sheet = book.sheet(name)
+                books[fname] = book
+            with split_trace.span(tracer, f"append {name}", 'write') as span:
+                for part in split_engine._result_slices(res):
+                    book.append(sheet, part)
+                span['rows'] = len(res)
+            split_engine._release(res)
+        before_save()
+        for book in books.values():
+            book.close()
+    except BaseException:
+        for book in books.values():
+            book.abort()
+        raise
+    split_engine._report(progress, 'write', total, total)
+    return list(books)
+
+
+def incremental_split(path, sheet, conditions, mode, output, manifest=None, progress=None,
+                      cancelled=None, cache=None, backend=None, workers=1,
+                      routing=split_engine.ROUTING_ALL, tracer=None,
+                      fmt=split_writers.FORMAT_XLSX, compression=None, dtypes=split_dtypes.DTYPES_COMPACT):
+    """run_split that only processes rows added since the last run.
+
+    `manifest` is the manifest file (default: manifest_path(mode, output)).
+    Returns (status, written) with status STATUS_SKIPPED, STATUS_APPENDED
+    or STATUS_FULL; `written` lists the files created or appended to."""
+    if manifest is None:
+        manifest = manifest_path(mode, output)
+    previous = load_manifest(manifest)
+    key = file_key(path)
+    rules = rules_hash(conditions, mode, routing, fmt)
+
+    same_rules = previous is not None and previous['rules'] == rules and previous['sheet'] == sheet
+    outputs_exist = previous is not None and all(os.path.exists(o['path']) for o in previous['outputs'].values())
+    if same_rules and outputs_exist and previous['source']['stat'] == list(key[1:]):
+        return STATUS_SKIPPED, []
+
+    df = split_engine.load_source(path, sheet, cache, tracer, dtypes)
+    split_engine._check_cancelled(cancelled)
+    with split_trace.span(tracer, 'compile', 'mask'):
+        plan = split_engine.compile_plan(conditions, df.columns)
+    columns = [str(c) for c in df.columns]
+
+    processed = previous['source']['rows'] if previous else 0
+    appendable = (same_rules and outputs_exist and fmt in APPENDABLE_FORMATS
+                  and (mode == split_engine.MODE_MULTI_FILES or os.path.exists(output))
+                  and previous['source']['columns'] == columns
+                  and processed <= len(df))
+    if appendable:
+        with split_trace.span(tracer, 'verify', 'read') as span:
+            appendable = rows_hash(df.iloc[:processed]) == previous['source']['rows_hash']
+            span['rows'] = processed
+
+    if appendable:
+        status = STATUS_APPENDED
+        outputs = dict(previous['outputs'])
+        new_rows = df.iloc[processed:].reset_index(drop=True)
+
+        def invalidate():
+            # Until now a failure or cancel rolls the outputs back and the
+            # old manifest still describes them. Once saving starts they
+            # may hold part of the new rows, so the next run must split in
+            # full (removing every output listed) rather than append again
+            source = dict(previous['source'], stat=None, rows_hash=None)
+            save_manifest(dict(previous, source=source, outputs=outputs), manifest)
+
+        written = _append_split(new_rows, plan, mode, output, outputs, progress, cancelled, backend,
+                                routing, tracer, fmt, compression, invalidate) if len(new_rows) else []
+    else:
+        # The manifest goes first: a run that fails half way must not leave
+        # one behind that describes outputs it didn't finish
+        _remove(manifest)
+        status = STATUS_FULL
+        if previous is not None:
+            for o in previous['outputs'].values():
+                _remove(o['path'])
+        written, outputs = _full_split(df, plan, mode, output, progress, cancelled, backend, workers,
+                                       routing, tracer, fmt, compression)
+
+    save_manifest({
+        'version': MANIFEST_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sheet': sheet,
+        'rules': rules,
+        'source': {
+            'path': os.path.abspath(path),
+            'stat': list(key[1:]),
+            'rows': len(df),
+            'columns': columns,
+            'rows_hash': rows_hash(df),
+        },
+        'outputs': outputs,
+    }, manifest)
+    return status, written
+
+
+def watch(path, on_change, interval=2.0, cancelled=None):
+    """Call on_change() each time `path` changes on disk, once its size and
+    modification time have stayed the same for one `interval` (Excel
+    writes the file in several steps). Runs until cancelled() is true."""
+
+    def stat():
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    last = stat()
+    while cancelled is None or not cancelled():
+        time.sleep(interval)
+        current = stat()
+        if current is None or current == last:
+            continue
+        # Wait for the write to settle
+        while True:
+            time.sleep(interval)
+            settled = stat()
+            if settled == current:
+                break
+            current = settled
+        if current is not None:
+            last = current
+            on_change()
@@ -0,0 +1,119 @@
+"""
+Excel条件拆分器 - 文本匹配
+
+Text and regex matching used by the split rules. Every function returns a
+numpy bool array aligned with the input series.
+
+- Text rules are plain substring tests (no regex engine involved, so
+  keywords containing '.', '(' or '+' match literally).
+- Regex rules are compiled once per rule and scanned once per column
+  (re.search semantics, which already covers re.match).
+- Many text rules on the same column are answered together by
+  keyword_hits: the column is factorized once and every distinct value is
+  scanned once with an Aho-Corasick automaton (pyahocorasick) for all
+  keywords, so the cost follows the column size, not size x rule count.
+- With pyarrow installed, literal matching on large (or already
+  Arrow-backed) columns runs on the Arrow match_substring kernel. Arrow regex matching uses RE2, whose
+  syntax differs from Python's `re` (no lookaround or backreferences,
+  ASCII-only \\d), so it is opt-in through ARROW_REGEX.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from split_dtypes import is_arrow_text
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+# Below this many rows the Arrow conversion costs more than it saves
+ARROW_MIN_ROWS = 100000
+ARROW_REGEX = False
+
+# Text rules per column from which the single-pass keyword scan is used
+MULTI_KEYWORD_MIN = 3
+
+
+def arrow_enabled(series):
+    # Arrow-backed strings need no conversion, so any size is worth it
+    return pc is not None and (len(series) >= ARROW_MIN_ROWS or is_arrow_text(series.dtype))
+
+
+def to_arrow(series):
+    if is_arrow_text(series.dtype):
+        return pa.array(series.array)
+    return pa.array(series, type=pa.string(), from_pandas=True)
+
+
+def _arrow_mask(result):
+    return result.fill_null(False).to_numpy(zero_copy_only=False)
+
+
+def compile_regex(pattern):
+    return re.compile(pattern)
+
+
+def contains_literal(series, text, arrow_array=None):
+    """Substring test. `arrow_array` is the Arrow form of `series`, if the
+    caller already has one."""
+    if arrow_array is not None:
+        return _arrow_mask(pc.match_substring(arrow_array, pattern=text))
+    return series.str.contains(text, regex=False, na=False).to_numpy(dtype=bool)
+
+
+def contains_regex(series, regex, arrow_array=None):
+    """re.search test with a compiled pattern."""
+    if arrow_array is not None and ARROW_REGEX and not regex.flags & ~re.UNICODE:
+        try:
+            return _arrow_mask(pc.match_substring_regex(arrow_array, pattern=regex.pattern))
+        except pa.ArrowInvalid:
+            pass  # Not valid RE2, fall back to Python's engine
+    return series.str.contains(regex, na=False).to_numpy(dtype=bool)
+
+
+class KeywordHits:
+    """Which of `keywords` occur in each row, stored per distinct value."""
+
+    def __init__(self, codes, hits, keywords):
+        self.codes = codes
+        # Extra all-False row for missing values (code -1)
+        self.hits = np.vstack([hits, np.zeros((1, len(keywords)), dtype=bool)])
+        self.index = {kw: j for j, kw in enumerate(keywords)}
+
+    def mask(self, keyword):
+        return self.hits[:, self.index[keyword]][self.codes]
+
+
+def keyword_hits(series, keywords):
+    """Evaluate all `keywords` (substring tests) against `series` in one
+    pass over its distinct values."""
+    keywords = list(dict.fromkeys(keywords))
+    codes, uniques = pd.factorize(series)
+    hits = np.zeros((len(uniques), len(keywords)), dtype=bool)
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for j, kw in enumerate(keywords):
+            automaton.add_word(kw, j)
+        automaton.make_automaton()
+        for i, value in enumerate(uniques):
+            for _, j in automaton.iter(str(value)):
+                hits[i, j] = True
+    else:
+        # Still one scan of the column (the factorize); each keyword is
+        # then tested against the distinct values only
+        values = pd.Series(uniques, dtype=object).astype(str)
+        for j, kw in enumerate(keywords):
+            hits[:, j] = values.str.contains(kw, regex=False).to_numpy(dtype=bool)
+
+    return KeywordHits(codes, hits, keywords)
@@ -0,0 +1,84 @@
+"""
+Excel条件拆分器 - 选项常量
+
+Option values shared by the GUI, the CLI and the engine modules. This
+module imports nothing from the data stack (pandas, numpy, pyarrow), so
+main.py can build its window from it before those are loaded; optional
+packages are detected with importlib.util.find_spec instead of being
+imported.
+
+The engine modules re-export these names (split_engine.ROUTING_ALL,
+split_writers.FORMAT_CSV, split_dtypes.DTYPES_COMPACT, ...).
+"""
+from importlib.util import find_spec
+
+# Routing: every matching output gets the row, or only the first one
+ROUTING_ALL = 'all'
+ROUTING_FIRST = 'first'
+
+# Output modes (same ids as the output mode radio buttons in main.py)
+MODE_SINGLE_FILE = 0
+MODE_MULTI_FILES = 1
+
+# split_sheets
+SHEETS_COMBINE = 'combine'    # rows of all sheets go to one output per name
+SHEETS_SEPARATE = 'separate'  # one output per sheet and name ("<sheet>_<name>")
+
+WRITER_XLSXWRITER = 'xlsxwriter'
+WRITER_OPENPYXL = 'openpyxl'
+
+FORMAT_XLSX = 'xlsx'
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_FEATHER = 'feather'
+PARQUET_COMPRESSIONS = ('snappy', 'zstd', 'gzip', 'none')
+
+DTYPES_OBJECT = 'object'    # keep the parsed dtypes
+DTYPES_COMPACT = 'compact'
+DTYPES_ARROW = 'arrow'
+DTYPES_LABELS = {
+    DTYPES_COMPACT: "紧凑 (分类编码+数值降位)",
+    DTYPES_ARROW: "紧凑+Arrow文本",
+    DTYPES_OBJECT: "不优化",
+}
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+SERVICE_URL = f"http://{SERVICE_HOST}:{SERVICE_PORT}"
+
+
+def installed(module):
+    try:
+        return find_spec(module) is not None
+    except ValueError:
+        return False
+
+
+def arrow_available():
+    return installed('pyarrow')
+
+
+def available_backends():
+    backends = []
+    if installed('xlsxwriter'):
+        backends.append(WRITER_XLSXWRITER)
+    backends.append(WRITER_OPENPYXL)
+    return backends
+
+
+def default_backend():
+    return available_backends()[0]
+
+
+def available_formats():
+    formats = [FORMAT_XLSX, FORMAT_CSV]
+    if arrow_available():
+        formats += [FORMAT_PARQUET, FORMAT_FEATHER]
+    return formats
+
+
+def available_modes():
+    modes = [DTYPES_COMPACT, DTYPES_OBJECT]
+    if arrow_available():
+        modes.insert(1, DTYPES_ARROW)
+    return modes
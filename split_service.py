@@ -0,0 +1,545 @@
+"""
+Excel条件拆分器 - 本地拆分服务
+
+A long-running local service that runs splits for other programs
+(schedulers, ETL scripts) and, optionally, for the GUI:
+
+    python split_service.py --port 8765 --workers 2
+    python split_service.py --socket /tmp/excel_splitter.sock
+
+Jobs are queued (up to --queue) and run by a fixed pool of worker
+threads. All workers share one WorkbookCache, so a workbook that was
+parsed recently is split again without re-parsing it.
+
+HTTP API (JSON):
+
+    POST   /jobs         submit a job; 202 {"id": ..., "state": "queued"},
+                         400 for an invalid job, 503 when the queue is full
+    GET    /jobs         recent jobs, newest first
+    GET    /jobs/<id>    state, progress, written files, error, timings
+    DELETE /jobs/<id>    cancel (a queued job never starts; a running one
+                         stops at its next cancellation check)
+    GET    /metrics      queue depth, throughput, cache statistics
+    GET    /health
+
+A job is an object with the CLI's options:
+
+    {"source": "月报.xlsx", "sheet": "Sheet1",
+     "conditions": [...] or "conditions_file": "rules.json",
+     "output": "out.xlsx" or "output_dir": "out/",
+     "format": "xlsx", "compression": "snappy", "writer": "xlsxwriter",
+     "exclusive": false, "dtypes": "compact", "jobs": 1,
+     "stream": false, "chunk_rows": 50000,
+     "incremental": false, "manifest": null,
+     "all_sheets": false, "sheets": null, "per_sheet": false,
+     "trace": null}
+
+Paths are resolved by the service, so relative paths are relative to its
+working directory. The service listens on localhost only and has no
+authentication; don't expose it on a network.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import split_dtypes
+import split_engine
+import split_incremental
+import split_options
+import split_trace
+import split_writers
+from split_cache import WorkbookCache, SidecarCache, DEFAULT_MAX_BYTES, DEFAULT_CACHE_DIR
+
+DEFAULT_HOST = split_options.SERVICE_HOST
+DEFAULT_PORT = split_options.SERVICE_PORT
+DEFAULT_URL = split_options.SERVICE_URL
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 64
+MAX_FINISHED_JOBS = 500  # Finished jobs kept for status queries
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+STATE_QUEUED = 'queued'
+STATE_RUNNING = 'running'
+STATE_SUCCEEDED = 'succeeded'
+STATE_FAILED = 'failed'
+STATE_CANCELLED = 'cancelled'
+FINISHED_STATES = (STATE_SUCCEEDED, STATE_FAILED, STATE_CANCELLED)
+
+# Spans whose rows count as rows read
+_READ_SPANS = ('parse', 'parse chunk', 'parse sheets (parallel)')
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _timestamp(t):
+    return None if t is None else time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t))
+
+
+def parse_spec(spec):
+    """Validated copy of a job spec with defaults filled in. Raises
+    ValueError with a message for the client."""
+    if not isinstance(spec, dict):
+        raise ValueError("任务必须是JSON对象")
+    job = {
+        'source': spec.get('source'),
+        'sheet': spec.get('sheet'),
+        'output': spec.get('output'),
+        'output_dir': spec.get('output_dir'),
+        'format': spec.get('format', split_writers.FORMAT_XLSX),
+        'compression': spec.get('compression', 'snappy'),
+        'writer': spec.get('writer', split_writers.default_backend()),
+        'exclusive': bool(spec.get('exclusive', False)),
+        'dtypes': spec.get('dtypes', split_dtypes.DTYPES_COMPACT),
+        'jobs': int(spec.get('jobs', 1)),
+        'stream': bool(spec.get('stream', False)),
+        'chunk_rows': int(spec.get('chunk_rows', split_engine.DEFAULT_CHUNK_ROWS)),
+        'incremental': bool(spec.get('incremental', False)),
+        'manifest': spec.get('manifest'),
+        'all_sheets': bool(spec.get('all_sheets', False)),
+        'sheets': spec.get('sheets'),
+        'per_sheet': bool(spec.get('per_sheet', False)),
+        'trace': spec.get('trace'),
+    }
+    if not job['source']:
+        raise ValueError("缺少 source (源文件)")
+    if not os.path.isfile(job['source']):
+        raise ValueError(f"源文件不存在: {job['source']}")
+    if bool(job['output']) == bool(job['output_dir']):
+        raise ValueError("需要指定 output (合并为一个文件) 或 output_dir (多个文件) 之一")
+    conditions = spec.get('conditions')
+    if conditions is None and spec.get('conditions_file'):
+        conditions = split_engine.load_conditions(spec['conditions_file'])
+    if not isinstance(conditions, list) or not conditions:
+        raise ValueError("缺少 conditions (条件列表) 或 conditions_file")
+    job['conditions'] = conditions
+    if job['format'] not in split_writers.available_formats():
+        raise ValueError(f"不支持的输出格式: {job['format']}")
+    if job['output'] and job['format'] != split_writers.FORMAT_XLSX:
+        raise ValueError("CSV/Parquet/Feather 格式只能拆分为多个独立文件 (output_dir)")
+    if job['writer'] not in split_writers.available_backends():
+        raise ValueError(f"不支持的写入引擎: {job['writer']}")
+    if job['dtypes'] not in split_dtypes.available_modes():
+        raise ValueError(f"不支持的列类型模式: {job['dtypes']}")
+    if job['sheets'] is not None and not isinstance(job['sheets'], list):
+        raise ValueError("sheets 必须是工作表名称列表")
+    multi = job['all_sheets'] or job['sheets']
+    if multi and (job['stream'] or job['incremental']):
+        raise ValueError("多工作表模式不能与 stream 或 incremental 同时使用")
+    if job['stream'] and job['incremental']:
+        raise ValueError("stream 与 incremental 不能同时使用")
+    return job
+
+
+def run_job(job, cache=None, progress=None, cancelled=None, tracer=None):
+    """Run a parse_spec()'d job. Returns (written, incremental status or None)."""
+    if job['output']:
+        mode, output = split_engine.MODE_SINGLE_FILE, job['output']
+    else:
+        mode, output = split_engine.MODE_MULTI_FILES, job['output_dir']
+        os.makedirs(output, exist_ok=True)
+    routing = split_engine.ROUTING_FIRST if job['exclusive'] else split_engine.ROUTING_ALL
+    options = dict(progress=progress, cancelled=cancelled, backend=job['writer'], routing=routing,
+                   tracer=tracer, fmt=job['format'], compression=job['compression'])
+
+    if job['all_sheets'] or job['sheets']:
+        combine = split_engine.SHEETS_SEPARATE if job['per_sheet'] else split_engine.SHEETS_COMBINE
+        written = split_engine.split_sheets(job['source'], None if job['all_sheets'] else job['sheets'],
+                                            job['conditions'], mode, output, combine, workers=job['jobs'],
+                                            cache=cache, dtypes=job['dtypes'], **options)
+        return written, None
+
+    sheet = job['sheet'] or cache.sheet_names(job['source'])[0]
+    if job['stream']:
+        written = split_engine.stream_split(job['source'], sheet, job['conditions'], mode, output,
+                                            job['chunk_rows'], **options)
+        return written, None
+    if job['incremental']:
+        status, written = split_incremental.incremental_split(
+            job['source'], sheet, job['conditions'], mode, output, job['manifest'], cache=cache,
+            workers=job['jobs'], dtypes=job['dtypes'], **options)
+        return written, status
+    written = split_engine.run_split(job['source'], sheet, job['conditions'], mode, output, cache=cache,
+                                     workers=job['jobs'], dtypes=job['dtypes'], **options)
+    return written, None
+
+
+class Job:
+    def __init__(self, job_id, spec):
+        self.id = job_id
+        self.spec = spec
+        self.state = STATE_QUEUED
+        self.progress = None  # (phase, done, total)
+        self.written = []
+        self.status = None
+        self.error = None
+        self.rows = None
+        self.summary = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+    def to_dict(self):
+        spec = {k: v for k, v in self.spec.items() if k != 'conditions'}
+        spec['conditions'] = len(self.spec['conditions'])
+        progress = None
+        if self.progress is not None:
+            phase, done, total = self.progress
+            progress = {'phase': phase, 'done': done, 'total': total}
+        return {
+            'id': self.id,
+            'state': self.state,
+            'spec': spec,
+            'progress': progress,
+            'written': self.written,
+            'status': self.status,
+            'error': self.error,
+            'rows': self.rows,
+            'summary': self.summary,
+            'submitted': _timestamp(self.submitted),
+            'started': _timestamp(self.started),
+            'finished': _timestamp(self.finished),
+            'seconds': self.seconds,
+        }
+
+
+class SplitService:
+    """Job queue plus worker threads sharing one workbook cache."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, cache=None):
+        self.workers = workers
+        self.cache = cache if cache is not None else WorkbookCache()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()  # id -> Job, oldest first
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+        self._finished = deque(maxlen=1000)  # (finish time, seconds, rows) of recent jobs
+        self.counts = {state: 0 for state in FINISHED_STATES}
+        self.started = time.time()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"split-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for job in self.jobs():
+            if job.state not in FINISHED_STATES:
+                job.cancel_requested = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, spec):
+        """Queue a job. Raises ValueError for an invalid spec, QueueFull when
+        the queue is full."""
+        job = Job(f"{time.strftime('%Y%m%d%H%M%S')}-{next(self._ids)}", parse_spec(spec))
+        # Registered before it is queued, so a worker that picks it up at
+        # once never finishes a job the status queries can't see yet
+        with self._lock:
+            self._jobs[job.id] = job
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                del self._jobs[job.id]
+                raise QueueFull(f"队列已满 ({self._queue.maxsize} 个任务等待中)") from None
+            self._trim()
+        return job
+
+    def _trim(self):
+        finished = [j for j in self._jobs.values() if j.state in FINISHED_STATES]
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.state not in FINISHED_STATES:
+            job.cancel_requested = True
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancel_requested:
+                self._finish(job, STATE_CANCELLED)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job.state = STATE_RUNNING
+        job.started = time.time()
+        tracer = split_trace.Tracer()
+
+        def progress(phase, done, total):
+            job.progress = (phase, done, total)
+
+        try:
+            job.written, job.status = run_job(job.spec, self.cache, progress, lambda: job.cancel_requested,
+                                              tracer)
+            state = STATE_SUCCEEDED
+        except split_engine.SplitCancelled:
+            state = STATE_CANCELLED
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            state = STATE_FAILED
+        job.rows = sum(s['rows'] or 0 for s in tracer.spans if s['name'] in _READ_SPANS)
+        job.summary = tracer.summary()
+        if job.spec['trace']:
+            try:
+                tracer.save(job.spec['trace'], split_trace.FORMAT_CHROME)
+            except OSError as e:
+                job.summary.append(f"性能跟踪保存失败: {e}")
+        self._finish(job, state)
+
+    def _finish(self, job, state):
+        job.finished = time.time()
+        job.state = state
+        with self._lock:
+            self.counts[state] += 1
+            if state == STATE_SUCCEEDED:
+                self._finished.append((job.finished, job.seconds, job.rows or 0))
+            self._trim()
+
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            states = [j.state for j in self._jobs.values()]
+            finished = list(self._finished)
+            counts = dict(self.counts)
+        recent = [f for f in finished if now - f[0] <= 60]
+        busy = sum(f[1] for f in finished)
+        return {
+            'uptime': now - self.started,
+            'workers': self.workers,
+            'queued': states.count(STATE_QUEUED),
+            'running': states.count(STATE_RUNNING),
+            'queue_capacity': self._queue.maxsize,
+            'jobs': counts,
+            'jobs_last_minute': len(recent),
+            'avg_job_seconds': busy / len(finished) if finished else None,
+            'rows_per_second': sum(f[2] for f in finished) / busy if busy > 0 else None,
+            'cache': self.cache.stats(),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ExcelSplitter/1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, message):
+        self._send(code, {'error': message})
+
+    def _parts(self):
+        return [p for p in self.path.split('?', 1)[0].split('/') if p]
+
+    def do_GET(self):
+        parts = self._parts()
+        if parts == ['health']:
+            self._send(200, {'ok': True})
+        elif parts == ['metrics']:
+            self._send(200, self.service.metrics())
+        elif parts == ['jobs']:
+            self._send(200, [j.to_dict() for j in reversed(self.service.jobs())])
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                self._error(404, "任务不存在")
+            else:
+                self._send(200, job.to_dict())
+        else:
+            self._error(404, "未知的路径")
+
+    def do_POST(self):
+        parts = self._parts()
+        if parts != ['jobs']:
+            self._error(404, "未知的路径")
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._error(413, "请求过大")
+            return
+        try:
+            spec = json.loads(self.rfile.read(length).decode('utf-8'))
+            job = self.service.submit(spec)
+        except QueueFull as e:
+            self._error(503, str(e))
+        except (ValueError, TypeError, OSError) as e:
+            self._error(400, str(e))
+        else:
+            self._send(202, {'id': job.id, 'state': job.state})
+
+    def do_DELETE(self):
+        parts = self._parts()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._error(404, "未知的路径")
+            return
+        job = self.service.cancel(parts[1])
+        if job is None:
+            self._error(404, "任务不存在")
+        else:
+            self._send(200, {'id': job.id, 'state': job.state})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, verbose=False):
+    if unix_socket:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("此系统不支持 Unix 套接字")
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, _Handler)
+    else:
+        server = _HTTPServer((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+class ServiceClient:
+    """Minimal client for the HTTP API (TCP only)."""
+
+    def __init__(self, url=DEFAULT_URL, timeout=10):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error')
+            except ValueError:
+                message = None
+            raise RuntimeError(message or f"HTTP {e.code}") from None
+        except urllib.error.URLError as e:
+            raise RuntimeError(f"无法连接拆分服务 {self.url}: {e.reason}") from None
+
+    def submit(self, spec):
+        return self._request('POST', '/jobs', spec)['id']
+
+    def job(self, job_id):
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id):
+        return self._request('DELETE', f'/jobs/{job_id}')
+
+    def metrics(self):
+        return self._request('GET', '/metrics')
+
+    def wait(self, job_id, interval=0.5, on_update=None):
+        """Poll until the job finishes; returns its final status dict."""
+        while True:
+            job = self.job(job_id)
+            if on_update is not None:
+                on_update(job)
+            if job['state'] in FINISHED_STATES:
+                return job
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Excel条件拆分器 本地拆分服务")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="监听地址 (默认仅本机)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument('--socket', help="改为监听 Unix 套接字文件")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="同时运行的任务数")
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE_SIZE, help="等待队列长度上限")
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="内存中保留已解析工作表的容量上限 (MB)")
+    parser.add_argument('--disk-cache', action='store_true', help="同时使用磁盘缓存 (需要 pyarrow)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="磁盘缓存目录")
+    parser.add_argument('-v', '--verbose', action='store_true', help="输出每个请求的日志")
+    args = parser.parse_args(argv)
+
+    sidecar = None
+    if args.disk_cache:
+        sidecar = SidecarCache(args.cache_dir)
+        if not sidecar.available:
+            parser.error("--disk-cache 需要安装 pyarrow")
+    service = SplitService(args.workers, args.queue, WorkbookCache(args.cache_mb * 1024 * 1024, sidecar))
+    try:
+        server = make_server(service, args.host, args.port, args.socket, args.verbose)
+    except (OSError, ValueError) as e:
+        print(f"无法启动服务: {e}", file=sys.stderr)
+        return 1
+    service.start()
+    where = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"拆分服务已启动: {where} ({args.workers} 个工作线程, Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
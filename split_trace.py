@@ -0,0 +1,163 @@
+"""
+Excel条件拆分器 - 性能跟踪
+
+Records wall time, rows and peak RSS for each phase of a split (file
+open, sheet parse, mask evaluation per condition, write per output) so a
+slow run can be pinned on a regex, a writer or the parse:
+
+    tracer = Tracer()
+    run_split(..., tracer=tracer)
+    print("\\n".join(tracer.summary()))
+    tracer.save("split.json")                          # plain JSON
+    tracer.save("split.trace.json", FORMAT_CHROME)     # chrome://tracing, Perfetto
+
+Engine functions take `tracer=None` and wrap their phases in span(),
+which costs nothing when no tracer is given.
+
+Peak RSS: the process high-water mark is read before and after each
+phase; if the phase raised it, that is the phase's peak, otherwise the
+RSS at the end of the phase is reported. psutil is used when installed
+(needed for the current RSS and on Windows).
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+FORMAT_JSON = 'json'
+FORMAT_CHROME = 'chrome'
+
+
+def current_rss():
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss():
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        if hasattr(info, 'peak_wset'):  # Windows
+            return info.peak_wset
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return None
+
+
+def _mb(nbytes):
+    return "-" if nbytes is None else f"{nbytes / 1024 / 1024:.0f} MB"
+
+
+class Tracer:
+    def __init__(self, origin=None):
+        """`origin`: time.perf_counter() value the span times are relative
+        to (default: now)."""
+        now = time.perf_counter()
+        self.spans = []
+        self.origin = now if origin is None else origin
+        self.started = time.time() - (now - self.origin)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, cat, **args):
+        """Time the block as one phase. The yielded dict can be updated,
+        e.g. span['rows'] = len(df)."""
+        info = {'name': name, 'cat': cat, 'rows': None, 'args': args}
+        peak_before = peak_rss()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            end = time.perf_counter()
+            peak_after = peak_rss()
+            if peak_before is not None and peak_after is not None and peak_after > peak_before:
+                peak = peak_after
+            else:
+                peak = current_rss()
+            info.update(start=start - self.origin, seconds=end - start, peak_rss=peak,
+                        tid=threading.get_ident())
+            with self._lock:
+                self.spans.append(info)
+
+    def add(self, name, cat, start, end, **args):
+        """Record a phase timed by the caller (time.perf_counter() values),
+        e.g. one that ran before the tracer existed."""
+        info = {'name': name, 'cat': cat, 'rows': None, 'args': args, 'start': start - self.origin,
+                'seconds': end - start, 'peak_rss': current_rss(), 'tid': threading.get_ident()}
+        with self._lock:
+            self.spans.append(info)
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def summary(self, limit=6):
+        """Lines for the slowest phases (same-named phases added up, e.g.
+        every chunk of a streamed read), plus the overall time and peak."""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for s in spans:
+            entry = totals.setdefault((s['cat'], s['name']), {'seconds': 0.0, 'rows': 0, 'count': 0, 'peak': None})
+            entry['seconds'] += s['seconds']
+            entry['count'] += 1
+            if s['rows'] is not None:
+                entry['rows'] += s['rows']
+            if s['peak_rss'] is not None:
+                entry['peak'] = max(entry['peak'] or 0, s['peak_rss'])
+        slowest = sorted(totals.items(), key=lambda kv: kv[1]['seconds'], reverse=True)[:limit]
+        lines = [f"总耗时 {self.elapsed():.2f}s，内存峰值 {_mb(peak_rss())}"]
+        for (_, name), e in slowest:
+            count = f" x{e['count']}" if e['count'] > 1 else ""
+            rows = f"，{e['rows']} 行" if e['rows'] else ""
+            lines.append(f"{name}{count}: {e['seconds']:.2f}s{rows}，峰值 {_mb(e['peak'])}")
+        return lines
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s['start'])
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': self.elapsed(),
+            'peak_rss': peak_rss(),
+            'spans': spans,
+        }
+
+    def to_chrome_trace(self):
+        """Chrome trace event format (complete events, microseconds)."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for s in spans:
+            args = dict(s['args'], rows=s['rows'], peak_rss=s['peak_rss'])
+            events.append({
+                'name': s['name'], 'cat': s['cat'], 'ph': 'X', 'pid': pid, 'tid': s['tid'],
+                'ts': round(s['start'] * 1e6), 'dur': round(s['seconds'] * 1e6), 'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path, fmt=FORMAT_JSON):
+        data = self.to_chrome_trace() if fmt == FORMAT_CHROME else self.to_dict()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, default=str)
+
+
+def span(tracer, name, cat, **args):
+    """tracer.span(...), or a no-op block when `tracer` is None."""
+    if tracer is None:
+        return nullcontext({})
+    return tracer.span(name, cat, **args)
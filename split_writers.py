@@ -0,0 +1,382 @@
+"""
+Excel条件拆分器 - 输出写入
+
+Streaming workbook writers used by split_engine. Every backend has the
+same small interface:
+
+    book = open_book(path, backend)
+    ws = book.add_sheet(name, columns)
+    book.append(ws, df)       # may be called many times per sheet
+    book.close()              # or book.abort() to give up
+
+Rows are written in order and not kept in memory:
+- 'xlsxwriter': XlsxWriter in constant_memory mode. Each row is flushed to
+  a per-sheet temp file as soon as the next row starts; strings are stored
+  inline instead of in the shared string table.
+- 'openpyxl': openpyxl write-only workbook (the engine pandas used before).
+
+Outputs read by other programs rather than by people can skip XLSX
+entirely (`fmt`); these hold one table per file:
+- 'csv': appended with DataFrame.to_csv, UTF-8 with BOM so Excel shows
+  Chinese text correctly.
+- 'parquet': pyarrow ParquetWriter, one row group per append, with a
+  choice of compression.
+- 'feather': Arrow IPC file (Feather v2), uncompressed so readers can
+  memory-map it.
+The backend only applies to 'xlsx'.
+
+append_book() reopens an existing xlsx or csv output to add rows to it
+(used by incremental splits).
+"""
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from split_options import (WRITER_XLSXWRITER, WRITER_OPENPYXL, FORMAT_XLSX, FORMAT_CSV,  # noqa: F401
+                           FORMAT_PARQUET, FORMAT_FEATHER, PARQUET_COMPRESSIONS,
+                           available_backends, default_backend, available_formats)
+
+# Same look as the header pandas.to_excel writes
+HEADER_STYLE = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+INVALID_SHEET_CHARS = '[]:*?/\\'
+MAX_SHEET_NAME = 31
+
+FORMAT_EXTENSIONS = {
+    FORMAT_XLSX: '.xlsx',
+    FORMAT_CSV: '.csv',
+    FORMAT_PARQUET: '.parquet',
+    FORMAT_FEATHER: '.feather',
+}
+CSV_ENCODING = 'utf-8-sig'
+
+
+def excel_row(row):
+    out = []
+    for v in row:
+        if v is None or (isinstance(v, float) and v != v) or v is pd.NaT:
+            out.append(None)
+        elif isinstance(v, pd.Timestamp):
+            out.append(v.to_pydatetime())
+        else:
+            out.append(v)
+    return out
+
+
+def _dedup_sheet_name(name, sheets):
+    # Excel rejects some characters and names over 31 characters; names
+    # built from cell values (e.g. dates) can hit both
+    name = "".join('_' if c in INVALID_SHEET_CHARS else c for c in str(name)).strip("'") or "Sheet"
+    name = name[:MAX_SHEET_NAME]
+    # Check dedup (Excel compares sheet names case-insensitively)
+    taken = {s.lower() for s in sheets}
+    counter = len(sheets)
+    base = name
+    while name.lower() in taken:
+        suffix = f"_{counter}"
+        name = f"{base[:MAX_SHEET_NAME - len(suffix)]}{suffix}"
+        counter += 1
+    return name
+
+
+class XlsxWriterBook:
+    def __init__(self, path):
+        import xlsxwriter
+        self.path = path
+        self.wb = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'nan_inf_to_errors': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+            'default_date_format': DATETIME_FORMAT,
+        })
+        self.header_format = self.wb.add_format(HEADER_STYLE)
+        self.sheets = {}
+        self._next_row = {}
+
+    def add_sheet(self, name, columns):
+        name = _dedup_sheet_name(name, self.sheets)
+        ws = self.wb.add_worksheet(name)
+        ws.write_row(0, 0, [str(c) for c in columns], self.header_format)
+        self.sheets[name] = ws
+        self._next_row[name] = 1
+        return name
+
+    def append(self, ws, df):
+        sheet = self.sheets[ws]
+        r = self._next_row[ws]
+        for row in df.itertuples(index=False, name=None):
+            sheet.write_row(r, 0, excel_row(row))
+            r += 1
+        self._next_row[ws] = r
+
+    def close(self):
+        self.wb.close()
+
+    def abort(self):
+        try:
+            self.wb.close()
+        finally:
+            _remove(self.path)
+
+
+class OpenpyxlBook:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.sheets = {}
+
+    def add_sheet(self, name, columns):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, Side
+        name = _dedup_sheet_name(name, self.sheets)
+        ws = self.wb.create_sheet(title=name)
+        thin = Side(style='thin')
+        header = []
+        for c in columns:
+            cell = WriteOnlyCell(ws, value=str(c))
+            cell.font = Font(bold=True)
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            cell.alignment = Alignment(horizontal='center', vertical='top')
+            header.append(cell)
+        ws.append(header)
+        self.sheets[name] = ws
+        return name
+
+    def append(self, ws, df):
+        sheet = self.sheets[ws]
+        for row in df.itertuples(index=False, name=None):
+            sheet.append(excel_row(row))
+
+    def close(self):
+        self.wb.save(self.path)
+
+    def abort(self):
+        # Close the sheets' row writers so their temp files go now
+        for ws in self.sheets.values():
+            try:
+                ws.close()
+            except Exception:
+                pass
+        _remove(self.path)
+
+
+class _SingleTableBook:
+    """Base for formats holding one table per file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+
+    def add_sheet(self, name, columns):
+        if self.columns is not None:
+            raise ValueError(f"{os.path.basename(self.path)} 只能保存一个表")
+        self.columns = [str(c) for c in columns]
+        return name
+
+    def abort(self):
+        try:
+            self._close_writer()
+        except Exception:
+            pass
+        _remove(self.path)
+
+
+class CsvBook(_SingleTableBook):
+    def __init__(self, path):
+        super().__init__(path)
+        self.f = open(path, 'w', encoding=CSV_ENCODING, newline='')
+
+    def add_sheet(self, name, columns):
+        name = super().add_sheet(name, columns)
+        pd.DataFrame(columns=self.columns).to_csv(self.f, index=False)
+        return name
+
+    def append(self, ws, df):
+        df.to_csv(self.f, index=False, header=False)
+
+    def _close_writer(self):
+        self.f.close()
+
+    def close(self):
+        self._close_writer()
+
+
+def arrow_table(df):
+    """DataFrame to Arrow table. Columns mixing numbers and text (common in
+    hand-edited sheets) can't be typed by Arrow and are stored as text."""
+    arrays = []
+    for col in df.columns:
+        try:
+            arrays.append(pa.array(df[col], from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if pd.isna(v) else str(v) for v in df[col]], type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+
+class _ArrowBook(_SingleTableBook):
+    """Arrow-based formats. The schema is fixed by the first append; later
+    appends (streamed chunks) are cast to it."""
+
+    def __init__(self, path):
+        if pa is None:
+            raise ValueError("Parquet/Feather 格式需要安装 pyarrow")
+        super().__init__(path)
+        self.writer = None
+        self.schema = None
+
+    def append(self, ws, df):
+        table = arrow_table(df)
+        if self.writer is None:
+            # A column that is empty in the first chunk would be typed null
+            self.schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                                     for f in table.schema])
+            self.writer = self._open(self.schema)
+        if not table.schema.equals(self.schema):
+            try:
+                table = table.cast(self.schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise ValueError(f"{os.path.basename(self.path)}: 各分块的列类型不一致，"
+                                 f"流式处理时请改用xlsx或CSV格式 ({e})")
+        self.writer.write_table(table)
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def close(self):
+        if self.writer is None:
+            # No rows: still write the header
+            self.append(None, pd.DataFrame(columns=self.columns or []))
+        self._close_writer()
+
+
+class ParquetBook(_ArrowBook):
+    def __init__(self, path, compression='snappy'):
+        super().__init__(path)
+        self.compression = compression or 'none'
+
+    def _open(self, schema):
+        return pq.ParquetWriter(self.path, schema, compression=self.compression)
+
+
+class FeatherBook(_ArrowBook):
+    def _open(self, schema):
+        return pa.ipc.new_file(self.path, schema)
+
+
+class XlsxAppendBook:
+    """An existing xlsx opened to add rows. openpyxl loads the whole
+    workbook, and close() saves it again through a temp file, so the
+    original stays intact if anything fails before then."""
+
+    def __init__(self, path):
+        from openpyxl import load_workbook
+        self.path = path
+        self.wb = load_workbook(path)
+
+    def sheet(self, name):
+        # Single-output files have one sheet, whatever it was named
+        return name if name in self.wb.sheetnames else self.wb.sheetnames[0]
+
+    def add_sheet(self, name, columns):
+        from openpyxl.styles import Alignment, Border, Font, Side
+        name = _dedup_sheet_name(name, self.wb.sheetnames)
+        ws = self.wb.create_sheet(title=name)
+        ws.append([str(c) for c in columns])
+        thin = Side(style='thin')
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            cell.alignment = Alignment(horizontal='center', vertical='top')
+        return name
+
+    def append(self, ws, df):
+        sheet = self.wb[ws]
+        for row in df.itertuples(index=False, name=None):
+            sheet.append(excel_row(row))
+
+    def close(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            self.wb.save(tmp)
+            os.replace(tmp, self.path)
+        except BaseException:
+            _remove(tmp)
+            raise
+
+    def abort(self):
+        pass
+
+
+class CsvAppendBook:
+    """An existing csv opened to add rows; abort() truncates it back."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.f = open(path, 'a', encoding=CSV_ENCODING, newline='')
+
+    def sheet(self, name):
+        return name
+
+    def add_sheet(self, name, columns):
+        raise ValueError(f"{os.path.basename(self.path)} 只能保存一个表")
+
+    def append(self, ws, df):
+        df.to_csv(self.f, index=False, header=False)
+
+    def close(self):
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(self.size)
+
+
+def append_book(path, fmt=FORMAT_XLSX):
+    if fmt == FORMAT_XLSX:
+        return XlsxAppendBook(path)
+    if fmt == FORMAT_CSV:
+        return CsvAppendBook(path)
+    raise ValueError(f"{fmt} 格式不支持追加写入")
+
+
+BACKENDS = {
+    WRITER_XLSXWRITER: XlsxWriterBook,
+    WRITER_OPENPYXL: OpenpyxlBook,
+}
+
+
+def open_book(path, backend=None, fmt=FORMAT_XLSX, compression=None):
+    """Open a writer for `path`. `backend` picks the XLSX engine,
+    `compression` the Parquet codec."""
+    if fmt == FORMAT_CSV:
+        return CsvBook(path)
+    if fmt == FORMAT_PARQUET:
+        return ParquetBook(path, compression)
+    if fmt == FORMAT_FEATHER:
+        return FeatherBook(path)
+    if fmt != FORMAT_XLSX:
+        raise ValueError(f"未知的输出格式: {fmt}")
+    if backend is None:
+        backend = default_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的写入引擎: {backend}")
+    return BACKENDS[backend](path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
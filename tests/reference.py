@@ -0,0 +1,126 @@
+"""
+Reference behaviour for the engine tests: the filtering of the original
+ExcelSplitterApp.start_split (one mask per condition on the sheet as
+pandas parses it), plus helpers to build workbooks and read outputs.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import split_engine
+
+UNMATCHED = split_engine.UNMATCHED_NAME
+
+
+def make_frame(rows=400, seed=0, score_max=100):
+    """A sheet like 测试数据生成.py's: a score column with the odd text
+    entry and blanks, low-cardinality text, unique IDs and floats."""
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, score_max, rows).astype(object)
+    scores[rng.random(rows) < 0.05] = "缺考"
+    scores[rng.random(rows) < 0.03] = None
+    comments = rng.choice(["表现优秀", "有进步", "缺勤两次", "需加强练习", None], rows)
+    return pd.DataFrame({
+        '学号': [f"2023{i:04d}" for i in range(rows)],
+        '班级': rng.choice([f"{c}班" for c in "ABCDE"], rows),
+        '分数': scores,
+        '评语': comments,
+        '时长': np.round(rng.random(rows) * 10, 2),
+    })
+
+
+def write_workbook(path, sheets):
+    """Write {sheet: frame} to an xlsx and return the path."""
+    with pd.ExcelWriter(path) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return str(path)
+
+
+def read_sheet(path, sheet=0):
+    return pd.read_excel(path, sheet_name=sheet, engine=split_engine.READ_ENGINE)
+
+
+def baseline_mask(df, cond):
+    """The mask start_split built for one numeric/text/regex condition."""
+    params = cond['params']
+    t_id = cond['type_id']
+    if t_id == split_engine.TYPE_NUMERIC:
+        series = pd.to_numeric(df[cond['col']], errors='coerce')
+        op = params['op']
+        if op == 'range':
+            mask = (series >= min(params['v1'], params['v2'])) & (series <= max(params['v1'], params['v2']))
+        else:
+            mask = {'>=': series >= params['v1'], '>': series > params['v1'], '<=': series <= params['v1'],
+                    '<': series < params['v1'], '==': series == params['v1']}[op]
+    elif t_id == split_engine.TYPE_TEXT:
+        mask = df[cond['col']].astype(str).str.contains(params['text'], regex=False, na=False)
+    elif t_id == split_engine.TYPE_REGEX:
+        mask = df[cond['col']].astype(str).str.contains(params['pattern'], regex=True, na=False)
+    else:
+        raise ValueError(t_id)
+    if cond.get('is_negate', False):
+        mask = ~mask
+    return mask.to_numpy(dtype=bool)
+
+
+def baseline_split(df, conditions):
+    """[(output_name, row positions)] for every condition that matched."""
+    results = []
+    for cond in conditions:
+        positions = np.flatnonzero(baseline_mask(df, cond))
+        if len(positions):
+            results.append((cond['output_name'], positions.tolist()))
+    return results
+
+
+def baseline_first(df, conditions):
+    """Exclusive routing over the baseline masks: each row goes to the first
+    condition it matches, the rest to UNMATCHED."""
+    taken = np.zeros(len(df), dtype=bool)
+    results = []
+    for cond in conditions:
+        mask = baseline_mask(df, cond) & ~taken
+        taken |= mask
+        if mask.any():
+            results.append((cond['output_name'], np.flatnonzero(mask).tolist()))
+    if not taken.all():
+        results.append((UNMATCHED, np.flatnonzero(~taken).tolist()))
+    return results
+
+
+def engine_rows(results):
+    """execute_plan results as [(output_name, row positions)]."""
+    return [(name, split_engine._result_frame(res).index.tolist()) for res, name in results]
+
+
+def read_output(path):
+    ext = os.path.splitext(path)[1]
+    if ext == '.parquet':
+        return pd.read_parquet(path)
+    if ext == '.feather':
+        return pd.read_feather(path)
+    if ext == '.csv':
+        return pd.read_csv(path, encoding='utf-8-sig')
+    return read_sheet(path)
+
+
+def read_outputs(paths):
+    """{file name without extension: frame}"""
+    return {os.path.splitext(os.path.basename(p))[0]: read_output(p) for p in paths}
+
+
+def plain(df):
+    """`df` with categoricals and string dtypes as object and numbers at
+    64 bits, for comparing frames written through different paths."""
+    out = df.reset_index(drop=True).copy()
+    for col in out.columns:
+        series = out[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or not isinstance(series.dtype, np.dtype):
+            out[col] = series.astype(object).where(series.notna(), None)
+        elif series.dtype.kind in 'iu':
+            out[col] = series.astype(np.int64)
+        elif series.dtype.kind == 'f':
+            out[col] = series.astype(np.float64)
+    return out
@@ -0,0 +1,62 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import split_cache
+import split_dtypes
+import split_engine
+from reference import make_frame, write_workbook
+
+pytest.importorskip('pyarrow')
+
+
+def test_encode_mixed_round_trip():
+    values = [None, "缺考", True, 3, np.int64(4), 2.5, pd.NaT, pd.Timestamp('2024-01-02 03:04:05'),
+              datetime.datetime(2024, 5, 6, 7, 8), datetime.time(9, 30)]
+    df = pd.DataFrame({'n': range(len(values)), 'mixed': pd.Series(values, dtype=object)})
+    encoded, positions, categories = split_cache.encode_mixed(df)
+    assert positions == [1]
+    assert categories == {}
+    decoded = split_cache.decode_mixed(encoded, positions)
+    assert list(decoded.columns) == ['n', 'mixed']
+    # Numpy scalars come back as the python types they print as
+    expected = [v.item() if isinstance(v, np.generic) else v for v in values]
+    assert decoded['mixed'][0] is None and decoded['mixed'][6] is pd.NaT
+    cells = [(type(v), v) for i, v in enumerate(decoded['mixed']) if i not in (0, 6)]
+    assert cells == [(type(v), v) for i, v in enumerate(expected) if i not in (0, 6)]
+
+
+def test_encode_mixed_categorical_keeps_categories():
+    df = pd.DataFrame({'score': pd.Categorical([90, "缺考", 90, None, 75], categories=[75, 90, "缺考"])})
+    encoded, positions, categories = split_cache.encode_mixed(df)
+    assert positions == [] and list(categories) == [0]
+    pd.testing.assert_frame_equal(split_cache.decode_mixed(encoded, positions, categories), df)
+
+
+def test_encode_mixed_leaves_arrow_columns_alone():
+    df = pd.DataFrame({'a': ["x", None], 'b': [1.5, 2.0]})
+    encoded, positions, categories = split_cache.encode_mixed(df)
+    assert encoded is df and positions == [] and categories == {}
+
+
+@pytest.mark.parametrize('dtypes', split_dtypes.available_modes())
+def test_sidecar_round_trip_with_mixed_column(tmp_path, dtypes):
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': make_frame(300)})
+    df = split_engine.load_source(source, 'Sheet1', dtypes=dtypes)
+
+    cache = split_cache.SidecarCache(str(tmp_path / 'cache'))
+    assert cache.store(source, 'Sheet1', df, dtypes), cache.last_error
+    loaded = cache.load(source, 'Sheet1', dtypes)
+    pd.testing.assert_frame_equal(loaded, df)
+    assert [type(v) for v in loaded['分数']] == [type(v) for v in df['分数']]
+
+
+def test_sidecar_store_reports_unsupported_cells(tmp_path):
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': make_frame(5)})
+    df = pd.DataFrame({'x': pd.Series([1, "a", object()], dtype=object)})
+    cache = split_cache.SidecarCache(str(tmp_path / 'cache'))
+    assert not cache.store(source, 'Sheet1', df)
+    assert cache.last_error
+    assert cache.load(source, 'Sheet1') is None
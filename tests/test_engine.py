@@ -0,0 +1,229 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import split_engine
+from reference import (UNMATCHED, baseline_first, baseline_mask, baseline_split, engine_rows, make_frame,
+                       plain, read_outputs, read_sheet, write_workbook)
+
+CONDITIONS = [
+    {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 90}, 'output_name': '优秀'},
+    {'col': '分数', 'type_id': 0, 'params': {'op': 'range', 'v1': 80, 'v2': 60}, 'output_name': '及格'},
+    {'col': '评语', 'type_id': 1, 'params': {'text': '缺勤'}, 'output_name': '缺勤'},
+    {'col': '评语', 'type_id': 1, 'params': {'text': '进步'}, 'output_name': '非进步', 'is_negate': True},
+    {'col': '学号', 'type_id': 2, 'params': {'pattern': r'^2023\d{2}7'}, 'output_name': '学号'},
+    {'col': '时长', 'type_id': 0, 'params': {'op': '<', 'v1': 2.5}, 'output_name': '时长短'},
+]
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    return write_workbook(tmp_path_factory.mktemp('src') / 'src.xlsx', {'Sheet1': make_frame()})
+
+
+@pytest.mark.parametrize('dtypes', split_engine.split_dtypes.available_modes())
+def test_execute_plan_matches_baseline(source, dtypes):
+    expected = baseline_split(read_sheet(source), CONDITIONS)
+    df = split_engine.load_source(source, 'Sheet1', dtypes=dtypes)
+    results = split_engine.execute_plan(df, split_engine.compile_plan(CONDITIONS, df.columns))
+    assert engine_rows(results) == expected
+
+
+def test_run_split_multi_files_writes_baseline_rows(source, tmp_path):
+    df = read_sheet(source)
+    written = split_engine.run_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES, str(tmp_path))
+    outputs = read_outputs(written)
+    for name, positions in baseline_split(df, CONDITIONS):
+        pd.testing.assert_frame_equal(plain(outputs[name]), plain(df.iloc[positions]), check_dtype=False)
+
+
+def test_run_split_single_file_has_one_sheet_per_output(source, tmp_path):
+    df = read_sheet(source)
+    output = str(tmp_path / 'out.xlsx')
+    split_engine.run_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_SINGLE_FILE, output)
+    sheets = pd.read_excel(output, sheet_name=None, engine=split_engine.READ_ENGINE)
+    expected = baseline_split(df, CONDITIONS)
+    assert list(sheets) == [name for name, _ in expected]
+    for name, positions in expected:
+        pd.testing.assert_frame_equal(plain(sheets[name]), plain(df.iloc[positions]), check_dtype=False)
+
+
+def test_run_split_without_matches_writes_nothing(source, tmp_path):
+    conditions = [{'col': '分数', 'type_id': 0, 'params': {'op': '>', 'v1': 1000}, 'output_name': '无'}]
+    assert split_engine.run_split(source, 'Sheet1', conditions, split_engine.MODE_MULTI_FILES,
+                                  str(tmp_path)) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_distinct_split_groups_every_value(source):
+    df = split_engine.load_source(source, 'Sheet1')
+    plan = split_engine.compile_plan([{'col': '评语', 'type_id': 3, 'params': {}, 'output_name': ''}], df.columns)
+    rows = dict(engine_rows(split_engine.execute_plan(df, plan)))
+    raw = read_sheet(source)['评语']
+    for value in raw.dropna().unique():
+        assert rows[value] == np.flatnonzero(raw.to_numpy() == value).tolist()
+    assert rows[split_engine.MISSING_VALUE_NAME] == np.flatnonzero(raw.isna()).tolist()
+
+
+@pytest.mark.parametrize('dtypes', split_engine.split_dtypes.available_modes())
+def test_exclusive_routing_takes_first_match(source, dtypes):
+    expected = baseline_first(read_sheet(source), CONDITIONS)
+    df = split_engine.load_source(source, 'Sheet1', dtypes=dtypes)
+    results = split_engine.execute_plan(df, split_engine.compile_plan(CONDITIONS, df.columns),
+                                        routing=split_engine.ROUTING_FIRST)
+    assert engine_rows(results) == expected
+    assert results[-1][1] == UNMATCHED
+
+
+def test_compound_matches_combined_baseline_masks(source):
+    children = [CONDITIONS[0], CONDITIONS[2], dict(CONDITIONS[4], is_negate=True)]
+    raw = read_sheet(source)
+    df = split_engine.load_source(source, 'Sheet1')
+    for op, combine in [('and', np.logical_and.reduce), ('or', np.logical_or.reduce)]:
+        cond = {'col': '分数, 评语, 学号', 'type_id': 5, 'output_name': op, 'is_negate': True,
+                'params': {'op': op, 'children': children}}
+        expected = ~combine([baseline_mask(raw, c) for c in children])
+        rows = engine_rows(split_engine.execute_plan(df, split_engine.compile_plan([cond], df.columns)))
+        assert rows == [(op, np.flatnonzero(expected).tolist())]
+
+
+@pytest.mark.parametrize('params', [
+    {'op': '<', 'v1': float('inf')},
+    {'op': '>=', 'v1': float('-inf')},
+    {'op': '>', 'v1': 'inf'},
+    {'op': '==', 'v1': float('nan')},
+    {'op': 'range', 'v1': float('-inf'), 'v2': 50},
+])
+def test_compound_with_non_finite_thresholds(source, params):
+    leaf = {'col': '分数', 'type_id': 0, 'params': params}
+    text = {'col': '评语', 'type_id': 1, 'params': {'text': '进步'}}
+    cond = {'col': '分数, 评语', 'type_id': 5, 'output_name': '组合', 'params': {'op': 'and', 'children': [
+        leaf, dict(text, is_negate=True)]}}
+    raw = read_sheet(source)
+    numeric = dict(leaf, params=dict(params, v1=float(params['v1'])))
+    expected = baseline_mask(raw, numeric) & ~baseline_mask(raw, text)
+    df = split_engine.load_source(source, 'Sheet1')
+    rows = engine_rows(split_engine.execute_plan(df, split_engine.compile_plan([cond], df.columns)))
+    assert rows == ([('组合', np.flatnonzero(expected).tolist())] if expected.any() else [])
+
+
+def test_compound_with_many_keywords():
+    df = pd.DataFrame({'t': [f"w{i}" for i in range(200)], 'n': np.arange(200)})
+    # Compound children written to the README's schema have no output_name
+    children = [{'col': 't', 'type_id': 1, 'params': {'text': f"w{i}x"}} for i in range(70)]
+    children += [{'col': 't', 'type_id': 1, 'params': {'text': "w15"}}]
+    cond = {'col': 't, n', 'type_id': 5, 'output_name': '组合', 'params': {'op': 'and', 'children': [
+        {'col': 't', 'type_id': 5, 'params': {'op': 'or', 'children': children}},
+        {'col': 'n', 'type_id': 0, 'params': {'op': '<', 'v1': 155}},
+    ]}}
+    rows = engine_rows(split_engine.execute_plan(df, split_engine.compile_plan([cond], df.columns)))
+    assert rows == [('组合', [15, 150, 151, 152, 153, 154])]
+
+
+def test_collect_sources_takes_file_names_literally(tmp_path):
+    path = write_workbook(tmp_path / '数据[2024].xlsx', {'Sheet1': make_frame(5)})
+    assert split_engine.collect_sources(path) == [path]
+    assert split_engine.collect_sources(str(tmp_path)) == [path]
+
+
+def test_collect_sources_skips_lock_files_and_other_files(tmp_path):
+    book = write_workbook(tmp_path / 'a.xlsx', {'Sheet1': make_frame(5)})
+    (tmp_path / '~$a.xlsx').write_bytes(b'')
+    (tmp_path / 'notes.txt').write_text('x')
+    assert split_engine.collect_sources(str(tmp_path)) == [book]
+    assert split_engine.collect_sources(str(tmp_path / '*.xlsx')) == [book]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_batch_splits_every_workbook(tmp_path, workers):
+    sources = [write_workbook(tmp_path / f"{name}.xlsx", {'Sheet1': make_frame(60, seed)})
+               for seed, name in enumerate(['北区', '南区'])]
+    (tmp_path / '坏.xlsx').write_bytes(b'not a workbook')
+    sources.append(str(tmp_path / '坏.xlsx'))
+    out = tmp_path / 'out'
+    out.mkdir()
+    outcome = split_engine.run_batch(sources, None, CONDITIONS, split_engine.MODE_MULTI_FILES, str(out),
+                                     workers=workers)
+    assert outcome[sources[2]][0] == [] and outcome[sources[2]][1]
+    for path in sources[:2]:
+        written, error = outcome[path]
+        assert error is None
+        df = read_sheet(path)
+        outputs = read_outputs(written)
+        for name, positions in baseline_split(df, CONDITIONS):
+            pd.testing.assert_frame_equal(plain(outputs[name]), plain(df.iloc[positions]), check_dtype=False)
+
+
+def test_match_preview_counts_match_baseline(source):
+    raw = read_sheet(source)
+    preview = split_engine.MatchPreview(split_engine.load_source(source, 'Sheet1'))
+    assert preview.exact and preview.total == len(raw)
+
+    masks = [baseline_mask(raw, cond) for cond in CONDITIONS]
+    counts, unmatched = preview.counts(CONDITIONS)
+    assert counts == [int(m.sum()) for m in masks]
+    assert unmatched == int((~np.logical_or.reduce(masks)).sum())
+
+    first = baseline_first(raw, CONDITIONS)
+    counts, unmatched = preview.counts(CONDITIONS, split_engine.ROUTING_FIRST)
+    assert [c for c in counts if c] == [len(rows) for name, rows in first if name != UNMATCHED]
+    assert unmatched == len(first[-1][1])
+
+
+def test_match_preview_skips_conditions_it_cannot_evaluate(source):
+    preview = split_engine.MatchPreview(split_engine.load_source(source, 'Sheet1'))
+    broken = [{'col': '没有这列', 'type_id': 1, 'params': {'text': 'x'}, 'output_name': 'a'},
+              {'col': '评语', 'type_id': 2, 'params': {'pattern': '('}, 'output_name': 'b'}]
+    counts, unmatched = preview.counts(broken + CONDITIONS[:1])
+    assert counts[:2] == [None, None] and counts[2] > 0
+    assert preview.mask(CONDITIONS[0]) is preview.mask(dict(CONDITIONS[0], output_name='改名'))
+
+
+def test_match_preview_estimates_large_sheets_from_a_sample():
+    df = pd.DataFrame({'n': np.arange(100_000)})
+    preview = split_engine.MatchPreview(df, max_rows=5_000)
+    assert not preview.exact and len(preview.df) == 5_000
+    counts, unmatched = preview.counts([{'col': 'n', 'type_id': 0, 'params': {'op': '<', 'v1': 25_000},
+                                         'output_name': 'a'}])
+    assert abs(counts[0] - 25_000) < 1_500
+    assert counts[0] + unmatched == pytest.approx(100_000, abs=1)
+
+
+@pytest.mark.parametrize('dense', [False, True])
+def test_row_selection_slices_cover_the_selection(dense):
+    df = pd.DataFrame({'v': np.arange(1000)})
+    mask = (df['v'] % 2 == 0) if dense else (df['v'] % 97 == 0)
+    rows = split_engine.RowSelection(df, mask.to_numpy())
+    assert (rows.bits is not None) == dense
+    assert len(rows) == mask.sum()
+    pd.testing.assert_frame_equal(rows.frame(), df[mask])
+    pd.testing.assert_frame_equal(pd.concat(rows.slices(slice_rows=64)), df[mask])
+
+
+def test_bands_write_one_named_output_per_band(source, tmp_path):
+    cond = {'col': '分数', 'type_id': 4, 'params': {'cuts': [72.5, 60]}, 'output_name': '分'}
+    bands = {
+        '分_60以下': {'op': '<', 'v1': 60},
+        '分_60-72.5': {'op': 'range', 'v1': 60, 'v2': 72.5},
+        '分_72.5及以上': {'op': '>=', 'v1': 72.5},
+    }
+    df = read_sheet(source)
+    expected = {name: df[baseline_mask(df, {'col': '分数', 'type_id': 0, 'params': params})]
+                for name, params in bands.items()}
+    # The baseline range includes its upper end; the band stops below it
+    expected['分_60-72.5'] = expected['分_60-72.5'][pd.to_numeric(expected['分_60-72.5']['分数']) < 72.5]
+
+    written = split_engine.run_split(source, 'Sheet1', [cond], split_engine.MODE_MULTI_FILES, str(tmp_path))
+    assert sorted(os.path.basename(p) for p in written) == sorted(f"{name}.xlsx" for name in bands)
+    outputs = read_outputs(written)
+    for name, rows in expected.items():
+        assert len(rows) > 0
+        pd.testing.assert_frame_equal(plain(outputs[name]), plain(rows), check_dtype=False)
+
+    output = str(tmp_path / 'bands.xlsx')
+    split_engine.run_split(source, 'Sheet1', [cond], split_engine.MODE_SINGLE_FILE, output)
+    sheets = pd.read_excel(output, sheet_name=None, engine=split_engine.READ_ENGINE)
+    assert list(sheets) == list(bands)
+    assert [len(sheets[name]) for name in bands] == [len(expected[name]) for name in bands]
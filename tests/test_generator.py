@@ -0,0 +1,29 @@
+import importlib
+
+import pytest
+
+import split_bench
+import split_engine
+
+generator = importlib.import_module("测试数据生成")
+
+
+@pytest.mark.parametrize('rows', [50, 1500])
+def test_ids_match_the_benchmark_regex(rows):
+    df = generator.make_frame(rows, cols=8, seed=0)
+    assert list(df.columns[:5]) == generator.BASE_COLUMNS and df.shape == (rows, 8)
+    ids = df['学号']
+    assert ids.is_unique and ids.str.len().nunique() == 1
+    plan = split_engine.compile_plan(split_bench.CASES['regex'], df.columns)
+    (rows_matched, _), = split_engine.execute_plan(df, plan)
+    assert len(rows_matched) == rows
+
+
+def test_readme_sample_keeps_three_digit_ids():
+    assert generator.make_frame(50)['学号'].str.fullmatch(r'2023\d{3}').all()
+
+
+def test_too_few_columns_is_an_error(tmp_path):
+    with pytest.raises(SystemExit):
+        generator.main(['--cols', '3', '-o', str(tmp_path / 'x.xlsx')])
+    assert not (tmp_path / 'x.xlsx').exists()
@@ -0,0 +1,152 @@
+import os
+
+import pandas as pd
+import pytest
+
+import split_engine
+import split_incremental
+import split_writers
+from reference import make_frame, plain, read_outputs, write_workbook
+
+CONDITIONS = [
+    {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 80}, 'output_name': '高分'},
+    {'col': '评语', 'type_id': 1, 'params': {'text': '进步'}, 'output_name': '进步'},
+]
+
+
+def rewrite(path, df):
+    """Rewrite the source with a distinct mtime so the manifest sees the change."""
+    stat = os.stat(path)
+    write_workbook(path, {'Sheet1': df})
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.mark.parametrize('fmt', split_incremental.APPENDABLE_FORMATS)
+def test_append_matches_full_split(tmp_path, fmt):
+    df = make_frame(300)
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': df.iloc[:200]})
+    out = tmp_path / 'out'
+    out.mkdir()
+    status, _ = split_incremental.incremental_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                                    str(out), fmt=fmt)
+    assert status == split_incremental.STATUS_FULL
+    status, _ = split_incremental.incremental_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                                    str(out), fmt=fmt)
+    assert status == split_incremental.STATUS_SKIPPED
+
+    rewrite(source, df)
+    status, written = split_incremental.incremental_split(source, 'Sheet1', CONDITIONS,
+                                                          split_engine.MODE_MULTI_FILES, str(out), fmt=fmt)
+    assert status == split_incremental.STATUS_APPENDED
+    assert written
+
+    fresh = tmp_path / 'fresh'
+    fresh.mkdir()
+    expected = read_outputs(split_engine.run_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                                   str(fresh), fmt=fmt))
+    outputs = read_outputs(str(out / name) for name in os.listdir(out) if not name.startswith('.'))
+    assert sorted(outputs) == sorted(expected)
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(plain(outputs[name]), plain(frame), check_dtype=False)
+
+
+def test_append_with_repeated_output_names(tmp_path):
+    # Both rules write "B"; the second gets B_1. New rows for the second
+    # rule must go to B_1 even when the first rule has nothing new
+    conditions = [
+        {'col': 'k', 'type_id': 1, 'params': {'text': 'a'}, 'output_name': 'B'},
+        {'col': 'k', 'type_id': 1, 'params': {'text': 'z'}, 'output_name': 'B'},
+    ]
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': pd.DataFrame({'k': ['a1', 'a2', 'z1']})})
+    out = tmp_path / 'out'
+    out.mkdir()
+    split_incremental.incremental_split(source, 'Sheet1', conditions, split_engine.MODE_MULTI_FILES, str(out))
+
+    rewrite(source, pd.DataFrame({'k': ['a1', 'a2', 'z1', 'z2']}))
+    status, written = split_incremental.incremental_split(source, 'Sheet1', conditions,
+                                                          split_engine.MODE_MULTI_FILES, str(out))
+    assert status == split_incremental.STATUS_APPENDED
+    assert [os.path.basename(p) for p in written] == ['B_1.xlsx']
+    outputs = read_outputs([str(out / 'B.xlsx'), str(out / 'B_1.xlsx')])
+    assert outputs['B']['k'].tolist() == ['a1', 'a2']
+    assert outputs['B_1']['k'].tolist() == ['z1', 'z2']
+
+
+def test_changed_rows_trigger_full_split(tmp_path):
+    df = make_frame(100)
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': df})
+    output = str(tmp_path / 'out.xlsx')
+    split_incremental.incremental_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_SINGLE_FILE, output)
+
+    changed = df.copy()
+    changed.loc[0, '评语'] = '有进步'
+    rewrite(source, changed)
+    status, _ = split_incremental.incremental_split(source, 'Sheet1', CONDITIONS,
+                                                    split_engine.MODE_SINGLE_FILE, output)
+    assert status == split_incremental.STATUS_FULL
+    assert split_incremental.load_manifest(split_incremental.manifest_path(
+        split_engine.MODE_SINGLE_FILE, output))['source']['rows'] == 100
+
+
+def split_then_grow(tmp_path, rows=120):
+    """A multi-file incremental split of the first rows of a sheet, then the
+    source grown to `rows`. Returns (source, output folder, full sheet)."""
+    df = make_frame(rows)
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': df.iloc[:rows - 40]})
+    out = tmp_path / 'out'
+    out.mkdir()
+    split_incremental.incremental_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES, str(out))
+    rewrite(source, df)
+    return source, out, df
+
+
+def assert_matches_full_split(source, out, tmp_path):
+    fresh = tmp_path / 'fresh'
+    fresh.mkdir()
+    expected = read_outputs(split_engine.run_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                                   str(fresh)))
+    outputs = read_outputs(str(out / name) for name in os.listdir(out) if not name.startswith('.'))
+    assert sorted(outputs) == sorted(expected)
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(plain(outputs[name]), plain(frame), check_dtype=False)
+
+
+def test_cancelled_append_appends_again_next_run(tmp_path):
+    source, out, _ = split_then_grow(tmp_path)
+    checks = []
+
+    def cancelled():
+        # Cancel while the outputs are being written
+        checks.append(1)
+        return len(checks) > len(CONDITIONS) + 1
+
+    with pytest.raises(split_engine.SplitCancelled):
+        split_incremental.incremental_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                            str(out), cancelled=cancelled)
+    status, _ = split_incremental.incremental_split(source, 'Sheet1', CONDITIONS,
+                                                    split_engine.MODE_MULTI_FILES, str(out))
+    assert status == split_incremental.STATUS_APPENDED
+    assert_matches_full_split(source, out, tmp_path)
+
+
+def test_append_failing_while_saving_splits_in_full_next_run(tmp_path, monkeypatch):
+    source, out, _ = split_then_grow(tmp_path)
+    saved = []
+
+    def close(book):
+        # The second output is locked (open in Excel)
+        if saved:
+            raise PermissionError(book.path)
+        saved.append(book.path)
+        original_close(book)
+
+    original_close = split_writers.XlsxAppendBook.close
+    monkeypatch.setattr(split_writers.XlsxAppendBook, 'close', close)
+    with pytest.raises(PermissionError):
+        split_incremental.incremental_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES, str(out))
+    monkeypatch.undo()
+
+    status, _ = split_incremental.incremental_split(source, 'Sheet1', CONDITIONS,
+                                                    split_engine.MODE_MULTI_FILES, str(out))
+    assert status == split_incremental.STATUS_FULL
+    assert_matches_full_split(source, out, tmp_path)
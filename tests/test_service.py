@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import split_service
+from reference import make_frame, write_workbook
+
+CONDITIONS = [{'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 90}, 'output_name': '优秀'}]
+
+
+def spec(tmp_path, name='out.xlsx'):
+    source = tmp_path / 'src.xlsx'
+    if not source.exists():
+        write_workbook(source, {'Sheet1': make_frame(50)})
+    return {'source': str(source), 'output': str(tmp_path / name), 'conditions': CONDITIONS}
+
+
+def test_job_is_registered_before_it_is_queued(tmp_path, monkeypatch):
+    service = split_service.SplitService(workers=1)
+    registered = []
+    put = service._queue.put_nowait
+
+    def put_nowait(job):
+        # A started worker could take the job as soon as it is queued
+        registered.append(job.id in service._jobs)
+        put(job)
+
+    monkeypatch.setattr(service._queue, 'put_nowait', put_nowait)
+    service.submit(spec(tmp_path))
+    assert registered == [True]
+
+
+def test_full_queue_rejects_without_registering(tmp_path):
+    # Not started, so nothing takes jobs off the queue
+    service = split_service.SplitService(workers=1, queue_size=1)
+    first = service.submit(spec(tmp_path))
+    with pytest.raises(split_service.QueueFull):
+        service.submit(spec(tmp_path, 'second.xlsx'))
+    assert service.jobs() == [first]
+    assert service.metrics()['queued'] == 1
+
+
+def test_submitted_job_is_visible_until_it_finishes(tmp_path):
+    service = split_service.SplitService(workers=2)
+    service.start()
+    try:
+        jobs = [service.submit(spec(tmp_path, f"out{i}.xlsx")) for i in range(4)]
+        for job in jobs:
+            assert service.get(job.id) is job
+        deadline = time.time() + 60
+        while any(job.state not in split_service.FINISHED_STATES for job in jobs) and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        service.stop()
+    assert [job.state for job in jobs] == [split_service.STATE_SUCCEEDED] * 4, [job.error for job in jobs]
+    assert service.metrics()['jobs'][split_service.STATE_SUCCEEDED] == 4
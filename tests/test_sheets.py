@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import split_engine
+import split_writers
+from reference import baseline_split, plain, read_outputs, read_sheet, write_workbook
+
+CONDITIONS = [
+    {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 50}, 'output_name': '高分'},
+    {'col': '班级', 'type_id': 1, 'params': {'text': '1'}, 'output_name': '一班'},
+]
+
+
+def sheet_frame(rows, seed, score_max, classes):
+    """A sheet whose compacted dtypes differ from the other sheets': the
+    score range picks the integer width and `classes` the categories."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '班级': rng.choice(classes, rows),
+        '分数': rng.integers(0, score_max, rows),
+        '时长': np.round(rng.random(rows) * 10, 2),
+    })
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    return write_workbook(tmp_path_factory.mktemp('src') / 'sheets.xlsx', {
+        '一月': sheet_frame(120, 1, 100, ['1班', '2班']),
+        '二月': sheet_frame(150, 2, 5000, ['1班', '3班', '4班']),
+        '三月': sheet_frame(80, 3, 100, ['11班', '2班']),
+    })
+
+
+def combined_baseline(source):
+    sheets = [read_sheet(source, name) for name in split_engine.list_sheets(source)]
+    expected = {}
+    for df in sheets:
+        for name, positions in baseline_split(df, CONDITIONS):
+            expected.setdefault(name, []).append(df.iloc[positions])
+    return {name: pd.concat(parts) for name, parts in expected.items()}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('fmt', [split_writers.FORMAT_PARQUET, split_writers.FORMAT_FEATHER,
+                                 split_writers.FORMAT_CSV])
+def test_combined_sheets_to_columnar_formats(source, tmp_path, fmt, workers):
+    if fmt != split_writers.FORMAT_CSV:
+        pytest.importorskip('pyarrow')
+    written = split_engine.split_sheets(source, None, CONDITIONS, split_engine.MODE_MULTI_FILES, str(tmp_path),
+                                        workers=workers, fmt=fmt)
+    outputs = read_outputs(written)
+    expected = combined_baseline(source)
+    assert sorted(outputs) == sorted(expected)
+    for name, df in expected.items():
+        pd.testing.assert_frame_equal(plain(outputs[name]), plain(df), check_dtype=False)
+
+
+def test_separate_sheets_get_their_own_outputs(source, tmp_path):
+    written = split_engine.split_sheets(source, ['一月', '二月'], CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                        str(tmp_path), combine=split_engine.SHEETS_SEPARATE)
+    outputs = read_outputs(written)
+    for sheet in ['一月', '二月']:
+        df = read_sheet(source, sheet)
+        for name, positions in baseline_split(df, CONDITIONS):
+            pd.testing.assert_frame_equal(plain(outputs[f"{sheet}_{name}"]), plain(df.iloc[positions]),
+                                          check_dtype=False)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_combined_sheets_keep_rules_with_the_same_name_apart(tmp_path, workers):
+    # The second rule alone matches on the first sheet; its rows must not
+    # be merged into the first rule's output
+    source = write_workbook(tmp_path / 'src.xlsx', {'s1': pd.DataFrame({'k': ['z1']}),
+                                                    's2': pd.DataFrame({'k': ['a2', 'z2']})})
+    conditions = [
+        {'col': 'k', 'type_id': 1, 'params': {'text': 'a'}, 'output_name': 'B'},
+        {'col': 'k', 'type_id': 1, 'params': {'text': 'z'}, 'output_name': 'B'},
+    ]
+    out = tmp_path / 'out'
+    out.mkdir()
+    written = split_engine.split_sheets(source, None, conditions, split_engine.MODE_MULTI_FILES, str(out),
+                                        workers=workers)
+    assert sorted(frame['k'].tolist() for frame in read_outputs(written).values()) == [['a2'], ['z1', 'z2']]
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+import split_engine
+from reference import make_frame, plain, read_outputs, read_sheet, write_workbook
+
+CONDITIONS = [
+    {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 80}, 'output_name': '高分'},
+    {'col': '评语', 'type_id': 3, 'params': {}, 'output_name': ''},
+    {'col': '评语', 'type_id': 1, 'params': {'text': '进步'}, 'output_name': '进步'},
+    {'col': '班级', 'type_id': 1, 'params': {'text': 'A'}, 'output_name': '高分'},
+]
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    return write_workbook(tmp_path_factory.mktemp('src') / 'src.xlsx', {'Sheet1': make_frame(150)})
+
+
+@pytest.mark.parametrize('routing', [split_engine.ROUTING_ALL, split_engine.ROUTING_FIRST])
+def test_stream_split_matches_run_split(source, tmp_path, routing):
+    (tmp_path / 'stream').mkdir()
+    (tmp_path / 'full').mkdir()
+    streamed = split_engine.stream_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                         str(tmp_path / 'stream'), chunk_rows=7, routing=routing)
+    loaded = split_engine.run_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES,
+                                    str(tmp_path / 'full'), routing=routing)
+    expected = read_outputs(loaded)
+    outputs = read_outputs(streamed)
+    assert sorted(outputs) == sorted(expected)
+    for name, df in expected.items():
+        pd.testing.assert_frame_equal(plain(outputs[name]), plain(df), check_dtype=False)
+
+
+def test_stream_split_exclusive_routing_with_distinct_rule(tmp_path):
+    # The values a distinct-value rule yields differ between chunks, so each
+    # chunk's outputs must find the file of the same rule and value
+    df = pd.DataFrame({'k': ['x', 'y', 'x', 'z', 'y', 'y', 'x', 'w'], 'n': range(8)})
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': df})
+    conditions = [
+        {'col': 'n', 'type_id': 0, 'params': {'op': '==', 'v1': 2}, 'output_name': 'two'},
+        {'col': 'k', 'type_id': 3, 'params': {}, 'output_name': ''},
+    ]
+    (tmp_path / 'out').mkdir()
+    written = split_engine.stream_split(source, 'Sheet1', conditions, split_engine.MODE_MULTI_FILES,
+                                        str(tmp_path / 'out'), chunk_rows=4,
+                                        routing=split_engine.ROUTING_FIRST)
+    outputs = read_outputs(written)
+    assert sorted(outputs) == ['two', 'w', 'x', 'y', 'z']
+    assert outputs['two']['n'].tolist() == [2]
+    assert outputs['x']['n'].tolist() == [0, 6]
+    assert outputs['y']['n'].tolist() == [1, 4, 5]
+    assert outputs['z']['n'].tolist() == [3]
+    assert outputs['w']['n'].tolist() == [7]
+
+
+def test_stream_split_single_file(source, tmp_path):
+    output = str(tmp_path / 'out.xlsx')
+    split_engine.stream_split(source, 'Sheet1', CONDITIONS[:1], split_engine.MODE_SINGLE_FILE, output,
+                              chunk_rows=7)
+    df = read_sheet(source)
+    scores = pd.to_numeric(df['分数'], errors='coerce')
+    pd.testing.assert_frame_equal(plain(read_sheet(output, '高分')), plain(df[scores >= 80]),
+                                  check_dtype=False)
+
+
+def test_stream_split_sees_blank_cells_like_the_full_parse(tmp_path):
+    # Whole chunks of the text columns are blank, and 空 is blank throughout
+    df = pd.DataFrame({
+        'n': range(12),
+        '空': [None] * 12,
+        '文本': ['a', 'b', 'Nora', None, None, None, 'banana', 'c', None, 'd', 'e', 'f'],
+        '混合': [1, 'x', None, None, None, None, 2, 'y', None, 3, 'n', None],
+    })
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': df})
+    conditions = [{'col': col, 'type_id': 1, 'params': {'text': text}, 'output_name': f"{col}_{text}"}
+                  for col in ('空', '文本', '混合') for text in ('None', 'nan', 'n')]
+    conditions += [{'col': col, 'type_id': 2, 'params': {'pattern': '^N'}, 'output_name': f"{col}_N"}
+                   for col in ('空', '文本', '混合')]
+
+    for chunk in split_engine.iter_chunks(source, 'Sheet1', 4):
+        assert not chunk.map(lambda v: v is None).any().any()
+    (tmp_path / 'stream').mkdir()
+    (tmp_path / 'full').mkdir()
+    streamed = read_outputs(split_engine.stream_split(source, 'Sheet1', conditions, split_engine.MODE_MULTI_FILES,
+                                                      str(tmp_path / 'stream'), chunk_rows=4))
+    loaded = read_outputs(split_engine.run_split(source, 'Sheet1', conditions, split_engine.MODE_MULTI_FILES,
+                                                 str(tmp_path / 'full'), dtypes=split_engine.split_dtypes.DTYPES_OBJECT))
+    assert {name: frame['n'].tolist() for name, frame in streamed.items()} == \
+        {name: frame['n'].tolist() for name, frame in loaded.items()}
@@ -0,0 +1,71 @@
+import json
+import time
+
+import split_engine
+import split_trace
+from reference import make_frame, write_workbook
+
+CONDITIONS = [
+    {'col': '分数', 'type_id': 0, 'params': {'op': '>=', 'v1': 90}, 'output_name': '优秀'},
+    {'col': '评语', 'type_id': 1, 'params': {'text': '缺勤'}, 'output_name': '缺勤'},
+]
+
+
+def test_span_records_time_and_rows():
+    tracer = split_trace.Tracer()
+    with split_trace.span(tracer, 'parse', 'read', sheet='Sheet1') as span:
+        time.sleep(0.01)
+        span['rows'] = 42
+    with split_trace.span(None, 'ignored', 'read') as span:
+        span['rows'] = 1
+    assert len(tracer.spans) == 1
+    s = tracer.spans[0]
+    assert (s['name'], s['cat'], s['rows'], s['args']) == ('parse', 'read', 42, {'sheet': 'Sheet1'})
+    assert s['seconds'] >= 0.01 and s['start'] >= 0
+
+
+def test_add_records_phases_before_the_tracer():
+    origin = time.perf_counter()
+    time.sleep(0.01)
+    tracer = split_trace.Tracer(origin)
+    tracer.add('import', 'startup', origin, origin + 0.005, module='pandas')
+    s = tracer.spans[0]
+    assert s['start'] == 0 and abs(s['seconds'] - 0.005) < 1e-9 and s['args'] == {'module': 'pandas'}
+    assert tracer.elapsed() >= 0.01
+
+
+def test_summary_adds_up_same_named_phases():
+    tracer = split_trace.Tracer()
+    for rows in (10, 20):
+        with tracer.span('parse chunk', 'read') as span:
+            span['rows'] = rows
+    with tracer.span('write', 'write'):
+        pass
+    lines = tracer.summary()
+    assert lines[0].startswith("总耗时")
+    assert any(line.startswith("parse chunk x2:") and "30 行" in line for line in lines[1:])
+
+
+def test_run_split_trace_saves_json_and_chrome(tmp_path):
+    source = write_workbook(tmp_path / 'src.xlsx', {'Sheet1': make_frame(200)})
+    out = tmp_path / 'out'
+    out.mkdir()
+    tracer = split_trace.Tracer()
+    split_engine.run_split(source, 'Sheet1', CONDITIONS, split_engine.MODE_MULTI_FILES, str(out), tracer=tracer)
+    cats = {s['cat'] for s in tracer.spans}
+    assert {'read', 'mask', 'write'} <= cats
+
+    tracer.save(str(tmp_path / 'run.json'))
+    data = json.loads((tmp_path / 'run.json').read_text(encoding='utf-8'))
+    assert set(data) == {'started', 'seconds', 'peak_rss', 'spans'}
+    starts = [s['start'] for s in data['spans']]
+    assert starts == sorted(starts) and len(starts) == len(tracer.spans)
+
+    tracer.save(str(tmp_path / 'run.trace.json'), split_trace.FORMAT_CHROME)
+    chrome = json.loads((tmp_path / 'run.trace.json').read_text(encoding='utf-8'))
+    events = chrome['traceEvents']
+    assert len(events) == len(tracer.spans)
+    for event, s in zip(events, tracer.spans):
+        assert event['ph'] == 'X' and event['name'] == s['name'] and event['cat'] == s['cat']
+        assert event['ts'] == round(s['start'] * 1e6) and event['dur'] == round(s['seconds'] * 1e6)
+        assert event['args']['rows'] == s['rows']
@@ -0,0 +1,131 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import split_writers
+from reference import plain, read_output, read_sheet
+
+
+def sample(start=0, rows=5):
+    return pd.DataFrame({
+        '学号': [f"S{i:04d}" for i in range(start, start + rows)],
+        '分数': np.arange(start, start + rows, dtype=np.int64) * 10,
+        '时长': [1.5, np.nan, 2.25, 3.0, np.nan][:rows],
+        '日期': pd.Timestamp('2024-03-01 08:30:00') + pd.to_timedelta(np.arange(rows), unit='D'),
+    })
+
+
+def write(book, name, frames):
+    ws = book.add_sheet(name, frames[0].columns)
+    for df in frames:
+        book.append(ws, df)
+    return ws
+
+
+@pytest.mark.parametrize('backend', split_writers.available_backends())
+def test_xlsx_backends_write_appended_rows(tmp_path, backend):
+    path = str(tmp_path / 'out.xlsx')
+    book = split_writers.open_book(path, backend)
+    first = write(book, '优秀', [sample(0), sample(5)])
+    # Invalid characters are replaced and names Excel sees as equal are numbered
+    second = write(book, 'a/b', [sample(10)])
+    third = write(book, '优秀', [sample(15, 2)])
+    book.close()
+
+    assert (first, second, third) == ('优秀', 'a_b', '优秀_2')
+    sheets = pd.read_excel(path, sheet_name=None, engine='calamine')
+    assert list(sheets) == ['优秀', 'a_b', '优秀_2']
+    expected = pd.concat([sample(0), sample(5)])
+    pd.testing.assert_frame_equal(plain(sheets['优秀']), plain(expected), check_dtype=False)
+    assert sheets['优秀']['日期'].iloc[0] == datetime.datetime(2024, 3, 1, 8, 30)
+    assert sheets['优秀']['时长'].isna().sum() == 4
+
+
+@pytest.mark.parametrize('backend', split_writers.available_backends())
+def test_xlsx_abort_removes_the_file(tmp_path, backend):
+    path = str(tmp_path / 'out.xlsx')
+    book = split_writers.open_book(path, backend)
+    write(book, 'Sheet', [sample()])
+    book.abort()
+    assert not os.path.exists(path)
+
+
+def single_table_formats():
+    formats = [split_writers.FORMAT_CSV]
+    if split_writers.pa is not None:
+        formats += [split_writers.FORMAT_PARQUET, split_writers.FORMAT_FEATHER]
+    return formats
+
+
+@pytest.mark.parametrize('fmt', single_table_formats())
+def test_single_table_formats_write_appended_rows(tmp_path, fmt):
+    path = str(tmp_path / f"out{split_writers.FORMAT_EXTENSIONS[fmt]}")
+    book = split_writers.open_book(path, fmt=fmt)
+    write(book, '优秀', [sample(0), sample(5)])
+    with pytest.raises(ValueError):
+        book.add_sheet('第二张', sample().columns)
+    book.close()
+
+    got = read_output(path)
+    expected = pd.concat([sample(0), sample(5)])
+    if fmt == split_writers.FORMAT_CSV:
+        got['日期'] = pd.to_datetime(got['日期'])
+    pd.testing.assert_frame_equal(plain(got), plain(expected), check_dtype=False)
+
+
+@pytest.mark.parametrize('fmt', single_table_formats())
+def test_single_table_formats_without_rows_keep_the_header(tmp_path, fmt):
+    path = str(tmp_path / f"out{split_writers.FORMAT_EXTENSIONS[fmt]}")
+    book = split_writers.open_book(path, fmt=fmt)
+    book.add_sheet('空', ['a', 'b'])
+    book.close()
+    got = read_output(path)
+    assert list(got.columns) == ['a', 'b'] and len(got) == 0
+
+
+@pytest.mark.parametrize('fmt', [split_writers.FORMAT_PARQUET, split_writers.FORMAT_FEATHER])
+def test_arrow_formats_store_mixed_columns_as_text(tmp_path, fmt):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / f"out{split_writers.FORMAT_EXTENSIONS[fmt]}")
+    book = split_writers.open_book(path, fmt=fmt, compression='zstd')
+    write(book, 'Sheet', [pd.DataFrame({'分数': pd.Series([90, "缺考", None], dtype=object)}),
+                          pd.DataFrame({'分数': pd.Series([None, None], dtype=object)})])
+    book.close()
+    got = read_output(path)['分数']
+    assert got[:2].tolist() == ['90', '缺考'] and got[2:].isna().all()
+
+
+def test_open_book_rejects_unknown_names(tmp_path):
+    with pytest.raises(ValueError):
+        split_writers.open_book(str(tmp_path / 'out.xlsx'), 'nope')
+    with pytest.raises(ValueError):
+        split_writers.open_book(str(tmp_path / 'out.txt'), fmt='txt')
+
+
+def test_append_book_adds_rows_to_xlsx(tmp_path):
+    path = str(tmp_path / 'out.xlsx')
+    book = split_writers.open_book(path, split_writers.WRITER_OPENPYXL)
+    write(book, '优秀', [sample(0)])
+    book.close()
+
+    book = split_writers.append_book(path)
+    book.append(book.sheet('优秀'), sample(5))
+    book.close()
+    pd.testing.assert_frame_equal(plain(read_sheet(path)), plain(pd.concat([sample(0), sample(5)])),
+                                  check_dtype=False)
+
+
+def test_csv_append_abort_truncates_back(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    book = split_writers.open_book(path, fmt=split_writers.FORMAT_CSV)
+    write(book, '优秀', [sample(0)])
+    book.close()
+    before = open(path, 'rb').read()
+
+    book = split_writers.append_book(path, split_writers.FORMAT_CSV)
+    book.append(book.sheet('优秀'), sample(5))
+    book.abort()
+    assert open(path, 'rb').read() == before
@@ -1,35 +1,120 @@
+"""
+Excel条件拆分器 - 测试数据生成
+
+Without arguments this writes the small 50-row 测试数据.xlsx used in the
+README. The options scale it up for benchmarking (see split_bench.py):
+
+    python 测试数据生成.py --rows 1000000 --cols 12 --cardinality 50 \\
+        --sheets 2 --null-rate 0.05 --mixed-rate 0.01 -o big.xlsx
+
+Columns are 姓名, 分数, 班级, 学号, 评语 followed by extra columns that
+alternate between numbers (数值N) and text (文本N). `cardinality` is the
+number of distinct values in 班级 and the extra text columns.
+`null_rate` blanks that fraction of cells outside 姓名/学号, and
+`mixed_rate` replaces that fraction of 分数 with text ("缺考"), so the
+column mixes numbers and strings like hand-maintained sheets do.
+"""
+import argparse
+import sys
+
+import numpy as np
 import pandas as pd
-import random
-
-def generate_data():
-    # Create dummy data
-    names = [f"学生{i}" for i in range(1, 51)]
-    scores = [random.randint(40, 100) for _ in range(50)]
-    classes = [random.choice(['一班', '二班', '三班']) for _ in range(50)]
-    ids = [f"2023{str(i).zfill(3)}" for i in range(1, 51)] # Regex friendly: ^2023\d{3}$
-    comments = [
-        random.choice([
-            "表现优秀，继续保持", 
-            "基础扎实，但需细心", 
-            "需要加强练习", 
-            "进步很大", 
-            "缺勤较多"
-        ]) for _ in range(50)
-    ]
+
+from split_writers import open_book
+
+BASE_COLUMNS = ["姓名", "分数", "班级", "学号", "评语"]
+COMMENTS = [
+    "表现优秀，继续保持",
+    "基础扎实，但需细心",
+    "需要加强练习",
+    "进步很大",
+    "缺勤较多",
+]
+CHINESE_NUMERALS = "一二三四五六七八九十"
+MIXED_VALUE = "缺考"
+MAX_SHEET_ROWS = 1048575  # Excel's limit minus the header row
+WRITE_CHUNK_ROWS = 100000
+
+
+def class_names(cardinality):
+    return [f"{CHINESE_NUMERALS[i]}班" if i < len(CHINESE_NUMERALS) else f"{i + 1}班"
+            for i in range(cardinality)]
+
+
+def make_frame(rows=50, cols=5, cardinality=3, null_rate=0.0, mixed_rate=0.0, seed=None):
+    """Build one sheet of synthetic data as a DataFrame."""
+    rng = np.random.default_rng(seed)
+    n = np.arange(1, rows + 1)
+    width = max(3, len(str(rows)))
 
     data = {
-        "姓名": names,
-        "分数": scores,
-        "班级": classes,
-        "学号": ids,
-        "评语": comments
+        "姓名": [f"学生{i}" for i in n],
+        "分数": rng.integers(40, 101, rows),
+        "班级": np.array(class_names(cardinality), dtype=object)[rng.integers(0, cardinality, rows)],
+        # Regex friendly: ^2023\d+$, all the same width (^2023\d{3}$ up to 999 rows)
+        "学号": [f"2023{i:0{width}d}" for i in n],
+        "评语": np.array(COMMENTS, dtype=object)[rng.integers(0, len(COMMENTS), rows)],
     }
-
+    categories = np.array([f"类别{j}" for j in range(cardinality)], dtype=object)
+    for k in range(max(cols - len(BASE_COLUMNS), 0)):
+        if k % 2 == 0:
+            data[f"数值{k // 2 + 1}"] = np.round(rng.normal(1000, 250, rows), 2)
+        else:
+            data[f"文本{k // 2 + 1}"] = categories[rng.integers(0, cardinality, rows)]
     df = pd.DataFrame(data)
-    
-    output_file = "测试数据.xlsx"
-    df.to_excel(output_file, index=False)
+
+    if mixed_rate > 0:
+        scores = df["分数"].astype(object)
+        scores[rng.random(rows) < mixed_rate] = MIXED_VALUE
+        df["分数"] = scores
+    if null_rate > 0:
+        for col in df.columns:
+            if col in ("姓名", "学号"):
+                continue
+            blank = rng.random(rows) < null_rate
+            if blank.any():
+                values = df[col].astype(object)
+                values[blank] = None
+                df[col] = values
+    return df
+
+
+def generate_data(output_file="测试数据.xlsx", rows=50, cols=5, cardinality=3, sheets=1,
+                  null_rate=0.0, mixed_rate=0.0, seed=None):
+    if rows > MAX_SHEET_ROWS:
+        raise ValueError(f"每个工作表最多 {MAX_SHEET_ROWS} 行")
+    book = open_book(output_file)
+    try:
+        for s in range(sheets):
+            sheet_seed = None if seed is None else seed + s
+            df = make_frame(rows, cols, cardinality, null_rate, mixed_rate, sheet_seed)
+            ws = book.add_sheet(f"Sheet{s + 1}", df.columns)
+            for start in range(0, len(df), WRITE_CHUNK_ROWS):
+                book.append(ws, df.iloc[start:start + WRITE_CHUNK_ROWS])
+    except BaseException:
+        book.abort()
+        raise
+    book.close()
     print(f"已生成测试文件: {output_file}")
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成Excel条件拆分器的测试数据")
+    parser.add_argument('-o', '--output', default="测试数据.xlsx", help="输出文件")
+    parser.add_argument('--rows', type=int, default=50, help="每个工作表的行数")
+    parser.add_argument('--cols', type=int, default=5, help="列数 (至少5列)")
+    parser.add_argument('--cardinality', type=int, default=3, help="班级及文本列的不同值个数")
+    parser.add_argument('--sheets', type=int, default=1, help="工作表个数")
+    parser.add_argument('--null-rate', type=float, default=0.0, help="空值比例")
+    parser.add_argument('--mixed-rate', type=float, default=0.0, help="分数列中文本值的比例")
+    parser.add_argument('--seed', type=int, help="随机种子")
+    args = parser.parse_args(argv)
+    if args.cols < len(BASE_COLUMNS):
+        parser.error(f"--cols 至少为 {len(BASE_COLUMNS)} ({'、'.join(BASE_COLUMNS)})")
+    generate_data(args.output, args.rows, args.cols, args.cardinality, args.sheets,
+                  args.null_rate, args.mixed_rate, args.seed)
+    return 0
+
+
 if __name__ == "__main__":
-    generate_data()
+    sys.exit(main())